@@ -1,5 +1,11 @@
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.axes import Axes
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
 import seaborn as sns  # type: ignore
 from my_statistics import Statistics
 import pandas as pd
@@ -7,9 +13,92 @@ import textwrap
 from obstacles_and_barriers import Barrier2D
 from portal_gate import PortalGate
 
+# The panels of a report, by the file name they are rendered to, with the plot method drawing them, its arguments
+# and the size of their own figure
+PANELS = {
+    'single_simulation': ('plot_single_simulation', {}, (8, 6)),
+    'average_distance_from_origin': ('plot_average_distance_from_origin', {}, None),
+    'distances_from_x_axis': ('plot_distances_from_axis', {'axis': 'X'}, None),
+    'distances_from_y_axis': ('plot_distances_from_axis', {'axis': 'Y'}, None),
+    'escape_radius_10': ('plot_escape_radius_10', {}, (10, 6)),
+    'average_passed_y': ('plot_average_passed_y', {}, None),
+    'lead_counts': ('plot_lead_counts', {}, (10, 6)),
+}
+# The default number of buckets a plotted line is decimated to, about the width in pixels of a panel. Every bucket
+# keeps at most six points, so the drawing time does not grow with the number of steps
+PIXEL_BUDGET = 2000
+# The number of panel columns of the dashboard and density figures, and the size of each of their panels
+GRID_COLUMNS = 3
+GRID_PANEL_SIZE = (8, 6)
+
+
+class StatisticsSnapshot:
+    """
+    The values a Graph plots, taken from a Statistics object, so they can be shipped to worker processes rendering
+    figures without the trajectories of every simulation.
+
+    Attributes:
+        walker_names (List[str]): The names of the walkers.
+        get_total_simulations (int): The number of simulations.
+    """
+
+    def __init__(self, statistics: Statistics):
+        """
+        Take the values a Graph plots from the statistics.
+
+        Args:
+            statistics (Statistics): The statistics object.
+        """
+        self.walker_names = list(statistics.walker_names)
+        self.get_total_simulations = statistics.get_total_simulations
+        self.__locations = {walker_name: statistics.simulation_locations(walker_name)
+                            for walker_name in self.walker_names}
+        self.__average_distance_from_origin = statistics.calculate_average_distance_from_origin()
+        self.__distances_from_axis = {axis: statistics.calculate_distances_from_axis(axis) for axis in ('X', 'Y')}
+        self.__escape_radius_10 = statistics.calculate_escape_radius_10()
+        self.__average_passed_y = statistics.calculate_average_passed_y()
+        self.__average_leads = statistics.calculate_average_leads()
+
+    def simulation_locations(self, walker_name: str):
+        """
+        Return the locations of a walker in the first simulation.
+        """
+        return self.__locations[walker_name]
+
+    def calculate_average_distance_from_origin(self):
+        """
+        Return the average distance of every walker from the origin after every step.
+        """
+        return self.__average_distance_from_origin
+
+    def calculate_distances_from_axis(self, axis: str = 'X'):
+        """
+        Return the average distance of every walker from an axis after every step.
+        """
+        return self.__distances_from_axis[axis]
+
+    def calculate_escape_radius_10(self):
+        """
+        Return the escape radius 10 statistics of every walker.
+        """
+        return self.__escape_radius_10
+
+    def calculate_average_passed_y(self):
+        """
+        Return the average number of y-axis crossings of every walker up to every step.
+        """
+        return self.__average_passed_y
+
+    def calculate_average_leads(self):
+        """
+        Return the average lead count of every walker.
+        """
+        return self.__average_leads
+
 
 class Graph:
-    def __init__(self, statistics: Statistics, barriers: Dict[str, Barrier2D], portal_gates: Dict[str, PortalGate]):
+    def __init__(self, statistics: Statistics, barriers: Dict[str, Barrier2D], portal_gates: Dict[str, PortalGate],
+                 pixel_budget: int = PIXEL_BUDGET):
         """
         Initialize the Graph class.
 
@@ -17,17 +106,78 @@ class Graph:
             statistics (Statistics): The statistics object.
             barriers (Dict): The barrier's dictionary.
             portal_gates (Dict): The portal gates dictionary.
+            pixel_budget (int): The number of buckets every plotted line is decimated to. Default is PIXEL_BUDGET.
         """
         self.statistics = statistics
         self.barriers = barriers
         self.portal_gates = portal_gates
+        self.pixel_budget = pixel_budget
         # Set the default seaborn theme
         sns.set_theme()
 
-    def plot_barriers(self):
+    @staticmethod
+    def _axes(ax: Optional[Axes], figsize: Optional[Tuple[int, int]] = None) -> Tuple[Axes, bool]:
+        """
+        Return the axes to plot on, opening a new interactive figure if none are given.
+
+        Args:
+            ax (Optional[Axes]): The axes to plot on, None to open a new figure.
+            figsize (Optional[Tuple[int, int]]): The size of the new figure. Default is the matplotlib default.
+
+        Returns:
+            Tuple[Axes, bool]: The axes, and whether a new figure was opened, which the plot then shows.
+        """
+        if ax is not None:
+            return ax, False
+        plt.figure(figsize=figsize)
+        return plt.gca(), True
+
+    @staticmethod
+    def decimate(points: np.ndarray, buckets: int) -> np.ndarray:
+        """
+        Reduce a line to a bounded number of points while preserving its shape.
+
+        The line is split into buckets of consecutive points, and every bucket keeps its first and last points and
+        the points where each coordinate is smallest and largest, in their original order. The extremes of every
+        coordinate within a bucket survive, but the segments between the kept points can differ from the full line.
+
+        Args:
+            points (np.ndarray): The points of shape (n, dimensions) of the line.
+            buckets (int): The number of buckets.
+
+        Returns:
+            np.ndarray: The kept points, all of them if the line has no more than two points per bucket.
+        """
+        num_points, dimensions = points.shape
+        if num_points <= 2 * buckets:
+            return points
+        bucket_size = -(-num_points // buckets)
+        num_buckets = -(-num_points // bucket_size)
+        # Pad the last bucket with the last point, so the buckets fit a (buckets, bucket_size) grid
+        padded = np.concatenate((points, np.repeat(points[-1:], num_buckets * bucket_size - num_points, axis=0)))
+        grid = padded.reshape(num_buckets, bucket_size, dimensions)
+        kept = np.concatenate((np.zeros((num_buckets, 1), dtype=np.int64),
+                               np.full((num_buckets, 1), bucket_size - 1),
+                               grid.argmin(axis=1), grid.argmax(axis=1)), axis=1)
+        indices = np.minimum(kept + bucket_size * np.arange(num_buckets)[:, np.newaxis], num_points - 1)
+        return points[np.unique(indices)]
+
+    def __plot_series(self, ax: Axes, values: Sequence[float], label: str):
+        """
+        Plot a per-step series as a line, decimated to the pixel budget.
+        """
+        values = np.asarray(values, dtype=float)
+        series = self.decimate(np.column_stack((np.arange(len(values)), values)), self.pixel_budget)
+        sns.lineplot(x=series[:, 0], y=series[:, 1], label=label, ax=ax)
+
+    def plot_barriers(self, ax: Optional[Axes] = None):
         """
         Plot barriers with a solid color fill.
+
+        Args:
+            ax (Optional[Axes]): The axes to plot on. Default is the current axes.
         """
+        ax = ax if ax is not None else plt.gca()
         for barrier in self.barriers.values():
             # Extract barrier coordinates
             min_x, min_y, max_x, max_y = barrier.bounds.bounds()
@@ -37,13 +187,17 @@ class Graph:
             height = max_y - min_y
 
             # Plot the barrier rectangle
-            plt.fill([min_x, min_x + width, min_x + width, min_x], [min_y, min_y, min_y + height, min_y + height],
-                     color='red', alpha=0.5)
+            ax.fill([min_x, min_x + width, min_x + width, min_x], [min_y, min_y, min_y + height, min_y + height],
+                    color='red', alpha=0.5)
 
-    def plot_portal_gates(self):
+    def plot_portal_gates(self, ax: Optional[Axes] = None):
         """
         Plot portal gates with a solid color fill and an arrow.
+
+        Args:
+            ax (Optional[Axes]): The axes to plot on. Default is the current axes.
         """
+        ax = ax if ax is not None else plt.gca()
         for portal_gate in self.portal_gates.values():
             # Extract portal gate coordinates
             min_x, min_y, max_x, max_y = portal_gate.bounds.bounds()
@@ -53,8 +207,8 @@ class Graph:
             height = max_y - min_y
 
             # Plot the portal gate rectangle
-            plt.fill([min_x, min_x + width, min_x + width, min_x], [min_y, min_y, min_y + height, min_y + height],
-                     color='green', alpha=0.5)
+            ax.fill([min_x, min_x + width, min_x + width, min_x], [min_y, min_y, min_y + height, min_y + height],
+                    color='green', alpha=0.5)
 
             # Extract destination coordinates
             dest_x, dest_y, _ = portal_gate.destination
@@ -64,66 +218,78 @@ class Graph:
             center_y = (max_y + min_y) / 2
 
             # Plot the arrow from the portal gate to its destination
-            plt.arrow(center_x, center_y, dest_x - center_x, dest_y - center_y, color='green',
-                      length_includes_head=True, head_width=0.5)
+            ax.arrow(center_x, center_y, dest_x - center_x, dest_y - center_y, color='green',
+                     length_includes_head=True, head_width=0.5)
 
-    def plot_single_simulation(self):
+    def plot_single_simulation(self, ax: Optional[Axes] = None):
         """
         Plot the first simulation that the user ran.
-        """
-        # Get the first simulation name
-        first_simulation_name = list(next(iter(self.statistics.simulations.values())).keys())[0]
 
-        plt.figure(figsize=(8, 6))
-        for walker_name, walker_data in self.statistics.simulations.items():
-            if walker_name not in ['barriers', 'portal_gates']:
-                first_simulation_walker_data = walker_data[first_simulation_name]
-                walker_locations = first_simulation_walker_data['locations']
-                # Plotting the X and Y coordinates by elements in first column being X and second column Y
-                plt.plot(walker_locations[:, 0], walker_locations[:, 1], label=walker_name)
+        Args:
+            ax (Optional[Axes]): The axes to plot on. Default opens a new figure and shows it.
+        """
+        ax, show = self._axes(ax, figsize=(8, 6))
+        for walker_name in self.statistics.walker_names:
+            # Get the locations of the walker in the first simulation, decimated to the pixel budget
+            walker_locations = self.decimate(self.statistics.simulation_locations(walker_name)[:, :2],
+                                             self.pixel_budget)
+            # Plotting the X and Y coordinates by elements in first column being X and second column Y
+            ax.plot(walker_locations[:, 0], walker_locations[:, 1], label=walker_name)
 
         # Call the plot_barriers function
-        self.plot_barriers()
+        self.plot_barriers(ax)
 
         # Call the plot_portal_gates function
-        self.plot_portal_gates()
+        self.plot_portal_gates(ax)
 
-        plt.legend()
-        plt.title('Walker Positions (First Simulation)')
-        plt.xlabel('X Position')
-        plt.ylabel('Y Position')
-        plt.show()
+        ax.legend()
+        ax.set_title('Walker Positions (First Simulation)')
+        ax.set_xlabel('X Position')
+        ax.set_ylabel('Y Position')
+        if show:
+            plt.show()
 
-    def plot_average_distance_from_origin(self):
+    def plot_average_distance_from_origin(self, ax: Optional[Axes] = None):
         """
         Plot the average distance from origin.
+
+        Args:
+            ax (Optional[Axes]): The axes to plot on. Default opens a new figure and shows it.
         """
+        ax, show = self._axes(ax)
         for walker_name, average_distance in self.statistics.calculate_average_distance_from_origin().items():
-            sns.lineplot(data=average_distance, label=walker_name)
-        plt.legend()
-        plt.title('Average Distance From Origin')
-        plt.xlabel('Number of Steps')
-        plt.ylabel('Distance from Origin')
-        plt.show()
+            self.__plot_series(ax, average_distance, walker_name)
+        ax.legend()
+        ax.set_title('Average Distance From Origin')
+        ax.set_xlabel('Number of Steps')
+        ax.set_ylabel('Distance from Origin')
+        if show:
+            plt.show()
 
-    def plot_distances_from_axis(self, axis='X'):
+    def plot_distances_from_axis(self, axis='X', ax: Optional[Axes] = None):
         """
         Plot the distances from the specified axis.
 
         Args:
             axis (str): The axis to calculate distances from. Default is 'X'.
+            ax (Optional[Axes]): The axes to plot on. Default opens a new figure and shows it.
         """
+        ax, show = self._axes(ax)
         for walker_name, distances in self.statistics.calculate_distances_from_axis(axis).items():
-            sns.lineplot(data=distances, label=walker_name)
-        plt.legend()
-        plt.title(f'Distances From {axis} Axis')
-        plt.xlabel('Number of Steps')
-        plt.ylabel(f'Distance from {axis} Axis')
-        plt.show()
+            self.__plot_series(ax, distances, walker_name)
+        ax.legend()
+        ax.set_title(f'Distances From {axis} Axis')
+        ax.set_xlabel('Number of Steps')
+        ax.set_ylabel(f'Distance from {axis} Axis')
+        if show:
+            plt.show()
 
-    def plot_escape_radius_10(self):
+    def plot_escape_radius_10(self, ax: Optional[Axes] = None):
         """
         Plot the escape radius 10 statistics.
+
+        Args:
+            ax (Optional[Axes]): The axes to plot on. Default opens a new figure and shows it.
         """
         data = []
         for walker_name, stats in self.statistics.calculate_escape_radius_10().items():
@@ -132,41 +298,49 @@ class Graph:
 
         df = pd.DataFrame(data)
 
-        plt.figure(figsize=(10, 6))
-        sns.barplot(x='walker_name', y='average', data=df, hue='walker_name', dodge=False)
+        ax, show = self._axes(ax, figsize=(10, 6))
+        sns.barplot(x='walker_name', y='average', data=df, hue='walker_name', dodge=False, ax=ax)
 
         for i, row in df.iterrows():
-            plt.annotate(f"No escape: {row['zero_count']} / {self.statistics.get_total_simulations}",
-                         (i, row['average']),
-                         textcoords="offset points",
-                         xytext=(0, 10),
-                         ha='center')
-
-        plt.title('Escape Radius 10')
-        plt.ylabel('Amount of Steps')
-        plt.xlabel('Walker Names')
-        ax = plt.gca()
+            ax.annotate(f"No escape: {row['zero_count']} / {self.statistics.get_total_simulations}",
+                        (i, row['average']),
+                        textcoords="offset points",
+                        xytext=(0, 10),
+                        ha='center')
+
+        ax.set_title('Escape Radius 10')
+        ax.set_ylabel('Amount of Steps')
+        ax.set_xlabel('Walker Names')
         ax.set_xticks(range(len(df['walker_name'])))
         ax.set_xticklabels(['\n'.join(textwrap.wrap(name, 10)) for name in df['walker_name']])
 
-        plt.tight_layout()
-        plt.show()
+        if show:
+            plt.tight_layout()
+            plt.show()
 
-    def plot_average_passed_y(self):
+    def plot_average_passed_y(self, ax: Optional[Axes] = None):
         """
         Plot the average amount of times each walker passed the Y axis.
+
+        Args:
+            ax (Optional[Axes]): The axes to plot on. Default opens a new figure and shows it.
         """
+        ax, show = self._axes(ax)
         for walker_name, averages in self.statistics.calculate_average_passed_y().items():
-            sns.lineplot(data=averages, label=walker_name)
-        plt.legend()
-        plt.title('Average Passed Y')
-        plt.xlabel('Number of Steps')
-        plt.ylabel('Number of Times Crossed Y Axis')
-        plt.show()
+            self.__plot_series(ax, averages, walker_name)
+        ax.legend()
+        ax.set_title('Average Passed Y')
+        ax.set_xlabel('Number of Steps')
+        ax.set_ylabel('Number of Times Crossed Y Axis')
+        if show:
+            plt.show()
 
-    def plot_lead_counts(self):
+    def plot_lead_counts(self, ax: Optional[Axes] = None):
         """
         Plot the average amount of times each walker lead per simulation meaning was furthest from origin.
+
+        Args:
+            ax (Optional[Axes]): The axes to plot on. Default opens a new figure and shows it.
         """
         # Get the average lead counts
         average_leads = self.statistics.calculate_average_leads()
@@ -175,12 +349,179 @@ class Graph:
         df = pd.DataFrame(list(average_leads.items()), columns=['Walker Name', 'Average Lead Count'])
 
         # Create the bar plot
-        plt.figure(figsize=(10, 6))
-        sns.barplot(x='Walker Name', y='Average Lead Count', data=df, hue='Walker Name', dodge=False)
-        plt.title('Average Lead Count Per Simulation')
-        plt.ylabel('Number of steps in lead')
-        ax = plt.gca()
+        ax, show = self._axes(ax, figsize=(10, 6))
+        sns.barplot(x='Walker Name', y='Average Lead Count', data=df, hue='Walker Name', dodge=False, ax=ax)
+        ax.set_title('Average Lead Count Per Simulation')
+        ax.set_ylabel('Number of steps in lead')
         ax.set_xticks(range(len(df['Walker Name'])))
         ax.set_xticklabels(['\n'.join(textwrap.wrap(name, 10)) for name in df['Walker Name']])
-        plt.xlabel('Walker Name')
+        ax.set_xlabel('Walker Name')
+        if show:
+            plt.show()
+
+    def plot_density(self, walker_name: str, ax: Optional[Axes] = None):
+        """
+        Plot where a walker went over all simulations, as a heatmap of its visits to the cells of a grid, with the
+        barriers and portal gates on top. The plotting time depends on the grid, not on the number of simulations.
+
+        Args:
+            walker_name (str): The name of the walker.
+            ax (Optional[Axes]): The axes to plot on. Default opens a new figure and shows it.
+        """
+        densities, extent = self.statistics.calculate_visit_density()
+        ax, show = self._axes(ax, figsize=(8, 6))
+        # Cells never visited are left blank, and the counts are log-scaled since they pile up around the origin
+        counts = np.ma.masked_equal(densities[walker_name].T, 0)
+        image = ax.imshow(counts, origin='lower', extent=extent, aspect='auto', interpolation='nearest',
+                          cmap='viridis', norm=LogNorm())
+        ax.figure.colorbar(image, ax=ax, label='Visits')
+        ax.grid(False)
+
+        self.plot_barriers(ax)
+        self.plot_portal_gates(ax)
+
+        ax.set_title(f'Visit Density of {walker_name} ({self.statistics.get_total_simulations} Simulations)')
+        ax.set_xlabel('X Position')
+        ax.set_ylabel('Y Position')
+        if show:
+            plt.show()
+
+    def plot_densities(self):
+        """
+        Plot the visit density of every walker in a single window.
+        """
+        self.__draw_densities(plt.figure(figsize=self.__grid_size(len(self.statistics.walker_names))))
+        plt.show()
+
+    def plot_all(self):
+        """
+        Plot every panel in its own window, one after the other.
+        """
+        for method_name, kwargs, _ in PANELS.values():
+            getattr(self, method_name)(**kwargs)
+
+    def plot_dashboard(self):
+        """
+        Plot every panel in a single window, which is closed once instead of once per panel.
+        """
+        self.__draw_dashboard(plt.figure(figsize=self.__grid_size(len(PANELS))))
         plt.show()
+
+    def render(self, output_dir: str, formats: Sequence[str] = ('png',), dashboard: bool = True,
+               panels: bool = True, density: bool = False, workers: int = 1) -> List[str]:
+        """
+        Render the panels off-screen with the Agg backend into image files, without opening any window.
+
+        The figures are drawn with the object-oriented matplotlib API rather than pyplot, so rendering neither blocks
+        nor touches the interactive figures of the GUI.
+
+        Args:
+            output_dir (str): The directory to save the images to, created if it does not exist.
+            formats (Sequence[str]): The image formats, such as 'png' or 'svg'. Default is PNG only.
+            dashboard (bool): Whether to render all panels into a single 'dashboard' image. Default is True.
+            panels (bool): Whether to render every panel into its own image, named after the panel. Default is True.
+            density (bool): Whether to render the visit density of every walker into a single 'density' image, which
+             needs the trajectories of every simulation. Default is False.
+            workers (int): The number of worker processes rendering the panel images. Default is 1, which renders
+             them in the current process.
+
+        Returns:
+            List[str]: The paths of the rendered images.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        if dashboard:
+            figure = Figure(figsize=self.__grid_size(len(PANELS)))
+            self.__draw_dashboard(figure)
+            paths.extend(self.__save(figure, os.path.join(output_dir, 'dashboard'), formats))
+
+        if density:
+            figure = Figure(figsize=self.__grid_size(len(self.statistics.walker_names)))
+            self.__draw_densities(figure)
+            paths.extend(self.__save(figure, os.path.join(output_dir, 'density'), formats))
+
+        if panels:
+            panel_paths = [os.path.join(output_dir, panel_name) for panel_name in PANELS]
+            if workers > 1:
+                # Ship only the plotted values to the workers, not the trajectories of every simulation
+                graph = Graph.__new__(Graph)
+                graph.statistics = StatisticsSnapshot(self.statistics)
+                graph.barriers = self.barriers
+                graph.portal_gates = self.portal_gates
+                graph.pixel_budget = self.pixel_budget
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    for rendered in executor.map(Graph._render_panel, [graph] * len(PANELS), PANELS,
+                                                 panel_paths, [formats] * len(PANELS)):
+                        paths.extend(rendered)
+            else:
+                for panel_name, panel_path in zip(PANELS, panel_paths):
+                    paths.extend(self._render_panel(self, panel_name, panel_path, formats))
+        return paths
+
+    @staticmethod
+    def _render_panel(graph: 'Graph', panel_name: str, path: str, formats: Sequence[str]) -> List[str]:
+        """
+        Render a single panel into its own image files, possibly in a worker process.
+
+        Args:
+            graph (Graph): The graph to render a panel of.
+            panel_name (str): The name of the panel.
+            path (str): The path of the images, without the extension.
+            formats (Sequence[str]): The image formats.
+
+        Returns:
+            List[str]: The paths of the rendered images.
+        """
+        sns.set_theme()  # Worker processes do not share the theme set by the constructor
+        method_name, kwargs, figsize = PANELS[panel_name]
+        figure = Figure(figsize=figsize)
+        getattr(graph, method_name)(ax=figure.add_subplot(), **kwargs)
+        figure.tight_layout()
+        return Graph.__save(figure, path, formats)
+
+    @staticmethod
+    def __grid_size(num_panels: int) -> Tuple[float, float]:
+        """
+        Return the size of a figure with a grid of panels.
+        """
+        rows = -(-num_panels // GRID_COLUMNS)
+        return GRID_PANEL_SIZE[0] * GRID_COLUMNS, GRID_PANEL_SIZE[1] * rows
+
+    @staticmethod
+    def __grid_axes(figure: Figure, num_panels: int) -> List[Axes]:
+        """
+        Add a grid of axes for a number of panels to a figure, without the unused cells of its last row.
+        """
+        rows = -(-num_panels // GRID_COLUMNS)
+        axes = figure.subplots(rows, GRID_COLUMNS, squeeze=False).ravel()
+        for ax in axes[num_panels:]:
+            figure.delaxes(ax)
+        return list(axes[:num_panels])
+
+    def __draw_dashboard(self, figure: Figure):
+        """
+        Draw every panel on a grid of axes of a figure.
+        """
+        for ax, (method_name, kwargs, _) in zip(self.__grid_axes(figure, len(PANELS)), PANELS.values()):
+            getattr(self, method_name)(ax=ax, **kwargs)
+        figure.tight_layout()
+
+    def __draw_densities(self, figure: Figure):
+        """
+        Draw the visit density of every walker on a grid of axes of a figure.
+        """
+        walker_names = self.statistics.walker_names
+        for ax, walker_name in zip(self.__grid_axes(figure, len(walker_names)), walker_names):
+            self.plot_density(walker_name, ax=ax)
+        figure.tight_layout()
+
+    @staticmethod
+    def __save(figure: Figure, path: str, formats: Sequence[str]) -> List[str]:
+        """
+        Save a figure in several formats and return the paths of the files.
+        """
+        paths = []
+        for image_format in formats:
+            paths.append(f"{path}.{image_format}")
+            figure.savefig(paths[-1], format=image_format)
+        return paths
@@ -1,6 +1,12 @@
-import random
+from typing import Optional, Sequence, Tuple
+import bisect
+import math
 import numpy as np
-from Walker.walker import Walker
+from Walker.walker import Walker, LATTICE_STEPS, LATTICE_MOVES
+
+# The possible directions, in the order of their probabilities: up, down, left, right, and towards origin
+DIRECTIONS = ["up", "down", "left", "right", "to_origin"]
+TO_ORIGIN = 4
 
 
 class BiasedWalker(Walker):
@@ -47,6 +53,24 @@ class BiasedWalker(Walker):
         self.__left_prob = left_prob / total_prob
         self.__right_prob = right_prob / total_prob
         self.__to_origin_prob = to_origin_prob / total_prob
+        # Cumulative probabilities of the directions, shared by every step instead of being rebuilt each time
+        self.__cumulative_probs = list(np.cumsum([self.__up_prob, self.__down_prob, self.__left_prob,
+                                                  self.__right_prob, self.__to_origin_prob]))
+
+    @property
+    def lattice_moves(self) -> Optional[Tuple[Tuple[Tuple[float, float, float], float], ...]]:
+        """
+        Get the moves of the walker with their probabilities, if it never moves towards the origin.
+
+        Moves towards the origin depend on the position of the walker, so in that case None is returned.
+
+        Returns:
+            Optional[Tuple[Tuple[Tuple[float, float, float], float], ...]]: The (displacement, probability) pairs of
+            the up, down, left and right moves, or None.
+        """
+        if self.__to_origin_prob > 0:
+            return None
+        return tuple(zip(LATTICE_MOVES, (self.__up_prob, self.__down_prob, self.__left_prob, self.__right_prob)))
 
     def run(self) -> None:
         """
@@ -56,14 +80,10 @@ class BiasedWalker(Walker):
         If the direction is towards the origin, the walker moves one step along the unit vector towards the origin.
         """
         self.prev_position = self.position
-        # Define the possible directions: up, down, left, right, and towards origin
-        directions = ["up", "down", "left", "right", "to_origin"]
-
-        # Define the probabilities for each direction
-        probabilities = [self.__up_prob, self.__down_prob, self.__left_prob, self.__right_prob, self.__to_origin_prob]
 
-        # Choose a random direction based on probabilities
-        direction = random.choices(directions, probabilities)[0]
+        # Choose a random direction by locating a uniform draw in the cumulative probabilities
+        draw = self.rng.random() * self.__cumulative_probs[-1]
+        direction = DIRECTIONS[bisect.bisect_right(self.__cumulative_probs, draw)]
 
         # Update the position based on the chosen direction
         if direction == "up":
@@ -75,17 +95,102 @@ class BiasedWalker(Walker):
         elif direction == "right":
             self.position = (self.position[0] + 1, self.position[1], self.position[2])
         elif direction == "to_origin":
-            # Calculate the direction vector towards the origin
-            direction_to_origin = np.array([0, 0, 0]) - np.array(self.position)
-            # Calculate the norm
-            norm = np.linalg.norm(direction_to_origin)
+            x, y, z = self.position
+            # Calculate the norm of the vector towards the origin
+            norm = math.sqrt(x * x + y * y + z * z)
             # Check if norm is greater than 0 to avoid division by zero
             if norm > 0:
-                # Calculate the unit vector towards the origin
-                unit_direction_to_origin = direction_to_origin / norm
-                # Define the step size towards the origin
-                step_size = 1
-                # Calculate the displacement vector towards the origin
-                displacement = step_size * unit_direction_to_origin
-                # Update the position by adding the displacement
-                self.position = tuple(np.array(self.position) + displacement)
+                # Move one step along the unit vector towards the origin
+                self.position = (x - x / norm, y - y / norm, z - z / norm)
+
+    def run_batch(self, rngs: Sequence[np.random.Generator], num_steps: int) -> np.ndarray:
+        """
+        Simulate the walker movement for a whole block of simulations at once.
+
+        The directions of every step of every simulation are sampled in one call from the cumulative probabilities,
+        and the lattice moves are integrated with a cumulative sum. Moves towards the origin depend on the position
+        reached so far, so they are resolved afterwards by a recurrence over the runs of consecutive to-origin moves
+        only: the k-th run of all simulations is applied at once, in closed form along the ray towards the origin,
+        and its displacement is carried to the later steps.
+
+        Args:
+            rngs (Sequence[np.random.Generator]): One random number generator per simulation.
+            num_steps (int): The number of steps per simulation.
+
+        Returns:
+            np.ndarray: An array of shape (len(rngs), num_steps, 3) with the position after every step.
+        """
+        # Sample the direction codes by locating uniform draws in the cumulative probabilities
+        cumulative_probs = np.array(self.__cumulative_probs)
+        num_simulations = len(rngs)
+        draws = np.empty((num_simulations, num_steps))
+        for simulation_draws, rng in zip(draws, rngs):
+            rng.random(out=simulation_draws)
+        draws *= cumulative_probs[-1]
+        directions = np.searchsorted(cumulative_probs, draws, side='right')
+
+        # Integrate the lattice moves, a to-origin move is a zero displacement at this stage
+        step_table = np.vstack([LATTICE_STEPS, np.zeros(3)])
+        positions = np.cumsum(step_table[directions], axis=1)
+        if self.__to_origin_prob == 0:
+            return positions
+
+        # Runs of consecutive to-origin moves in row-major order, so the runs of each simulation are contiguous
+        to_origin = directions == TO_ORIGIN
+        run_starts = to_origin.copy()
+        run_starts[:, 1:] &= ~to_origin[:, :-1]
+        run_ends = to_origin.copy()
+        run_ends[:, :-1] &= ~to_origin[:, 1:]
+        run_simulations, run_start_steps = np.nonzero(run_starts)
+        run_lengths = np.nonzero(run_ends)[1] - run_start_steps + 1
+        run_counts = np.bincount(run_simulations, minlength=num_simulations)
+        first_runs = np.cumsum(run_counts) - run_counts
+
+        # The recurrence only needs the ray each run starts on, the signed distances along it follow in closed form
+        run_radii = np.zeros(len(run_lengths))
+        run_units = np.zeros((len(run_lengths), 3))
+        offsets = np.zeros((num_simulations, 3))  # Difference between the true position and the lattice moves
+        for k in range(run_counts.max(initial=0)):
+            # The k-th run of every simulation that has one
+            simulations = np.flatnonzero(run_counts > k)
+            runs = first_runs[simulations] + k
+            lattice_positions = positions[simulations, run_start_steps[runs]]
+            before = lattice_positions + offsets[simulations]
+            radii = np.linalg.norm(before, axis=1)
+            units = np.divide(before, radii[:, None], out=np.zeros_like(before), where=radii[:, None] > 0)
+            run_radii[runs] = radii
+            run_units[runs] = units
+            end_distances = self.__distances_along_ray(radii, run_lengths[runs])
+            offsets[simulations] = end_distances[:, None] * units - lattice_positions
+
+        # Expand the runs into their moves and record how much each move changes the offset
+        run_of_move = np.repeat(np.arange(len(run_lengths)), run_lengths)
+        run_first_moves = np.cumsum(run_lengths) - run_lengths
+        move_in_run = np.arange(len(run_of_move)) - run_first_moves[run_of_move] + 1
+        distances = self.__distances_along_ray(run_radii[run_of_move], move_in_run)
+        previous_distances = self.__distances_along_ray(run_radii[run_of_move], move_in_run - 1)
+        offset_changes = np.zeros_like(positions)
+        offset_changes[run_simulations[run_of_move], run_start_steps[run_of_move] + move_in_run - 1] = \
+            (distances - previous_distances)[:, None] * run_units[run_of_move]
+
+        return positions + np.cumsum(offset_changes, axis=1)
+
+    @staticmethod
+    def __distances_along_ray(radii: np.ndarray, moves: np.ndarray) -> np.ndarray:
+        """
+        Calculate the signed distance from the origin after consecutive moves towards it.
+
+        The distance decreases by one with every move. Once it drops below one the next move overshoots the origin,
+        and the walker then alternates between the two sides of it, unless it landed exactly on the origin.
+
+        Args:
+            radii (np.ndarray): The distances from the origin before the first move.
+            moves (np.ndarray): The numbers of moves towards the origin.
+
+        Returns:
+            np.ndarray: The signed distances along the original direction after the moves.
+        """
+        whole, fraction = np.divmod(radii, 1)
+        overshoots = moves - whole
+        return np.where(overshoots <= 0, radii - moves,
+                        np.where(fraction == 0, 0, np.where(overshoots % 2 == 0, fraction, fraction - 1)))
@@ -1,5 +1,6 @@
-from Walker.walker import Walker
-import random
+from typing import Sequence, Tuple
+from Walker.walker import Walker, LATTICE_STEPS, LATTICE_MOVES
+import numpy as np
 
 
 class DiscreteStepWalker(Walker):
@@ -21,6 +22,16 @@ class DiscreteStepWalker(Walker):
         """
         super().__init__()  # Start at position (0, 0, 0)
 
+    @property
+    def lattice_moves(self) -> Tuple[Tuple[Tuple[float, float, float], float], ...]:
+        """
+        Get the moves of the walker with their probabilities: one step up, down, left or right, equally likely.
+
+        Returns:
+            Tuple[Tuple[Tuple[float, float, float], float], ...]: The (displacement, probability) pairs of every move.
+        """
+        return tuple((move, 1 / len(LATTICE_MOVES)) for move in LATTICE_MOVES)
+
     def run(self) -> None:
         """
         Simulate the walker movement.
@@ -29,7 +40,7 @@ class DiscreteStepWalker(Walker):
         """
         self.prev_position = self.position  # Save the current position as the previous position
         directions = ["up", "down", "left", "right"]  # Define the possible directions
-        direction = random.choice(directions)  # Choose a random direction
+        direction = directions[int(self.rng.random() * len(directions))]  # Choose a random direction
         x, y, z = self.position  # Unpack the current position
 
         # Update the position based on the chosen direction
@@ -43,3 +54,22 @@ class DiscreteStepWalker(Walker):
             x += 1
 
         self.position = (x, y, z)  # Set the new position
+
+    def run_batch(self, rngs: Sequence[np.random.Generator], num_steps: int) -> np.ndarray:
+        """
+        Simulate the walker movement for a whole block of simulations at once.
+
+        Every step of every simulation is drawn as a direction code (up, down, left, right), the codes are mapped to
+        unit displacements and the positions are obtained with a cumulative sum along the steps.
+
+        Args:
+            rngs (Sequence[np.random.Generator]): One random number generator per simulation.
+            num_steps (int): The number of steps per simulation.
+
+        Returns:
+            np.ndarray: An array of shape (len(rngs), num_steps, 3) with the position after every step.
+        """
+        direction_codes = np.empty((len(rngs), num_steps), dtype=np.int8)
+        for codes, rng in zip(direction_codes, rngs):
+            codes[:] = rng.integers(0, len(LATTICE_STEPS), size=num_steps, dtype=np.int8)
+        return np.cumsum(LATTICE_STEPS[direction_codes], axis=1)
@@ -1,5 +1,9 @@
-from Walker.walker import Walker
-import random
+from typing import Optional, Sequence
+from Walker.walker import Walker, LATTICE_STEPS, LATTICE_MOVES
+import numpy as np
+
+# Transition table of the walk: the directions allowed after each direction code (up, down, left, right)
+SUCCESSORS = [[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]]
 
 
 class NoRepeatWalker(Walker):
@@ -12,6 +16,7 @@ class NoRepeatWalker(Walker):
     Attributes:
         position (Tuple[float, float, float]): The current position of the walker.
         prev_position (Tuple[float, float, float]): The previous position of the walker.
+        __prev_direction (Optional[int]): The direction code of the previous step, None before the first step.
     """
 
     def __init__(self):
@@ -21,6 +26,14 @@ class NoRepeatWalker(Walker):
         The walker starts at the origin (0, 0, 0).
         """
         super().__init__()  # Start at position (0, 0, 0)
+        self.__prev_direction: Optional[int] = None
+
+    def reset(self) -> None:
+        """
+        Return the walker to the origin and forget the direction of its previous step.
+        """
+        super().reset()
+        self.__prev_direction = None
 
     def run(self) -> None:
         """
@@ -30,29 +43,44 @@ class NoRepeatWalker(Walker):
         same as the direction of the previous step.
         """
         # Save the current position as the previous position
-        prev_position = self.prev_position
         self.prev_position = self.position
 
-        # Define the possible directions
-        directions = [(0.0, 1.0, 0.0), (0.0, -1.0, 0.0), (-1.0, 0.0, 0.0), (1.0, 0.0, 0.0)]
+        # Choose a random direction from the directions allowed after the previous one
+        if self.__prev_direction is None:
+            direction = int(self.rng.random() * len(SUCCESSORS))
+        else:
+            successors = SUCCESSORS[self.__prev_direction]
+            direction = successors[int(self.rng.random() * len(successors))]
+        self.__prev_direction = direction
 
-        # If there was a previous position, calculate the direction of the previous step
-        if prev_position is not None:
-            prev_direction = (self.position[0] - prev_position[0], self.position[1] - prev_position[1], self.position[2] - prev_position[2])
-            # If the direction of the previous step is in the list of possible directions, remove it
-            if prev_direction in directions:
-                directions.remove(prev_direction)
+        # Unpack the current position and update it based on the chosen direction
+        x, y, z = self.position
+        dx, dy, dz = LATTICE_MOVES[direction]
 
-        # Choose a random direction from the remaining possible directions
-        direction = random.choice(directions)
+        # Set the new position
+        self.position = (x + dx, y + dy, z + dz)
 
-        # Unpack the current position
-        x, y, z = self.position
+    def run_batch(self, rngs: Sequence[np.random.Generator], num_steps: int) -> np.ndarray:
+        """
+        Simulate the walker movement for a whole block of simulations at once.
 
-        # Update the position based on the chosen direction
-        x += direction[0]
-        y += direction[1]
-        z += direction[2]
+        The walk is a Markov chain over the four direction codes where every direction has three equally likely
+        successors. Numbering the successors of a direction d as (d + 1) % 4, (d + 2) % 4 and (d + 3) % 4 turns the
+        chain into a cumulative sum of successor offsets, so the directions of every step of every simulation are
+        reconstructed at once and the positions are obtained with a second cumulative sum.
 
-        # Set the new position
-        self.position = (x, y, z)
+        Args:
+            rngs (Sequence[np.random.Generator]): One random number generator per simulation.
+            num_steps (int): The number of steps per simulation.
+
+        Returns:
+            np.ndarray: An array of shape (len(rngs), num_steps, 3) with the position after every step.
+        """
+        num_directions = len(SUCCESSORS)
+        # The first direction is free, every later one is an offset of 1 to 3 from the previous direction
+        offsets = np.empty((len(rngs), num_steps), dtype=np.int64)
+        for simulation_offsets, rng in zip(offsets, rngs):
+            simulation_offsets[0] = rng.integers(0, num_directions)
+            simulation_offsets[1:] = rng.integers(1, num_directions, size=num_steps - 1)
+        directions = np.cumsum(offsets, axis=1) % num_directions
+        return np.cumsum(LATTICE_STEPS[directions], axis=1)
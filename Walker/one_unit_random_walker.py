@@ -1,3 +1,4 @@
+from typing import Sequence
 import numpy as np
 from Walker.walker import Walker
 
@@ -29,10 +30,33 @@ class OneUnitRandomWalker(Walker):
         """
         self.prev_position = self.position  # Save the current position as the previous position
         # Generate a random angle between 0 and 2*pi (360 degrees)
-        theta = np.random.uniform(0, 2*np.pi)
+        theta = 2 * np.pi * self.rng.random()
 
         # Calculate new position
         x = self.position[0] + np.cos(theta)  # Move one unit in the x direction based on the angle
         y = self.position[1] + np.sin(theta)  # Move one unit in the y direction based on the angle
         z = self.position[2]  # Use the current z value
         self.position = (x, y, z)  # Set the new position
+
+    def run_batch(self, rngs: Sequence[np.random.Generator], num_steps: int) -> np.ndarray:
+        """
+        Simulate the walker movement for a whole block of simulations at once.
+
+        The angles of every step are drawn in one call per simulation and the positions are obtained with a
+        cumulative sum of the unit displacements along the steps.
+
+        Args:
+            rngs (Sequence[np.random.Generator]): One random number generator per simulation.
+            num_steps (int): The number of steps per simulation.
+
+        Returns:
+            np.ndarray: An array of shape (len(rngs), num_steps, 3) with the position after every step.
+        """
+        theta = np.empty((len(rngs), num_steps))
+        for angles, rng in zip(theta, rngs):
+            rng.random(out=angles)
+        theta *= 2 * np.pi
+        displacements = np.zeros((len(rngs), num_steps, 3))
+        np.cos(theta, out=displacements[..., 0])
+        np.sin(theta, out=displacements[..., 1])
+        return np.cumsum(displacements, axis=1, out=displacements)
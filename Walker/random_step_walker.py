@@ -1,3 +1,4 @@
+from typing import Sequence
 import numpy as np
 from Walker.walker import Walker
 
@@ -29,13 +30,39 @@ class RandomStepWalker(Walker):
         """
         self.prev_position = self.position  # Save the current position as the previous position
         # Generate a random angle between 0 and 2*pi (360 degrees)
-        theta = np.random.uniform(0, 2 * np.pi)
+        theta = 2 * np.pi * self.rng.random()
 
         # Generate a random step size between 0.5 and 1.5
-        step_size = np.random.uniform(0.5, 1.5)
+        step_size = 0.5 + self.rng.random()
 
         # Calculate new position
         x = self.position[0] + step_size * np.cos(theta)  # Move a random step size in the x direction based on the angle
         y = self.position[1] + step_size * np.sin(theta)  # Move a random step size in the y direction based on the angle
         z = self.position[2]  # Use the current z value
         self.position = (x, y, z)  # Set the new position
+
+    def run_batch(self, rngs: Sequence[np.random.Generator], num_steps: int) -> np.ndarray:
+        """
+        Simulate the walker movement for a whole block of simulations at once.
+
+        The angles and step sizes of every step are drawn in one call each per simulation and the positions are
+        obtained with a cumulative sum of the displacements along the steps.
+
+        Args:
+            rngs (Sequence[np.random.Generator]): One random number generator per simulation.
+            num_steps (int): The number of steps per simulation.
+
+        Returns:
+            np.ndarray: An array of shape (len(rngs), num_steps, 3) with the position after every step.
+        """
+        theta = np.empty((len(rngs), num_steps))
+        step_size = np.empty((len(rngs), num_steps))
+        for angles, sizes, rng in zip(theta, step_size, rngs):
+            rng.random(out=angles)
+            rng.random(out=sizes)
+        theta *= 2 * np.pi
+        step_size += 0.5
+        displacements = np.zeros((len(rngs), num_steps, 3))
+        np.multiply(step_size, np.cos(theta), out=displacements[..., 0])
+        np.multiply(step_size, np.sin(theta), out=displacements[..., 1])
+        return np.cumsum(displacements, axis=1, out=displacements)
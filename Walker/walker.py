@@ -1,10 +1,16 @@
 from typing import *
 from abc import ABC, abstractmethod
+import numpy as np
 
 X = 0
 Y = 1
 Z = 2
 
+# Unit displacements of the lattice walkers, indexed by direction code: up, down, left, right
+LATTICE_STEPS = np.array([(0.0, 1.0, 0.0), (0.0, -1.0, 0.0), (-1.0, 0.0, 0.0), (1.0, 0.0, 0.0)])
+# The same displacements as plain float tuples, for the step loop
+LATTICE_MOVES = [tuple(step) for step in LATTICE_STEPS.tolist()]
+
 
 class Walker(ABC):
     """
@@ -13,10 +19,12 @@ class Walker(ABC):
     Attributes:
         position (Tuple[float, float, float]): The current position of the walker.
         prev_position (Tuple[float, float, float]): The previous position of the walker.
+        rng (np.random.Generator): The random number generator the walker draws its movement from.
     """
 
     def __init__(self):
         """Initialize a new Walker with position and previous position at the origin."""
+        self.__rng = np.random.default_rng()
         self.__x = 0
         self.__y = 0
         self.__z = 0
@@ -48,6 +56,22 @@ class Walker(ABC):
         except ValueError as e:
             print(e)
 
+    @property
+    def rng(self) -> np.random.Generator:
+        """Get the random number generator the walker draws its movement from."""
+        return self.__rng
+
+    @rng.setter
+    def rng(self, rng: np.random.Generator) -> None:
+        """
+        Set the random number generator the walker draws its movement from.
+
+        Args:
+            rng (np.random.Generator): The new random number generator, typically a stream dedicated to one walker
+            in one simulation so that the simulation can be reproduced.
+        """
+        self.__rng = rng
+
     @property
     def prev_position(self) -> Tuple[float, float, float]:
         """Get the previous position of the walker."""
@@ -78,6 +102,47 @@ class Walker(ABC):
         """
         pass
 
+    @property
+    def lattice_moves(self) -> Optional[Tuple[Tuple[Tuple[float, float, float], float], ...]]:
+        """
+        Get the moves of the walker with their probabilities, if they depend neither on its position nor its history.
+
+        Such walkers can be stepped from precomputed tables of the moves allowed around obstacles, instead of
+        retrying blocked moves. The default implementation returns None, meaning the walker must be stepped with run().
+
+        Returns:
+            Optional[Tuple[Tuple[Tuple[float, float, float], float], ...]]: The (displacement, probability) pairs of
+            every possible move, or None.
+        """
+        return None
+
+    def reset(self) -> None:
+        """
+        Return the walker to the origin and forget the history of its movement.
+
+        Subclasses whose movement depends on previous steps extend this method to clear that state.
+        """
+        self.position = (0, 0, 0)
+        self.prev_position = (0, 0, 0)
+
+    def run_batch(self, rngs: Sequence[np.random.Generator], num_steps: int) -> Optional[np.ndarray]:
+        """
+        Simulate the walker movement for a whole block of simulations at once.
+
+        Walkers with a vectorized engine override this method. The default implementation returns None,
+        which tells the caller to fall back to stepping the walker with run().
+
+        Args:
+            rngs (Sequence[np.random.Generator]): One random number generator per simulation. Every simulation draws
+            only from its own generator, so its result does not depend on the other simulations of the block.
+            num_steps (int): The number of steps per simulation.
+
+        Returns:
+            Optional[np.ndarray]: An array of shape (len(rngs), num_steps, 3) with the position after every step of
+            every simulation, starting from the origin, or None if the walker has no vectorized engine.
+        """
+        return None
+
     def calculate_distance_from_point(self, point: Tuple[float, float, float]) -> float:
         """
         Calculate the distance from the current location to a given point.
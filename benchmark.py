@@ -0,0 +1,410 @@
+import argparse
+import json
+import math
+import os
+import platform
+import statistics as stats
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from simulation import Simulation
+from my_statistics import Statistics
+from statistics_exporter import StatisticsExporter
+from obstacles_and_barriers import Barrier2D
+from portal_gate import PortalGate
+from scenario import WALKER_CLASSES
+
+# The default sizes of the matrix every size-dependent benchmark is run over
+DEFAULT_SIMULATIONS = (10, 100)
+DEFAULT_STEPS = (100, 1000)
+# The numbers of obstacles the simulation benchmarks are run with, half barriers and half portal gates
+OBSTACLE_COUNTS = (0, 10, 1000)
+# The distance between the corners of two neighbouring obstacles
+OBSTACLE_SPACING = 4
+# The first-passage thresholds of the benchmarked simulations, so their statistics are computed as well
+FIRST_PASSAGE_THRESHOLDS = ['r>15', 'x>5']
+# The statistics methods benchmarked, with their arguments
+STATISTICS_METHODS = [
+    ('calculate_average_locations_per_step', {}),
+    ('calculate_average_distance_from_origin', {}),
+    ('calculate_distances_from_axis', {'axis': 'X'}),
+    ('calculate_escape_radius_10', {}),
+    ('calculate_first_passage_times', {}),
+    ('calculate_average_passed_y', {}),
+    ('calculate_average_leads', {}),
+    ('calculate_visit_density', {}),
+]
+
+
+class BenchmarkSuite:
+    """
+    A class used to time the walkers, the simulation with and without obstacles, the statistics, the export and the
+    rendering of the graphs over a matrix of numbers of simulations and steps.
+
+    Every benchmark is repeated and its best, median and mean times are recorded together with its parameters, so
+    the results of two versions of the project can be compared benchmark by benchmark. The simulations are seeded,
+    so every run times the same walks.
+
+    ...
+
+    Attributes
+    ----------
+    simulations : Sequence[int]
+        the numbers of simulations of the matrix
+    steps : Sequence[int]
+        the numbers of steps of the matrix
+    repeats : int
+        the number of times every benchmark is timed
+    results : list
+        the results recorded so far
+
+    Methods
+    -------
+    run(groups):
+        Runs the benchmark groups and returns their results.
+    bench_walkers():
+        Times Walker.run and Walker.run_batch for every walker type.
+    bench_simulation():
+        Times Simulation.simulate and Simulation.simulate_batch with 0, 10 and 1000 obstacles.
+    bench_statistics():
+        Times every Statistics.calculate_* method, with and without retained trajectories.
+    bench_export():
+        Times StatisticsExporter.save_to_json.
+    bench_graph():
+        Times the off-screen rendering paths of Graph.
+    save(path):
+        Saves the results and the environment they were measured in to a JSON file.
+    """
+
+    GROUPS = ('walkers', 'simulation', 'statistics', 'export', 'graph')
+
+    def __init__(self, simulations: Sequence[int] = DEFAULT_SIMULATIONS, steps: Sequence[int] = DEFAULT_STEPS,
+                 repeats: int = 3):
+        """
+        Constructs all the necessary attributes for the BenchmarkSuite object.
+
+        Parameters
+        ----------
+        simulations : Sequence[int], optional
+            the numbers of simulations of the matrix (default is DEFAULT_SIMULATIONS)
+        steps : Sequence[int], optional
+            the numbers of steps of the matrix (default is DEFAULT_STEPS)
+        repeats : int, optional
+            the number of times every benchmark is timed (default is 3)
+        """
+        self.simulations = list(simulations)
+        self.steps = list(steps)
+        self.repeats = repeats
+        self.results: List[Dict[str, Any]] = []
+
+    def measure(self, name: str, params: Dict[str, Any], function: Callable[..., Any],
+                setup: Optional[Callable[[], Tuple]] = None) -> Dict[str, Any]:
+        """
+        Times a function several times and records the result.
+
+        Parameters
+        ----------
+        name : str
+            the name of the benchmark
+        params : dict
+            the parameters of the benchmark, which identify it together with its name
+        function : Callable
+            the function to time
+        setup : Callable, optional
+            called before every repetition, untimed, and returning the arguments of the function (default is None)
+
+        Returns
+        -------
+        dict
+            the result, with the best, median and mean times in seconds
+        """
+        times = []
+        for _ in range(self.repeats):
+            args = setup() if setup is not None else ()
+            start = time.perf_counter()
+            function(*args)
+            times.append(time.perf_counter() - start)
+        result = {'name': name, 'params': params, 'repeats': self.repeats, 'best': min(times),
+                  'median': stats.median(times), 'mean': stats.mean(times)}
+        self.results.append(result)
+        print(f"{name:<45} {json.dumps(params):<70} {result['best'] * 1000:>12.3f} ms", flush=True)
+        return result
+
+    def run(self, groups: Sequence[str] = GROUPS) -> List[Dict[str, Any]]:
+        """
+        Runs the benchmark groups and returns their results.
+
+        Parameters
+        ----------
+        groups : Sequence[str], optional
+            the groups to run, among GROUPS (default is all of them)
+
+        Returns
+        -------
+        list
+            the results of the benchmarks
+        """
+        for group in groups:
+            getattr(self, f'bench_{group}')()
+        return self.results
+
+    @staticmethod
+    def build_simulation(num_obstacles: int = 0, seed: int = 0) -> Simulation:
+        """
+        Creates a seeded simulation with one walker of every type and a number of obstacles.
+
+        The obstacles are unit squares on a grid around the origin, closest first, alternately barriers and portal
+        gates leading back to the origin.
+
+        Parameters
+        ----------
+        num_obstacles : int, optional
+            the number of obstacles (default is 0)
+        seed : int, optional
+            the master seed of the simulation (default is 0)
+
+        Returns
+        -------
+        Simulation
+            the simulation
+        """
+        simulation = Simulation(seed)
+        for walker_class in WALKER_CLASSES.values():
+            simulation.add_walker(walker_class())
+        simulation.first_passage_thresholds = FIRST_PASSAGE_THRESHOLDS
+
+        radius = OBSTACLE_SPACING * (math.ceil(math.sqrt(num_obstacles)) // 2 + 2)
+        corners = sorted(((x, y) for x in range(-radius, radius + 1, OBSTACLE_SPACING)
+                          for y in range(-radius, radius + 1, OBSTACLE_SPACING) if (x, y) != (0, 0)),
+                         key=lambda corner: (corner[0] ** 2 + corner[1] ** 2, corner))
+        for index, (x, y) in enumerate(corners[:num_obstacles]):
+            if index % 2 == 0:
+                result = simulation.add_barrier(f'barrier{index}', Barrier2D(x, y, 1, 1))
+            else:
+                result = simulation.add_portal_gate(f'portal{index}', PortalGate(x, y, 1, 1, 0, 0))
+            if isinstance(result, str):
+                raise ValueError(f"Cannot place obstacle {index} at ({x}, {y}): {result}")
+        return simulation
+
+    @staticmethod
+    def build_statistics(num_simulations: int, num_steps: int,
+                         retain_trajectories: bool = True) -> Statistics:
+        """
+        Runs the simulations of a seeded simulation without obstacles and collects their statistics.
+
+        Parameters
+        ----------
+        num_simulations : int
+            the number of simulations
+        num_steps : int
+            the number of steps per simulation
+        retain_trajectories : bool, optional
+            whether the trajectories of every simulation are kept (default is True)
+
+        Returns
+        -------
+        Statistics
+            the statistics of the simulations
+        """
+        simulation = BenchmarkSuite.build_simulation()
+        statistics = Statistics(retain_trajectories)
+        statistics.num_of_steps = num_steps
+        store = statistics.reserve(simulation, num_simulations)
+        for _ in simulation.simulate_batch(num_simulations, num_steps, store=store):
+            simulation.reset()
+        return statistics
+
+    def __matrix(self) -> List[Tuple[int, int]]:
+        """
+        Returns every pair of a number of simulations and a number of steps of the matrix.
+        """
+        return [(num_simulations, num_steps) for num_simulations in self.simulations for num_steps in self.steps]
+
+    def bench_walkers(self) -> None:
+        """
+        Times Walker.run, a step at a time, and the vectorized Walker.run_batch for every walker type.
+        """
+        for walker_name, walker_class in WALKER_CLASSES.items():
+            for num_steps in self.steps:
+                def steps(walker):
+                    for _ in range(num_steps):
+                        walker.run()
+
+                self.measure('walker_run', {'walker': walker_name, 'steps': num_steps}, steps,
+                             lambda: (walker_class(),))
+
+            for num_simulations, num_steps in self.__matrix():
+                rngs = [np.random.default_rng(index) for index in range(num_simulations)]
+                self.measure('walker_run_batch', {'walker': walker_name, 'simulations': num_simulations,
+                                                  'steps': num_steps},
+                             lambda walker: walker.run_batch(rngs, num_steps), lambda: (walker_class(),))
+
+    def bench_simulation(self) -> None:
+        """
+        Times Simulation.simulate, one simulation at a time with the step loop, and Simulation.simulate_batch, which
+        uses the vectorized engines when there are no obstacles, with 0, 10 and 1000 obstacles.
+        """
+        for num_obstacles in OBSTACLE_COUNTS:
+            for num_simulations, num_steps in self.__matrix():
+                params = {'obstacles': num_obstacles, 'simulations': num_simulations, 'steps': num_steps}
+
+                def simulate(simulation):
+                    for simulation_index in range(1, num_simulations + 1):
+                        simulation.simulate(num_steps, simulation_index=simulation_index)
+                        simulation.reset()
+
+                def simulate_batch(simulation):
+                    for _ in simulation.simulate_batch(num_simulations, num_steps):
+                        simulation.reset()
+
+                self.measure('simulate', params, simulate, lambda: (self.build_simulation(num_obstacles),))
+                self.measure('simulate_batch', params, simulate_batch,
+                             lambda: (self.build_simulation(num_obstacles),))
+
+    def bench_statistics(self) -> None:
+        """
+        Times every Statistics.calculate_* method on fresh statistics, so the metric cache does not hide the work,
+        with and without retained trajectories.
+        """
+        for num_simulations, num_steps in self.__matrix():
+            filled = self.build_statistics(num_simulations, num_steps)
+            for retain_trajectories in (True, False):
+                source = filled if retain_trajectories else filled.partial()
+                for method_name, kwargs in STATISTICS_METHODS:
+                    if method_name == 'calculate_visit_density' and not retain_trajectories:
+                        continue  # The visit density needs the trajectories
+
+                    def fresh_statistics():
+                        statistics = Statistics(retain_trajectories)
+                        statistics.num_of_steps = num_steps
+                        statistics.merge(source)
+                        return statistics,
+
+                    self.measure('statistics', {'method': method_name, **kwargs,
+                                                'retain_trajectories': retain_trajectories,
+                                                'simulations': num_simulations, 'steps': num_steps},
+                                 lambda statistics: getattr(statistics, method_name)(**kwargs), fresh_statistics)
+
+    def bench_export(self) -> None:
+        """
+        Times StatisticsExporter.save_to_json with the statistics a run exports.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            for num_simulations, num_steps in self.__matrix():
+                statistics = self.build_statistics(num_simulations, num_steps)
+                exporter = StatisticsExporter()
+                exporter.add_data('average_distance_from_origin',
+                                  statistics.calculate_average_distance_from_origin())
+                exporter.add_data('distances_from_axis_x', statistics.calculate_distances_from_axis(axis='Y'))
+                exporter.add_data('distances_from_axis_y', statistics.calculate_distances_from_axis(axis='X'))
+                exporter.add_data('escape_radius_10_stats', statistics.calculate_escape_radius_10())
+                exporter.add_data('passed_y_stats', statistics.calculate_average_passed_y())
+                exporter.add_data('average lead count', statistics.calculate_average_leads())
+                exporter.add_data('first_passage_stats', statistics.calculate_first_passage_times())
+                self.measure('save_to_json', {'simulations': num_simulations, 'steps': num_steps},
+                             lambda: exporter.save_to_json(os.path.join(directory, 'stats.json')))
+
+    def bench_graph(self) -> None:
+        """
+        Times the off-screen rendering of the dashboard, of the panel images and of the visit densities, on
+        statistics whose metrics are already computed, so only the drawing is timed.
+        """
+        # Imported here so that the other groups do not load matplotlib, seaborn and pandas
+        import matplotlib
+        matplotlib.use('Agg')
+        from Graph import Graph
+
+        with tempfile.TemporaryDirectory() as directory:
+            for num_simulations, num_steps in self.__matrix():
+                statistics = self.build_statistics(num_simulations, num_steps)
+                for method_name, kwargs in STATISTICS_METHODS:
+                    getattr(statistics, method_name)(**kwargs)
+                graph = Graph(statistics, {}, {})
+                params = {'simulations': num_simulations, 'steps': num_steps}
+                for target in ('dashboard', 'panels', 'density'):
+                    flags = {flag: flag == target for flag in ('dashboard', 'panels', 'density')}
+                    self.measure(f'graph_render_{target}', params,
+                                 lambda: graph.render(directory, ('png',), **flags))
+
+    def save(self, path: str) -> None:
+        """
+        Saves the results and the environment they were measured in to a JSON file.
+
+        Parameters
+        ----------
+        path : str
+            the path of the JSON file
+        """
+        with open(path, 'w') as file:
+            json.dump({'environment': self.environment(), 'simulations': self.simulations, 'steps': self.steps,
+                       'results': self.results}, file, indent=2)
+
+    @staticmethod
+    def environment() -> Dict[str, Any]:
+        """
+        Returns the versions of the project, Python and numpy, and the machine the benchmarks run on.
+
+        Returns
+        -------
+        dict
+            the environment of the benchmarks
+        """
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {'timestamp': datetime.now(timezone.utc).isoformat(), 'commit': commit,
+                'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                'processor': platform.processor(), 'cpu_count': os.cpu_count()}
+
+    @staticmethod
+    def compare(baseline_path: str, results: List[Dict[str, Any]]) -> None:
+        """
+        Prints the speedup of every benchmark over the same benchmark of a previous results file.
+
+        Parameters
+        ----------
+        baseline_path : str
+            the path of the previous results file
+        results : list
+            the results to compare
+        """
+        with open(baseline_path, 'r') as file:
+            baseline = {(result['name'], json.dumps(result['params'], sort_keys=True)): result
+                        for result in json.load(file)['results']}
+        print(f"Speedup of the best times over {baseline_path}:")
+        for result in results:
+            previous = baseline.get((result['name'], json.dumps(result['params'], sort_keys=True)))
+            if previous is not None:
+                print(f"{result['name']:<45} {json.dumps(result['params']):<70} "
+                      f"{previous['best'] / result['best']:>8.2f}x")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Time the walkers, the simulation, the statistics, the export and "
+                                                 "the graphs of the random walk simulation.")
+    parser.add_argument('--output', default='benchmark_results.json', help="path of the JSON results file")
+    parser.add_argument('--simulations', type=int, nargs='+', default=DEFAULT_SIMULATIONS,
+                        help="numbers of simulations of the matrix")
+    parser.add_argument('--steps', type=int, nargs='+', default=DEFAULT_STEPS, help="numbers of steps of the matrix")
+    parser.add_argument('--repeats', type=int, default=3, help="number of times every benchmark is timed")
+    parser.add_argument('--groups', nargs='+', choices=BenchmarkSuite.GROUPS, default=BenchmarkSuite.GROUPS,
+                        help="benchmark groups to run")
+    parser.add_argument('--compare', help="previous results file to print the speedups against")
+    args = parser.parse_args(argv)
+
+    suite = BenchmarkSuite(args.simulations, args.steps, args.repeats)
+    suite.run(args.groups)
+    suite.save(args.output)
+    print(f"Results saved to {args.output}")
+    if args.compare:
+        suite.compare(args.compare, suite.results)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
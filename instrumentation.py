@@ -0,0 +1,191 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+import json
+import time
+
+# The events counted during a run
+COUNTERS = ('steps', 'rejected_attempts', 'barrier_hits', 'blocked_moves', 'blocked_steps', 'teleports',
+            'abandoned_walkers')
+
+
+class Instrumentation:
+    """
+    A class used to record where the time of a simulation run goes and what happened during it.
+
+    The wall time of every phase of a run (simulation, statistics, export, plotting...) and of every walker type is
+    accumulated, together with counters of the steps taken, the teleports through portal gates, the walkers abandoned
+    because they had no valid move, and of the collisions with barriers. A walker either retries its draw until its
+    move is allowed, or, with fixed lattice moves near obstacles, draws once among the allowed moves of a move table,
+    and each way has its own collision counters:
+
+    - rejected_attempts counts the draws rejected because their move collided with a barrier, and barrier_hits the
+      steps with at least one rejected draw.
+    - blocked_moves counts the moves blocked by a barrier from the positions walkers stepped from a move table, and
+      blocked_steps the steps from a position with at least one blocked move. A blocked move is not a rejected
+      draw, it is never drawn.
+
+    The instrumentation of runs in other processes merges into it.
+
+    ...
+
+    Attributes
+    ----------
+    __phase_times : dict
+        the wall time in seconds of every phase
+    __walker_times : dict
+        the wall time in seconds spent simulating every walker type
+    __counters : dict
+        the number of times every event of COUNTERS happened
+
+    Methods
+    -------
+    phase(name):
+        Context manager adding the time of its block to a phase.
+    add_phase_time(name, seconds):
+        Adds time to a phase.
+    add_walker_time(walker_type, seconds):
+        Adds time to a walker type.
+    merge(other):
+        Adds the times and counters of another instrumentation.
+    to_dict():
+        Returns the report as a dictionary.
+    save(path, **details):
+        Saves the report to a JSON file.
+    """
+
+    def __init__(self):
+        """
+        Constructs all the necessary attributes for the Instrumentation object, with every time and counter at zero.
+        """
+        self.__phase_times: Dict[str, float] = {}
+        self.__walker_times: Dict[str, float] = {}
+        self.__counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+
+    @property
+    def phase_times(self) -> Dict[str, float]:
+        """
+        Returns the wall time of every phase.
+
+        Returns
+        -------
+        dict
+            the wall time in seconds of every phase, by phase name
+        """
+        return self.__phase_times
+
+    @property
+    def walker_times(self) -> Dict[str, float]:
+        """
+        Returns the wall time spent simulating every walker type.
+
+        Returns
+        -------
+        dict
+            the wall time in seconds of every walker type, by class name
+        """
+        return self.__walker_times
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        """
+        Returns the counters of the events of the run, which the simulation increments in place.
+
+        Returns
+        -------
+        dict
+            the number of times every event of COUNTERS happened
+        """
+        return self.__counters
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Adds the wall time of the block it wraps to a phase.
+
+        Parameters
+        ----------
+        name : str
+            the name of the phase
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase_time(name, time.perf_counter() - start)
+
+    def add_phase_time(self, name: str, seconds: float) -> None:
+        """
+        Adds time to a phase.
+
+        Parameters
+        ----------
+        name : str
+            the name of the phase
+        seconds : float
+            the time to be added
+        """
+        self.__phase_times[name] = self.__phase_times.get(name, 0.0) + seconds
+
+    def add_walker_time(self, walker_type: str, seconds: float) -> None:
+        """
+        Adds time to a walker type.
+
+        Parameters
+        ----------
+        walker_type : str
+            the class name of the walker
+        seconds : float
+            the time to be added
+        """
+        self.__walker_times[walker_type] = self.__walker_times.get(walker_type, 0.0) + seconds
+
+    def merge(self, other: 'Instrumentation') -> None:
+        """
+        Adds the times and counters of another instrumentation, such as the one of a shard run in another process.
+
+        Parameters
+        ----------
+        other : Instrumentation
+            the instrumentation to be merged
+        """
+        for name, seconds in other.phase_times.items():
+            self.add_phase_time(name, seconds)
+        for walker_type, seconds in other.walker_times.items():
+            self.add_walker_time(walker_type, seconds)
+        for name, count in other.counters.items():
+            self.__counters[name] = self.__counters.get(name, 0) + count
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the report as a dictionary.
+
+        Returns
+        -------
+        dict
+            the times in seconds of the phases and of the walker types, and the counters
+
+        Raises
+        ------
+        ValueError
+            if a counter is negative, which only a miscounting simulation does
+        """
+        negative = [name for name, count in self.__counters.items() if count < 0]
+        if negative:
+            raise ValueError(f"Negative counters {', '.join(negative)}: {self.__counters}")
+        return {'phases': {name: round(seconds, 6) for name, seconds in self.__phase_times.items()},
+                'walker_types': {name: round(seconds, 6) for name, seconds in self.__walker_times.items()},
+                'counters': dict(self.__counters)}
+
+    def save(self, path: str, **details: Any) -> None:
+        """
+        Saves the report to a JSON file.
+
+        Parameters
+        ----------
+        path : str
+            the path of the JSON file
+        **details
+            further entries of the report, such as the number of simulations and steps of the run
+        """
+        with open(path, 'w') as file:
+            json.dump({**details, **self.to_dict()}, file, indent=4)
@@ -1,7 +1,5 @@
-import tkinter
-from simulation_gui import SimulationGUI
-from simulation_gui import SimulationController
 import argparse
+import sys
 
 
 class PreserveNewlineHelpFormatter(argparse.RawTextHelpFormatter):
@@ -72,12 +70,63 @@ a) Enter the number of simulations you'd like to run
 b) Enter the number of steps you'd like per simulation
 c) Enter path to save stats, it's optional, if left empty it will be saved
 to the directory from where you ran the project.
-d) Click "Run simulation" to run your customized simulation!""", formatter_class=PreserveNewlineHelpFormatter)
+d) Click "Run simulation" to run your customized simulation!
+
+To run a simulation without the GUI, for example on a machine without a display, describe it in a JSON scenario file
+and write "python main.py --scenario scenario.json". The statistics file is written, and with "--figures DIR" the
+graphs are rendered to image files in DIR, no window is opened. With "--instrument" the time of every phase of the
+run and walker type, and counts of the steps, collisions, teleports and abandoned walkers, are saved next to the
+statistics file, in stats_report.json for stats.json.
+
+To profile the simulation runs, of the GUI or of a scenario, add "--profile run.prof". Only the runs are profiled,
+not the GUI, and the profile can be read with "python -m pstats run.prof" or tools such as snakeviz and flameprof.
+
+Runs too large for the memory can keep the trajectories on disk with "--trajectory-dir DIR", as memory-mapped files
+which are deleted once the statistics are saved.
+See the Scenario class in scenario.py for the format of the file.""", formatter_class=PreserveNewlineHelpFormatter)
+    parser.add_argument('--scenario', help="run the simulation described by a JSON scenario file without the GUI")
+    parser.add_argument('--output', help="path of the statistics file, overrides the output of the scenario")
+    parser.add_argument('--workers', type=int, help="number of worker processes, overrides the scenario")
+    parser.add_argument('--seed', type=int, help="master seed of the simulations, overrides the scenario")
+    parser.add_argument('--figures', help="directory to render the graphs to, overrides the scenario")
+    parser.add_argument('--instrument', action='store_true',
+                        help="save the time of every phase and the event counters of the run next to the statistics")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="save a cProfile profile of the simulation runs to PATH, in the pstats format")
+    parser.add_argument('--trajectory-dir', metavar='DIR',
+                        help="keep the trajectories in memory-mapped files in DIR, overrides the scenario")
 
     # Parse the arguments passed to the script
     args = parser.parse_args()
+
+    if args.scenario:
+        # Run headless, the GUI and its dependencies are never imported
+        from scenario import Scenario
+        try:
+            scenario = Scenario.load(args.scenario)
+        except (OSError, ValueError) as error:
+            print(f"Error: cannot read the scenario {args.scenario}: {error}", file=sys.stderr)
+            sys.exit(2)
+        try:
+            saved_path = scenario.run(args.output, args.workers, args.seed, args.figures, args.instrument,
+                                      args.profile, args.trajectory_dir)
+        except (ValueError, KeyError) as error:
+            print(f"Error: cannot run the scenario {args.scenario}: {error}", file=sys.stderr)
+            sys.exit(2)
+        except OSError as error:
+            print(f"Error: cannot save the results of the scenario {args.scenario}: {error}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Statistics saved to {saved_path}")
+        if args.profile:
+            print(f"Profile saved to {args.profile}")
+        sys.exit(0)
+
+    import tkinter
+    from simulation_gui import SimulationGUI
+    from simulation_gui import SimulationController
+
     # Create an instance of the SimulationController class
-    controller = SimulationController()
+    controller = SimulationController(profile_path=args.profile, trajectory_dir=args.trajectory_dir)
     # Create a root window using tkinter
     root = tkinter.Tk()
     # Create an instance of the SimulationGUI class and assign it to the view attribute of the controller
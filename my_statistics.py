@@ -1,11 +1,16 @@
-from typing import Dict, List, Optional
-from simulation import Simulation
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from simulation import Simulation, BATCH_ELEMENTS
+from statistics_accumulator import StatisticsAccumulator
+from trajectory_store import TrajectoryStore
 import numpy as np
 
 WALKER = 0
 WALKER_LOCATIONS = 1
 RADIUS_10 = 2
 PASSED_Y = 3
+FIRST_PASSAGE = 4
+# The default maximum number of cells along each axis of the visit density grid
+DENSITY_BINS = 400
 
 
 class Statistics:
@@ -16,17 +21,28 @@ class Statistics:
 
     Attributes
     ----------
-    __total_simulations : int
-        the total number of simulations
-    __simulations : dict
-        a dictionary of simulations
+    __retain_trajectories : bool
+        whether the trajectories of every simulation are kept, or only running sums of them
+    __trajectory_dir : str
+        the directory the trajectories are kept in as memory-mapped files, None to keep them in memory
+    __results : TrajectoryStore or StatisticsAccumulator
+        the trajectories of every walker in every simulation, or the running sums over the simulations if the
+        trajectories are not retained, None before the first simulation
     __average_locations : dict
         a dictionary of average locations for each walker
+    __metric_cache : dict
+        the computed metrics, keyed by metric name and parameters, valid for __metric_cache_simulations simulations
 
     Methods
     -------
+    reserve(simulation, num_simulations):
+        Makes room for more simulations of a simulation's walkers and returns the store to write them into.
     add_simulation(name, simulation):
         Adds a simulation to the statistics.
+    merge(other):
+        Adds the simulations collected by another Statistics object, or their partial statistics.
+    partial():
+        Returns the sums and counts the statistics are computed from, which merge exactly across shards.
     calculate_average_locations_per_cell():
         Calculates the average locations per cell for each walker.
     calculate_average_distance_from_origin():
@@ -35,34 +51,84 @@ class Statistics:
         Calculates the distances from a specified axis for each walker.
     calculate_escape_radius_10():
         Calculates the average number of steps it took for each walker to escape a radius of 10 units.
+    calculate_first_passage_times():
+        Calculates the average number of steps it took for each walker to first pass each threshold.
     calculate_average_passed_y():
         Calculates the average number of times each walker passed the y-axis in all simulations.
+    calculate_visit_density(bins):
+        Counts the visits of each walker to the cells of a grid over all locations of all simulations.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, retain_trajectories: bool = True, trajectory_dir: Optional[str] = None) -> None:
         """
         Initializes a Statistics object with the necessary attributes.
 
+        Args:
+            retain_trajectories (bool): Whether the trajectories of every simulation are kept. If False, only running
+             sums over the simulations are kept, so the memory does not grow with the number of simulations and only
+             the first simulation can be plotted. Defaults to True.
+            trajectory_dir (Optional[str]): The directory to keep the trajectories in as memory-mapped files, so the
+             size of a run is bounded by the disk rather than the memory. Every statistic is computed by streaming
+             over blocks of simulations. Defaults to None, which keeps them in memory.
+
         Attributes:
-            __total_simulations (int): The total number of simulations conducted.
             __num_of_steps (int): The number of steps taken in a simulation.
-            __simulations (Dict): A dictionary to store the simulation data.
+            __retain_trajectories (bool): Whether the trajectories of every simulation are kept.
+            __trajectory_dir (Optional[str]): The directory the trajectories are kept in, None for memory.
+            __results (Optional[Union[TrajectoryStore, StatisticsAccumulator]]): The simulation data.
             __average_locations (Dict[str, np.ndarray]): A dictionary to store the average locations of each walker.
+            __metric_cache (Dict[Tuple, Any]): The computed metrics, keyed by metric name and parameters.
+            __metric_cache_simulations (int): The number of simulations the cached metrics were computed from.
         """
-        self.__total_simulations = 0
         self.__num_of_steps = 0
-        self.__simulations: Dict = {}
+        self.__retain_trajectories = retain_trajectories
+        self.__trajectory_dir = trajectory_dir
+        self.__results: Optional[Union[TrajectoryStore, StatisticsAccumulator]] = None
         self.__average_locations: Dict[str, np.ndarray] = {}
+        self.__metric_cache: Dict[Tuple, Any] = {}
+        self.__metric_cache_simulations = 0
+
+    @property
+    def retain_trajectories(self) -> bool:
+        """
+        Property to get whether the trajectories of every simulation are kept.
+
+        Returns:
+            bool: True if the trajectories are kept, False if only running sums of them are.
+        """
+        return self.__retain_trajectories
+
+    @property
+    def store(self) -> Optional[TrajectoryStore]:
+        """
+        Property to get the trajectory store of the simulations.
+
+        Returns:
+            Optional[TrajectoryStore]: The simulations data, None if no simulation was added or the trajectories
+            are not retained.
+        """
+        return self.__results if isinstance(self.__results, TrajectoryStore) else None
+
+    @property
+    def accumulator(self) -> Optional[StatisticsAccumulator]:
+        """
+        Property to get the running sums over the simulations, when the trajectories are not retained.
+
+        Returns:
+            Optional[StatisticsAccumulator]: The running sums, None if no simulation was added or the trajectories
+            are retained.
+        """
+        return self.__results if isinstance(self.__results, StatisticsAccumulator) else None
 
     @property
-    def simulations(self):
+    def walker_names(self) -> List[str]:
         """
-        Property to get the simulations data.
+        Property to get the names of the walkers of the simulations.
 
         Returns:
-            Dict: The simulations data.
+            List[str]: The names of the walkers, empty if no simulation was added.
         """
-        return self.__simulations
+        return self.__results.walker_names if self.__results is not None else []
 
     @property
     def num_of_steps(self):
@@ -94,7 +160,70 @@ class Statistics:
         int
             the total number of simulations
         """
-        return self.__total_simulations
+        return len(self.__results) if self.__results is not None else 0
+
+    def simulation_locations(self, walker_name: str, simulation: int = 0) -> np.ndarray:
+        """
+        Returns the locations of a walker after every step of one simulation.
+
+        Parameters
+        ----------
+        walker_name : str
+            the name of the walker
+        simulation : int, optional
+            the position of the simulation in the order the simulations were added (default is 0, the first)
+
+        Returns
+        -------
+        np.ndarray
+            an array of shape (steps, 3) of the locations of the walker
+
+        Raises
+        ------
+        ValueError
+            if the trajectories are not retained and a simulation other than the first is requested
+        """
+        walker_index = self.__results.walker_index(walker_name)
+        if isinstance(self.__results, StatisticsAccumulator):
+            if simulation != 0:
+                raise ValueError("Only the first simulation is kept when the trajectories are not retained")
+            return self.__results.first_locations[walker_index]
+        return self.__results.locations[walker_index, simulation]
+
+    def reserve(self, simulation: Simulation,
+                num_simulations: int) -> Union[TrajectoryStore, StatisticsAccumulator]:
+        """
+        Makes room for more simulations of a simulation's walkers, so they can be written without reallocating.
+
+        Parameters
+        ----------
+        simulation : Simulation
+            the simulation whose walkers are simulated
+        num_simulations : int
+            the number of simulations to make room for
+
+        Returns
+        -------
+        TrajectoryStore or StatisticsAccumulator
+            the store, or the accumulator if the trajectories are not retained, to write the simulations into,
+            e.g. with Simulation.simulate_batch
+        """
+        if self.__results is None:
+            self.__results = self.__new_results(list(simulation.walkers.keys()), self.__num_of_steps,
+                                                simulation.first_passage_thresholds)
+        if isinstance(self.__results, TrajectoryStore):
+            self.__results.reserve(len(self.__results) + num_simulations)
+        return self.__results
+
+    def __new_results(self, walker_names: List[str], num_steps: int,
+                      first_passage_thresholds: List[str]) -> Union[TrajectoryStore, StatisticsAccumulator]:
+        """
+        Creates the store, or the accumulator if the trajectories are not retained, of the simulations of walkers.
+        """
+        if self.__retain_trajectories:
+            return TrajectoryStore(walker_names, num_steps, first_passage_thresholds=first_passage_thresholds,
+                                   directory=self.__trajectory_dir)
+        return StatisticsAccumulator(walker_names, num_steps, first_passage_thresholds)
 
     def add_simulation(self, name: str, simulation: Simulation) -> None:
         """
@@ -107,19 +236,177 @@ class Statistics:
         simulation : Simulation
             the simulation to be added
         """
-        self.__total_simulations += 1
+        self.__metric_cache.clear()
+        results = self.__results if self.__results is not None else self.reserve(simulation, 1)
+        slot = results.allocate([name])
         for walker_name, walker_info in simulation.walkers.items():
-            if walker_name not in self.__simulations:
-                self.__simulations[walker_name] = {}
-            # Convert locations to a NumPy array for efficient computation
-            locations = np.array(walker_info[WALKER_LOCATIONS])
-            self.__simulations[walker_name][name] = {
-                'locations': locations,
-                'escaped_from_radius_10': walker_info[RADIUS_10],
-                'passed_y_axis': np.array(walker_info[PASSED_Y]),
-                'barriers': simulation.barriers,  # Add barriers to the dictionary
-                'portal_gates': simulation.portal_gates  # Add portal_gates to the dictionary
-            }
+            results.write(results.walker_index(walker_name), slot, walker_info[WALKER_LOCATIONS],
+                          walker_info[RADIUS_10], walker_info[PASSED_Y], walker_info[FIRST_PASSAGE])
+
+    def merge(self, other: Union['Statistics', TrajectoryStore, StatisticsAccumulator]) -> None:
+        """
+        Adds the simulations collected by another Statistics object, such as a shard run in another process, the
+        trajectories of such simulations, or their partial statistics.
+
+        Parameters
+        ----------
+        other : Statistics or TrajectoryStore or StatisticsAccumulator
+            the statistics to be merged, whose simulations follow the ones already added. A shard of the store of
+            these statistics, filled in place, is added without a copy.
+
+        Raises
+        ------
+        ValueError
+            if partial statistics are merged into statistics that retain the trajectories, or trajectories into
+            statistics that do not
+        """
+        self.__metric_cache.clear()
+        if isinstance(other, Statistics):
+            other = other.store if other.store is not None and self.__retain_trajectories else other.partial()
+
+        if isinstance(other, TrajectoryStore):
+            if not self.__retain_trajectories:
+                raise ValueError("Trajectories cannot be merged into statistics that do not retain them")
+            if self.__results is None:
+                self.__results = TrajectoryStore(other.walker_names, other.num_steps,
+                                                 first_passage_thresholds=other.first_passage_thresholds,
+                                                 directory=self.__trajectory_dir)
+            self.__results.merge(other)
+            return
+
+        if not len(other):
+            return
+        if self.__retain_trajectories:
+            raise ValueError("Partial statistics cannot be merged into statistics that retain the trajectories")
+        if self.__results is None:
+            self.__results = StatisticsAccumulator(other.walker_names, other.num_steps, other.first_passage_thresholds)
+        self.__results.merge(other)
+
+    def partial(self) -> StatisticsAccumulator:
+        """
+        Returns the partial statistics of the simulations added so far: the sums and counts every exported statistic
+        is computed from, without the trajectories. They are small, serializable with to_dict, and merge exactly
+        with the partial statistics of other simulations.
+
+        Returns
+        -------
+        StatisticsAccumulator
+            the partial statistics, which must not be modified when the trajectories are not retained
+        """
+        if isinstance(self.__results, StatisticsAccumulator):
+            return self.__results
+        if self.__results is None:
+            return StatisticsAccumulator([], self.__num_of_steps)
+
+        # Add the trajectories to running sums, a block of simulations at a time
+        store = self.__results
+        accumulator = StatisticsAccumulator(store.walker_names, store.num_steps, store.first_passage_thresholds)
+        for block in self.__simulation_blocks(store):
+            first_slot = accumulator.allocate(store.simulation_names[block])
+            for walker_index in range(len(store.walker_names)):
+                accumulator.write_block(walker_index, first_slot, store.locations[walker_index, block],
+                                        store.escape_steps[walker_index, block], store.passed_y[walker_index, block],
+                                        store.first_passage_steps[walker_index, block])
+        return accumulator
+
+    def __cached_metric(self, name: str, params: Tuple, compute: Callable[[], Any]) -> Any:
+        """
+        Returns a metric from the cache, computing it if it was not computed since simulations were last added.
+
+        Simulations written straight into the store or accumulator returned by reserve change the number of
+        simulations, which invalidates the cache as well.
+
+        Parameters
+        ----------
+        name : str
+            the name of the metric
+        params : tuple
+            the parameters the metric was computed with
+        compute : Callable
+            the function computing the metric
+
+        Returns
+        -------
+        Any
+            the metric, shared between callers, which must not modify it
+        """
+        if self.__metric_cache_simulations != self.get_total_simulations:
+            self.__metric_cache.clear()
+            self.__metric_cache_simulations = self.get_total_simulations
+        key = (name, params)
+        if key not in self.__metric_cache:
+            self.__metric_cache[key] = compute()
+        return self.__metric_cache[key]
+
+    @staticmethod
+    def __simulation_blocks(store: TrajectoryStore) -> Iterator[slice]:
+        """
+        Yields the stored simulations in blocks small enough to process whole arrays of them at once.
+        """
+        block_size = max(1, BATCH_ELEMENTS // max(1, len(store.walker_names) * store.num_steps))
+        for start in range(0, len(store), block_size):
+            yield slice(start, min(start + block_size, len(store)))
+
+    def __location_sums(self) -> np.ndarray:
+        """
+        Returns the sums over the simulations of the absolute locations of every walker after every step.
+        """
+        if isinstance(self.__results, StatisticsAccumulator):
+            return self.__results.location_sums
+        location_sums = np.zeros((len(self.__results.walker_names), self.__results.num_steps, 3))
+        location_errors = np.zeros_like(location_sums)
+        for block in self.__simulation_blocks(self.__results):
+            block_sums, block_errors = StatisticsAccumulator.compensated_sum(
+                np.abs(self.__results.locations[:, block]).swapaxes(0, 1))
+            location_sums, location_errors = StatisticsAccumulator.add_compensated(location_sums, location_errors,
+                                                                                   block_sums, block_errors)
+        return location_sums
+
+    def __passed_y_sums(self) -> np.ndarray:
+        """
+        Returns the sums over the simulations of the number of times every walker passed the y-axis up to every step.
+        """
+        if isinstance(self.__results, StatisticsAccumulator):
+            return self.__results.passed_y_sums
+        passed_y_sums = np.zeros((len(self.__results.walker_names), self.__results.num_steps), dtype=np.int64)
+        for block in self.__simulation_blocks(self.__results):
+            passed_y_sums += self.__results.passed_y[:, block].sum(axis=1)
+        return passed_y_sums
+
+    def __escape_sums(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the sums of the escape steps of every walker, and the number of simulations it did not escape in.
+        """
+        if isinstance(self.__results, StatisticsAccumulator):
+            return self.__results.escape_totals, self.__results.zero_counts
+        escape_steps = self.__results.escape_steps
+        # A walker that did not escape has an escape step of 0 and does not add to the total
+        return escape_steps.sum(axis=1, dtype=np.int64), np.count_nonzero(escape_steps == 0, axis=1)
+
+    def __first_passage_sums(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the sums of the first-passage steps of every walker and threshold, and the number of simulations
+        the threshold was not passed in.
+        """
+        if isinstance(self.__results, StatisticsAccumulator):
+            return self.__results.first_passage_totals, self.__results.first_passage_zero_counts
+        first_passage_steps = self.__results.first_passage_steps
+        return first_passage_steps.sum(axis=1, dtype=np.int64), np.count_nonzero(first_passage_steps == 0, axis=1)
+
+    def __lead_counts(self) -> np.ndarray:
+        """
+        Returns the number of steps of all simulations at which every walker led the race.
+        """
+        if isinstance(self.__results, StatisticsAccumulator):
+            return self.__results.lead_counts
+        lead_counts = np.zeros(len(self.__results.walker_names), dtype=np.int64)
+        for block in self.__simulation_blocks(self.__results):
+            # Distance from the origin after each step, for every walker in every simulation of the block
+            distances = np.linalg.norm(self.__results.locations[:, block], axis=-1)
+            # The leading walker of every step of every simulation, ties going to the walker added first
+            leaders = np.argmax(distances, axis=0)
+            lead_counts += np.bincount(leaders.ravel(), minlength=len(self.__results.walker_names))
+        return lead_counts
 
     def calculate_average_locations_per_step(self) -> Dict[str, np.ndarray]:
         """
@@ -132,34 +419,23 @@ class Statistics:
         dict
             a dictionary where the keys are walker names and the values are numpy arrays of average locations
         """
-        # Initialize a dictionary to store the total locations for each walker
-        total_locations: Dict[str, np.ndarray] = {}
-        simulation_counts: Dict[str, int] = {}
-
-        # Iterate through each walker
-        for walker_name, simulations in self.__simulations.items():
-            # Initialize the total locations and count for this walker
-            simulation_counts[walker_name] = 0
-
-            # Iterate through each simulation for this walker
-            for simulation_data in simulations.values():
-                locations = simulation_data['locations']
+        return self.__cached_metric('average_locations_per_step', (), self.__average_locations_per_step)
 
-                # If this is the first simulation for this walker,
-                # set the total locations to a zero array of the same shape as the locations
-                if walker_name not in total_locations:
-                    total_locations[walker_name] = np.zeros_like(locations, dtype=float)
-
-                # Add the absolute values of the locations of this simulation to the total locations
-                total_locations[walker_name] += np.abs(locations)
+    def __average_locations_per_step(self) -> Dict[str, np.ndarray]:
+        """
+        Computes the average absolute locations per step, without the metric cache.
+        """
+        if self.__results is None:
+            self.__average_locations = {}
+            return self.__average_locations
 
-                # Increment the count of simulations for this walker
-                simulation_counts[walker_name] += 1
+        # Add up the absolute values of the locations of every simulation
+        total_locations = self.__location_sums()
 
         # Calculate the average locations for each walker
         self.__average_locations = {
-            walker_name: np.around(total_locations[walker_name] / simulation_counts[walker_name], decimals=5) for
-            walker_name in self.__simulations.keys()}
+            walker_name: np.around(total_locations[walker_index] / self.get_total_simulations, decimals=5) for
+            walker_index, walker_name in enumerate(self.walker_names)}
         return self.__average_locations
 
     def calculate_average_distance_from_origin(self) -> Dict[str, List[float]]:
@@ -171,9 +447,15 @@ class Statistics:
         dict
             a dictionary where the keys are walker names and the values are lists of average distances
         """
+        return self.__cached_metric('average_distance_from_origin', (), self.__average_distance_from_origin)
+
+    def __average_distance_from_origin(self) -> Dict[str, List[float]]:
+        """
+        Computes the average distance from the origin, without the metric cache.
+        """
         distances = {}
         origin_array = np.array((0, 0, 0))
-        for walker, locations in self.__average_locations.items():
+        for walker, locations in self.calculate_average_locations_per_step().items():
             # Convert locations to a NumPy array for efficient computation
             locations_array = np.array(locations)
             # Calculate distances using vectorized operations
@@ -196,9 +478,15 @@ class Statistics:
         dict
             a dictionary where the keys are walker names and the values are lists of distances
         """
+        return self.__cached_metric('distances_from_axis', (axis.upper(),), lambda: self.__distances_from_axis(axis))
+
+    def __distances_from_axis(self, axis: str) -> Dict[str, List[float]]:
+        """
+        Computes the distances from an axis, without the metric cache.
+        """
         distances = {}
         axis_indices = {'X': (1, 2), 'Y': (0, 2), 'Z': (0, 1)}[axis.upper()]
-        for walker, locations in self.__average_locations.items():
+        for walker, locations in self.calculate_average_locations_per_step().items():
             # Convert locations to a NumPy array for efficient computation
             locations_array = np.array(locations)
             # Calculate distances using vectorized operations
@@ -216,35 +504,119 @@ class Statistics:
             dict: A dictionary where the keys are walker names and the values are dictionaries containing the average
             number of steps to escape and the count of times the walker did not escape.
         """
-        # Initialize dictionaries to store total steps to escape and counts of not escaping for each walker
-        walker_totals: Dict[str, int] = {}
-        walker_counts: Dict[str, int] = {}
-
-        # Iterate over all simulations for each walker
-        for walker_name, simulations in self.__simulations.items():
-            for simulation_name, simulation_data in simulations.items():
-                # Get the number of steps it took for the walker to escape a radius of 10 units
-                escaped_radius_10 = simulation_data['escaped_from_radius_10']
-                # If the walker did not escape, increment the count for that walker
-                if escaped_radius_10 == 0:
-                    walker_counts[walker_name] = walker_counts.get(walker_name, 0) + 1
-                # Otherwise, add the number of steps to the total for that walker
-                else:
-                    walker_totals[walker_name] = walker_totals.get(walker_name, 0) + escaped_radius_10
+        return self.__cached_metric('escape_radius_10', (), self.__escape_radius_10)
+
+    def __escape_radius_10(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Computes the escape radius 10 statistics, without the metric cache.
+        """
+        if self.__results is None:
+            return {}
 
         # Initialize a dictionary to store the statistics for each walker
         walker_statistics = {}
 
         # Calculate the average number of steps to escape and the count of not escaping for each walker
-        for walker_name in self.__simulations.keys():
-            total = walker_totals.get(walker_name, 0)
-            count = walker_counts.get(walker_name, 0)
-            num_simulations = len(self.__simulations[walker_name])
+        walker_totals, walker_counts = self.__escape_sums()
+        num_simulations = self.get_total_simulations
+        for walker_name, total, count in zip(self.walker_names, walker_totals.tolist(), walker_counts.tolist()):
             average = total / (num_simulations - count) if num_simulations - count > 0 else None
             walker_statistics[walker_name] = {'average': average, 'zero_count': count}
 
         return walker_statistics
 
+    def calculate_first_passage_times(self) -> Dict[str, Dict[str, Dict[str, Optional[float]]]]:
+        """
+        Calculates, for every first-passage threshold of the simulation, such as "r>15" or "x>5", the average number
+        of steps it took for each walker to first pass it, and the number of times the walker did not pass it.
+
+        Returns
+        -------
+        dict
+            a dictionary where the keys are walker names and the values are dictionaries mapping every threshold to
+            a dictionary of the average number of steps and the count of times the walker did not pass it
+        """
+        return self.__cached_metric('first_passage_times', (), self.__first_passage_times)
+
+    def __first_passage_times(self) -> Dict[str, Dict[str, Dict[str, Optional[float]]]]:
+        """
+        Computes the first-passage statistics, without the metric cache.
+        """
+        if self.__results is None:
+            return {}
+
+        walker_totals, walker_counts = self.__first_passage_sums()
+        num_simulations = self.get_total_simulations
+        thresholds = self.__results.first_passage_thresholds
+        walker_statistics = {}
+        for walker_name, totals, counts in zip(self.walker_names, walker_totals.tolist(), walker_counts.tolist()):
+            walker_statistics[walker_name] = {
+                threshold: {'average': total / (num_simulations - count) if num_simulations - count > 0 else None,
+                            'zero_count': count}
+                for threshold, total, count in zip(thresholds, totals, counts)}
+        return walker_statistics
+
+    def calculate_visit_density(self, bins: int = DENSITY_BINS) -> Tuple[Dict[str, np.ndarray],
+                                                                         Tuple[float, float, float, float]]:
+        """
+        Counts, for each walker, the locations after every step of every simulation that fall in each cell of a grid
+        spanning the locations of all walkers. The cells are squares whose side is a whole number of units, centred
+        on the points of the lattice, so the lattice walks do not alias into stripes. The trajectories are streamed a
+        block of simulations at a time, so the memory used does not depend on the number of simulations.
+
+        Parameters
+        ----------
+        bins : int, optional
+            the maximum number of cells along each axis of the grid (default is DENSITY_BINS)
+
+        Returns
+        -------
+        tuple
+            a dictionary where the keys are walker names and the values are arrays of shape (x cells, y cells) of
+            the visit counts, and the extent (min x, max x, min y, max y) of the grid
+
+        Raises
+        ------
+        ValueError
+            if the trajectories are not retained
+        """
+        return self.__cached_metric('visit_density', (bins,), lambda: self.__visit_density(bins))
+
+    def __visit_density(self, bins: int) -> Tuple[Dict[str, np.ndarray], Tuple[float, float, float, float]]:
+        """
+        Computes the visit density of every walker, without the metric cache.
+        """
+        if self.__results is None:
+            return {}, (-1.0, 1.0, -1.0, 1.0)
+        if isinstance(self.__results, StatisticsAccumulator):
+            raise ValueError("The visit density needs the trajectories, which are not retained")
+
+        # First pass: the extent of the locations of all walkers, so their densities share one grid
+        store = self.__results
+        lows = np.full(2, np.inf)
+        highs = np.full(2, -np.inf)
+        for block in self.__simulation_blocks(store):
+            planar = store.locations[:, block, :, :2]
+            lows = np.minimum(lows, planar.min(axis=(0, 1, 2)))
+            highs = np.maximum(highs, planar.max(axis=(0, 1, 2)))
+        cell_size = max(1, int(np.ceil((highs - lows).max() / bins)))
+        lows = np.floor(lows) - 0.5
+        shape = np.floor((highs - lows) / cell_size).astype(np.int64) + 1
+        highs = lows + shape * cell_size
+
+        # Second pass: the cell of every location, counted with a bincount over the flattened cell indices
+        counts = np.zeros((len(store.walker_names), shape[0] * shape[1]), dtype=np.int64)
+        for block in self.__simulation_blocks(store):
+            for walker_index in range(len(store.walker_names)):
+                planar = store.locations[walker_index, block, :, :2].reshape(-1, 2)
+                cells = np.minimum(((planar - lows) // cell_size).astype(np.int64), shape - 1)
+                counts[walker_index] += np.bincount(cells[:, 0] * shape[1] + cells[:, 1],
+                                                    minlength=shape[0] * shape[1])
+
+        densities = {walker_name: walker_counts.reshape(shape[0], shape[1])
+                     for walker_name, walker_counts in zip(self.walker_names, counts)}
+        return densities, (float(lows[0]), float(highs[0]), float(lows[1]), float(highs[1]))
+
     def calculate_average_passed_y(self) -> Dict[str, List[float]]:
         """
         This function calculates the average number of times each walker passed the y-axis in all simulations.
@@ -252,25 +624,22 @@ class Statistics:
         Returns:
             dict: A dictionary where the keys are walker names and the values are lists of averages normalized to 5 decimal points.
         """
-        # Initialize a dictionary to store the total number of times each walker passed the y-axis
-        walker_passed_y_totals = {}
-
-        # Iterate over all simulations for each walker
-        for walker_name, simulations in self.__simulations.items():
-            num_simulations = len(simulations)
-            for simulation_name, simulation_data in simulations.items():
-                # Get the list of times the walker passed the y-axis
-                passed_y = simulation_data['passed_y_axis']
-                # If this is the first simulation for this walker, initialize the total list with zeros
-                if walker_name not in walker_passed_y_totals:
-                    walker_passed_y_totals[walker_name] = [0.0] * len(passed_y)
-                # Add the number of times the walker passed the y-axis to the total for that walker
-                for i in range(len(passed_y)):
-                    walker_passed_y_totals[walker_name][i] += passed_y[i] / num_simulations
+        return self.__cached_metric('average_passed_y', (), self.__average_passed_y)
+
+    def __average_passed_y(self) -> Dict[str, List[float]]:
+        """
+        Computes the average y-axis crossings, without the metric cache.
+        """
+        if self.__results is None:
+            return {}
+
+        # Add up the number of times each walker passed the y-axis up to each step
+        walker_passed_y_totals = self.__passed_y_sums()
 
         # Calculate the average number of times each walker passed the y-axis and normalize to 5 decimal points
-        walker_passed_y_averages = {walker_name: [round(value, 5) for value in totals] for walker_name, totals in
-                                    walker_passed_y_totals.items()}
+        walker_passed_y_averages = {
+            walker_name: [round(value, 5) for value in (totals / self.get_total_simulations).tolist()] for
+            walker_name, totals in zip(self.walker_names, walker_passed_y_totals)}
 
         return walker_passed_y_averages
 
@@ -280,38 +649,28 @@ class Statistics:
         after every step of every simulation the walker that is furthest from the origin, then divide
         each walker's count by the number of simulations to get the average.
 
+        The distances are stacked into a (walkers x simulations x steps) array, one block of simulations at a time,
+        so the leader of every step of every simulation is found with a single argmax over the walkers.
+
         Returns
         -------
         dict
             a dictionary where the keys are walker names and the values are the average number of times they led the race.
         """
-        # Initialize a dictionary to store the total lead counts for each walker
-        walker_total_lead_counts = {walker_name: 0 for walker_name in self.__simulations.keys()}
-
-        # Initialize a dictionary to store the distances for each walker after each step in each simulation
-        walker_distances: Dict[str, List] = {walker_name: [] for walker_name in self.__simulations.keys()}
+        return self.__cached_metric('average_leads', (), self.__average_leads)
 
-        # Iterate over all walkers and their simulations
-        for walker_name, simulations in self.__simulations.items():
-            # For each simulation, calculate the distance from the origin after each step
-            for simulation_data in simulations.values():
-                distances = [np.linalg.norm(location) for location in simulation_data['locations']]
-                walker_distances[walker_name].append(distances)
-
-        # Calculate the total number of steps across all simulations
-        total_steps = self.__num_of_steps * self.__total_simulations
+    def __average_leads(self) -> Dict[str, float]:
+        """
+        Computes the average lead counts, without the metric cache.
+        """
+        if self.__results is None:
+            return {}
 
-        # Iterate over each step of each simulation
-        for step in range(total_steps):
-            # For each step, compare the distances between walkers to determine who is leading
-            leading_walker = max(walker_distances,
-                                 key=lambda walker: sum(
-                                     distances[step % self.__num_of_steps] for distances in walker_distances[walker]))
-            # Increment the total lead count for the leading walker
-            walker_total_lead_counts[leading_walker] += 1
+        # Count the steps of every simulation at which each walker led the race
+        walker_total_lead_counts = self.__lead_counts()
 
         # Calculate the average lead count for each walker
-        walker_average_leads = {walker_name: lead_count / self.__total_simulations for walker_name, lead_count in
-                                walker_total_lead_counts.items()}
+        walker_average_leads = {walker_name: int(lead_count) / self.get_total_simulations for
+                                walker_name, lead_count in zip(self.walker_names, walker_total_lead_counts)}
 
         return walker_average_leads
@@ -139,6 +139,8 @@ class Barrier2D(Obstacle):
                 the height of the barrier
         """
         super().__init__(x, y, width, height)
+        # The barrier never moves, so its bounding box is built once instead of on every access
+        self.__bounds = BoundingBox(self._x, self._y, self._x + self._width, self._y + self._height)
 
     @property
     def bounds(self) -> BoundingBox:
@@ -150,7 +152,7 @@ class Barrier2D(Obstacle):
         BoundingBox
             the bounding box of the barrier
         """
-        return BoundingBox(self._x, self._y, self._x + self._width, self._y + self._height)
+        return self.__bounds
 
     def contains_point(self, x: float, y: float, z: Optional[float] = None) -> bool:
         """
@@ -189,9 +191,12 @@ class Barrier2D(Obstacle):
         bool
             True if the line segment intersects with the barrier, False otherwise
         """
-        line_segment_bounds = BoundingBox(min(start[X], end[X]), min(start[Y], end[Y]), max(start[X], end[X]),
-                                          max(start[Y], end[Y]))
-        return self.bounds.intersects_with(line_segment_bounds)
+        # Same test as BoundingBox.intersects_with on the bounds of the segment, without building a bounding box
+        bounds = self.__bounds
+        return not (max(start[X], end[X]) < bounds.min_x or
+                    min(start[X], end[X]) > bounds.max_x or
+                    max(start[Y], end[Y]) < bounds.min_y or
+                    min(start[Y], end[Y]) > bounds.max_y)
 
 
 class Barrier3D(Obstacle):
@@ -56,6 +56,8 @@ class PortalGate(Obstacle):
                 the z-coordinate of the portal gate's destination
         """
         super().__init__(x, y, width, height)
+        # The portal gate never moves, so its bounding box is built once instead of on every access
+        self.__bounds = BoundingBox(self._x, self._y, self._x + self._width, self._y + self._height)
         self.__dest_x = dest_x
         self.__dest_y = dest_y
         self.__dest_z = dest_z
@@ -70,7 +72,7 @@ class PortalGate(Obstacle):
         BoundingBox
             the bounding box of the portal gate
         """
-        return BoundingBox(self._x, self._y, self._x + self._width, self._y + self._height)
+        return self.__bounds
 
     @property
     def destination(self) -> Tuple[float, float, float]:
@@ -121,9 +123,12 @@ class PortalGate(Obstacle):
         bool
             True if the line segment intersects with the portal gate, False otherwise
         """
-        line_segment_bounds = BoundingBox(min(start[0], end[0]), min(start[1], end[1]), max(start[0], end[0]),
-                                          max(start[1], end[1]))
-        return self.bounds.intersects_with(line_segment_bounds)
+        # Same test as BoundingBox.intersects_with on the bounds of the segment, without building a bounding box
+        bounds = self.__bounds
+        return not (max(start[0], end[0]) < bounds.min_x or
+                    min(start[0], end[0]) > bounds.max_x or
+                    max(start[1], end[1]) < bounds.min_y or
+                    min(start[1], end[1]) > bounds.max_y)
 
     def teleport(self, walker: Walker) -> bool:
         """
@@ -0,0 +1,119 @@
+from contextlib import contextmanager
+from typing import Iterator, List
+import cProfile
+import os
+import pstats
+
+
+class RunProfiler:
+    """
+    A class used to profile the simulation runs with cProfile, and nothing else of the program.
+
+    Only the blocks it wraps are profiled, in the thread they run in, so neither the GUI main loop nor the wait for a
+    plot window adds noise to the profile. The profiles of the shards run in worker processes are saved to their own
+    files and merged into it. The profile is saved in the pstats format, which pstats, snakeviz and flamegraph
+    converters such as flameprof read.
+
+    ...
+
+    Attributes
+    ----------
+    __path : str
+        the path of the profile file
+    __profile : cProfile.Profile
+        the profile of the blocks run in the current process
+    __shard_paths : list
+        the paths of the profiles of the shards run in worker processes, to be merged
+
+    Methods
+    -------
+    profile():
+        Context manager profiling its block.
+    shard_path(first_simulation):
+        Returns the path a shard saves its profile to.
+    add_shard(path):
+        Adds the profile of a shard.
+    save():
+        Saves the merged profile.
+    """
+
+    def __init__(self, path: str):
+        """
+        Constructs all the necessary attributes for the RunProfiler object.
+
+        Parameters
+        ----------
+        path : str
+            the path of the profile file
+        """
+        self.__path = path
+        self.__profile = cProfile.Profile()
+        self.__shard_paths: List[str] = []
+
+    @property
+    def path(self) -> str:
+        """
+        Returns the path of the profile file.
+
+        Returns
+        -------
+        str
+            the path of the profile file
+        """
+        return self.__path
+
+    @contextmanager
+    def profile(self) -> Iterator[None]:
+        """
+        Profiles the block it wraps, in the current thread.
+        """
+        self.__profile.enable()
+        try:
+            yield
+        finally:
+            self.__profile.disable()
+
+    def shard_path(self, first_simulation: int) -> str:
+        """
+        Returns the path a shard run in a worker process saves its profile to.
+
+        Parameters
+        ----------
+        first_simulation : int
+            the 1-based index of the first simulation of the shard
+
+        Returns
+        -------
+        str
+            the path of the profile of the shard, next to the profile file
+        """
+        return f"{self.__path}.shard{first_simulation}"
+
+    def add_shard(self, path: str) -> None:
+        """
+        Adds the profile of a shard run in a worker process, which save() merges and deletes.
+
+        Parameters
+        ----------
+        path : str
+            the path of the profile of the shard
+        """
+        self.__shard_paths.append(path)
+
+    def save(self) -> str:
+        """
+        Saves the profile of the blocks run in the current process merged with the profiles of the shards, and deletes
+        the files of the shards.
+
+        Returns
+        -------
+        str
+            the path of the profile file
+        """
+        stats = pstats.Stats(self.__profile)
+        for path in self.__shard_paths:
+            stats.add(path)
+            os.remove(path)
+        self.__shard_paths = []
+        stats.dump_stats(self.__path)
+        return self.__path
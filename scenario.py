@@ -0,0 +1,223 @@
+import json
+import os
+from typing import Any, Dict, Optional
+from simulation_runner import SimulationRunner
+from obstacles_and_barriers import Barrier2D
+from portal_gate import PortalGate
+from Walker.biased_walker import BiasedWalker
+from Walker.discrete_step_walker import DiscreteStepWalker
+from Walker.no_repeat_walker import NoRepeatWalker
+from Walker.one_unit_random_walker import OneUnitRandomWalker
+from Walker.random_step_walker import RandomStepWalker
+
+# The walker types a scenario can use, by the name the GUI shows them under
+WALKER_CLASSES = {
+    'BiasedWalker': BiasedWalker,
+    'OneUnitRandomWalker': OneUnitRandomWalker,
+    'DiscreteStepWalker': DiscreteStepWalker,
+    'RandomStepWalker': RandomStepWalker,
+    'NoRepeatWalker': NoRepeatWalker
+}
+
+
+class Scenario:
+    """
+    A class used to represent a simulation scenario read from a JSON file, to run it without the GUI.
+
+    A scenario file looks like::
+
+        {
+            "walkers": [{"type": "BiasedWalker", "count": 2, "params": {"up_prob": 2, "to_origin_prob": 1}},
+                        {"type": "DiscreteStepWalker"}],
+            "barriers": [{"name": "wall", "x": 3, "y": 3, "width": 2, "height": 2}],
+            "portal_gates": [{"name": "gate", "x": -5, "y": -5, "width": 1, "height": 1, "dest_x": 8, "dest_y": 8}],
+            "num_simulations": 100,
+            "num_steps": 1000,
+            "seed": 42,
+            "workers": 4,
+            "first_passage_thresholds": ["r>20", "x>5"],
+            "retain_trajectories": false,
+            "output": "stats.json",
+            "figures_dir": "figures",
+            "figure_formats": ["png", "svg"],
+            "instrument": true,
+            "profile": "run.prof"
+        }
+
+    Only "walkers", "num_simulations" and "num_steps" are required. A "trajectory_dir" keeps the retained
+    trajectories in memory-mapped files in that directory instead of in memory, for runs larger than the memory.
+
+    ...
+
+    Attributes
+    ----------
+    data : dict
+        the scenario, as read from the file
+
+    Methods
+    -------
+    load(path):
+        Reads a scenario from a JSON file.
+    build_runner(seed, instrument, profile_path, trajectory_dir):
+        Creates a simulation runner with the walkers and obstacles of the scenario.
+    run(json_path, workers, seed, figures_dir, instrument, profile_path, trajectory_dir):
+        Runs the scenario and saves its statistics, rendering its graphs to image files if asked to.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        """
+        Constructs all the necessary attributes for the Scenario object.
+
+        Parameters
+        ----------
+        data : dict
+            the scenario
+
+        Raises
+        ------
+        ValueError
+            if the scenario has no walkers, or its number of simulations or steps is not a positive integer
+        """
+        if not data.get('walkers'):
+            raise ValueError("The scenario must have at least one walker")
+        for key in ('num_simulations', 'num_steps'):
+            if not isinstance(data.get(key), int) or data[key] <= 0:
+                raise ValueError(f"The scenario's {key} must be a positive integer")
+        self.data = data
+
+    @staticmethod
+    def load(path: str) -> 'Scenario':
+        """
+        Reads a scenario from a JSON file.
+
+        Parameters
+        ----------
+        path : str
+            the path of the scenario file
+
+        Returns
+        -------
+        Scenario
+            the scenario of the file
+        """
+        with open(path, 'r') as file:
+            return Scenario(json.load(file))
+
+    def build_runner(self, seed: Optional[int] = None, instrument: bool = False, profile_path: Optional[str] = None,
+                     trajectory_dir: Optional[str] = None) -> SimulationRunner:
+        """
+        Creates a simulation runner with the walkers, barriers, portal gates and first-passage thresholds of the
+        scenario.
+
+        Parameters
+        ----------
+        seed : int, optional
+            the master seed, which overrides the seed of the scenario (default is None)
+        instrument : bool, optional
+            whether to record the time and the counters of the run, on top of the instrument of the scenario
+            (default is False)
+        profile_path : str, optional
+            the path to save a cProfile profile of the run to, which overrides the profile of the scenario (default
+            is None)
+        trajectory_dir : str, optional
+            the directory to keep the trajectories in as memory-mapped files, which overrides the trajectory_dir of
+            the scenario (default is None)
+
+        Returns
+        -------
+        SimulationRunner
+            the runner, ready to run the scenario
+
+        Raises
+        ------
+        ValueError
+            if a walker, barrier, portal gate or threshold of the scenario is invalid
+        """
+        runner = SimulationRunner(seed if seed is not None else self.data.get('seed'),
+                                  retain_trajectories=self.data.get('retain_trajectories', True),
+                                  instrument=instrument or self.data.get('instrument', False),
+                                  profile_path=profile_path or self.data.get('profile'),
+                                  trajectory_dir=trajectory_dir or self.data.get('trajectory_dir'))
+        simulation = runner.simulation
+
+        for walker_spec in self.data['walkers']:
+            walker_class = WALKER_CLASSES.get(walker_spec.get('type'))
+            if walker_class is None:
+                raise ValueError(f"Invalid walker type {walker_spec.get('type')!r}, "
+                                 f"expected one of {', '.join(WALKER_CLASSES)}")
+            for _ in range(walker_spec.get('count', 1)):
+                try:
+                    walker = walker_class(**walker_spec.get('params', {}))
+                except TypeError as error:
+                    raise ValueError(f"Invalid parameters for {walker_spec['type']}: {error}")
+                simulation.add_walker(walker)
+
+        for barrier_spec in self.data.get('barriers', []):
+            barrier = Barrier2D(barrier_spec['x'], barrier_spec['y'], barrier_spec['width'], barrier_spec['height'])
+            result = simulation.add_barrier(barrier_spec['name'], barrier)
+            if isinstance(result, str):
+                raise ValueError(f"Barrier {barrier_spec['name']!r}: {result}")
+
+        for portal_gate_spec in self.data.get('portal_gates', []):
+            portal_gate = PortalGate(portal_gate_spec['x'], portal_gate_spec['y'], portal_gate_spec['width'],
+                                     portal_gate_spec['height'], portal_gate_spec['dest_x'],
+                                     portal_gate_spec['dest_y'])
+            result = simulation.add_portal_gate(portal_gate_spec['name'], portal_gate)
+            if isinstance(result, str):
+                raise ValueError(f"Portal gate {portal_gate_spec['name']!r}: {result}")
+
+        simulation.first_passage_thresholds = self.data.get('first_passage_thresholds', [])
+        return runner
+
+    def run(self, json_path: Optional[str] = None, workers: Optional[int] = None, seed: Optional[int] = None,
+            figures_dir: Optional[str] = None, instrument: bool = False,
+            profile_path: Optional[str] = None, trajectory_dir: Optional[str] = None) -> str:
+        """
+        Runs the scenario and saves its statistics. No window is opened, the graphs are rendered to image files when
+        the scenario or the caller gives a figures directory.
+
+        Parameters
+        ----------
+        json_path : str, optional
+            the path of the statistics file, which overrides the output of the scenario (default is None)
+        workers : int, optional
+            the number of worker processes, which overrides the workers of the scenario (default is None)
+        seed : int, optional
+            the master seed, which overrides the seed of the scenario (default is None)
+        figures_dir : str, optional
+            the directory to render the graphs to, which overrides the figures_dir of the scenario (default is None)
+        instrument : bool, optional
+            whether to save the time and the counters of the run next to the statistics, on top of the instrument of
+            the scenario (default is False)
+        profile_path : str, optional
+            the path to save a cProfile profile of the run to, which overrides the profile of the scenario (default
+            is None)
+        trajectory_dir : str, optional
+            the directory to keep the trajectories in as memory-mapped files, which overrides the trajectory_dir of
+            the scenario (default is None)
+
+        Returns
+        -------
+        str
+            the path the statistics were saved to
+
+        Raises
+        ------
+        ValueError
+            if the scenario is invalid, or the directory of the statistics file or of the trajectories does not exist
+        OSError
+            if the statistics or the graphs cannot be saved
+        """
+        json_path = json_path or self.data.get('output', 'stats.json')
+        if not os.path.isdir(json_path) and not os.path.isdir(os.path.dirname(json_path) or os.curdir):
+            raise ValueError(f"The directory of the statistics file {json_path} does not exist")
+
+        trajectory_dir = trajectory_dir or self.data.get('trajectory_dir')
+        if trajectory_dir is not None and not os.path.isdir(trajectory_dir):
+            raise ValueError(f"The directory of the trajectories {trajectory_dir} does not exist")
+
+        runner = self.build_runner(seed, instrument, profile_path, trajectory_dir)
+        return runner.run_simulation(self.data['num_simulations'], self.data['num_steps'], json_path,
+                                     workers=workers or self.data.get('workers', 1), plot=False,
+                                     figures_dir=figures_dir or self.data.get('figures_dir'),
+                                     figure_formats=self.data.get('figure_formats', ('png',)))
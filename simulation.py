@@ -1,12 +1,23 @@
-from typing import Dict, List, Union
+from typing import Dict, Iterator, List, Optional, Union
+import bisect
+import time
+import numpy as np
 from Walker.walker import Walker
 from obstacles_and_barriers import *
 from portal_gate import PortalGate
+from spatial_index import SpatialGrid
+from trajectory_metrics import TrajectoryMetrics
+from trajectory_store import TrajectoryStore
+from instrumentation import Instrumentation
 
 WALKER = 0
 WALKER_LOCATIONS = 1
 RADIUS_10 = 2
 PASSED_Y = 3
+FIRST_PASSAGE = 4
+
+# Upper bound on simulations x steps generated at once by the vectorized engines, to keep a block's memory bounded
+BATCH_ELEMENTS = 2 ** 20
 
 
 class Simulation:
@@ -27,10 +38,21 @@ class Simulation:
         a dictionary of portal gates present in the simulation
     __sim_obstacles_locations : set
         a set of locations occupied by obstacles in the simulation
-    __last_x_position : int
-        the last x position of a walker
-    __passed_y_counter : int
-        the counter for the number of times a walker has passed the y-axis
+    __barrier_index : SpatialGrid
+        a grid index of the barriers, so collision checks only test the barriers near a step
+    __portal_gate_index : SpatialGrid
+        a grid index of the portal gates, so collision checks only test the portal gates near a step
+    __seed_sequence : np.random.SeedSequence
+        the master seed from which the random number streams of every walker in every simulation are derived
+    __use_move_tables : bool
+        whether walkers with fixed lattice moves are stepped from tables of allowed moves near obstacles
+    __move_tables : dict
+        for every set of lattice moves, a dictionary mapping positions near obstacles to their allowed moves
+    __first_passage_thresholds : list
+        the thresholds, such as "r>15" or "x>5", whose first-passage steps are computed for every walker
+    __instrumentation : Instrumentation
+        the instrumentation recording the time of every walker type and counting the steps, collisions, teleports
+        and abandoned walkers, None when the simulation is not instrumented
 
     Methods
     -------
@@ -40,23 +62,41 @@ class Simulation:
         Adds a barrier to the simulation.
     add_portal_gate(portal_gate_name, portal_gate):
         Adds a portal gate to the simulation.
-    simulate(num_steps, max_attempts):
+    simulation_rng(simulation_index, walker_index):
+        Returns the random number stream of a walker in a given simulation.
+    simulate(num_steps, max_attempts, simulation_index):
         Runs the simulation for a specified number of steps.
+    simulate_batch(num_simulations, num_steps, max_attempts, first_simulation, store):
+        Runs several simulations, vectorized across simulations where possible.
     reset():
         Resets the simulation to its initial state.
     """
 
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None, use_move_tables: bool = True):
         """
         Constructs all the necessary attributes for the Simulation object.
-        """
+
+        Parameters
+        ----------
+        seed : int, optional
+            the master seed of the simulation, fresh entropy is drawn from the OS if None (default is None)
+        use_move_tables : bool, optional
+            whether walkers with fixed lattice moves are stepped from tables of the moves allowed near obstacles
+            instead of retrying blocked moves (default is True)
+        """
+        self.__seed_sequence = np.random.SeedSequence(seed)
+        self.__use_move_tables = use_move_tables
+        self.__first_passage_thresholds: List[str] = []
+        self.__move_tables: Dict[tuple, Dict[Tuple[float, float, float],
+                                             Tuple[List[float], List[tuple], List[bool]]]] = {}
+        self.__instrumentation: Optional[Instrumentation] = None
         self.__origin = (0, 0, 0)
         self.__walkers = {}
         self.__barriers = {}
         self.__portal_gates = {}
         self.__sim_obstacles_locations = {}
-        self.__last_x_position = 0
-        self.__passed_y_counter = 0
+        self.__barrier_index = SpatialGrid()
+        self.__portal_gate_index = SpatialGrid()
 
     @property
     def walkers(self) -> Dict[str, List[Union[Walker, List[Tuple[float, float, float]], int, List[int]]]]:
@@ -70,6 +110,99 @@ class Simulation:
         """
         return self.__walkers
 
+    @property
+    def seed(self) -> int:
+        """
+        Returns the master seed of the simulation.
+
+        Returns
+        -------
+        int
+            the master seed, which reproduces every simulation when passed to a new Simulation
+        """
+        return self.__seed_sequence.entropy
+
+    @property
+    def instrumentation(self) -> Optional[Instrumentation]:
+        """
+        Returns the instrumentation of the simulation.
+
+        Returns
+        -------
+        Instrumentation or None
+            the instrumentation recording the time and the events of the simulation, None if it is not instrumented
+        """
+        return self.__instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, instrumentation: Optional[Instrumentation]) -> None:
+        """
+        Sets the instrumentation of the simulation.
+
+        Parameters
+        ----------
+        instrumentation : Instrumentation or None
+            the instrumentation to record the time and the events of the simulation into, None to stop recording
+        """
+        self.__instrumentation = instrumentation
+
+    @property
+    def use_move_tables(self) -> bool:
+        """
+        Returns whether walkers with fixed lattice moves are stepped from tables of allowed moves near obstacles.
+
+        Returns
+        -------
+        bool
+            True if the move tables are used, False if blocked moves are retried like for every other walker
+        """
+        return self.__use_move_tables
+
+    @property
+    def vectorized(self) -> bool:
+        """
+        Returns whether simulate_batch runs the vectorized engines of the walkers, which it does when no barriers or
+        portal gates are present.
+
+        Returns
+        -------
+        bool
+            True if the walkers with a vectorized engine are simulated a block of simulations at a time
+        """
+        return not self.__barriers and not self.__portal_gates
+
+    @property
+    def first_passage_thresholds(self) -> List[str]:
+        """
+        Returns the thresholds whose first-passage steps are computed for every walker.
+
+        Returns
+        -------
+        list
+            the thresholds, such as "r>15" for a radius or "x>5" and "y<-3" for half-planes
+        """
+        return self.__first_passage_thresholds
+
+    @first_passage_thresholds.setter
+    def first_passage_thresholds(self, thresholds: List[str]) -> None:
+        """
+        Sets the thresholds whose first-passage steps are computed for every walker, in addition to the escape from
+        a radius of 10.
+
+        Parameters
+        ----------
+        thresholds : list
+            the thresholds, a quantity among r, x, y and z, then > or <, then a number, such as "r>15" or "x>5"
+
+        Raises
+        ------
+        ValueError
+            if a threshold is not of that form
+        """
+        for threshold in thresholds:
+            TrajectoryMetrics.parse_threshold(threshold)
+        self.__first_passage_thresholds = list(thresholds)
+
     @property
     def origin(self) -> Tuple[float, float, float]:
         """
@@ -138,7 +271,7 @@ class Simulation:
         walker_type = walker.__class__.__name__
         walker_count = sum(walker_name.startswith(walker_type) for walker_name in self.__walkers.keys())
         unique_walker_name = f"{walker_type}{walker_count + 1}"
-        self.__walkers[unique_walker_name] = [walker, [], 0, []]
+        self.__walkers[unique_walker_name] = [walker, [], 0, [], []]
         return True
 
     def remove_walker(self, walker_name: str) -> bool:
@@ -162,7 +295,8 @@ class Simulation:
                 removed = True
         return removed
 
-    def __add_obstacle(self, obstacle_name: str, obstacle: Obstacle, obstacle_dict: Dict[str, Obstacle]) -> Union[bool, str]:
+    def __add_obstacle(self, obstacle_name: str, obstacle: Obstacle, obstacle_dict: Dict[str, Obstacle],
+                       obstacle_index: SpatialGrid) -> Union[bool, str]:
         """
         Adds an obstacle to the simulation.
 
@@ -174,6 +308,8 @@ class Simulation:
             The obstacle to be added to the simulation.
         obstacle_dict : dict
             The dictionary to which the obstacle will be added.
+        obstacle_index : SpatialGrid
+            The grid index to which the obstacle will be added.
 
         Returns
         -------
@@ -181,9 +317,8 @@ class Simulation:
             True if the obstacle was added successfully, otherwise a string with an error message.
         """
         # Check if the obstacle intersects with any existing obstacles or portal gates
-        for existing_bounds in self.__sim_obstacles_locations:
-            if obstacle.bounds.intersects_with(existing_bounds):
-                return "Obstacle intersects with an existing obstacle."
+        if self.__intersects_existing_obstacle(obstacle.bounds):
+            return "Obstacle intersects with an existing obstacle."
 
         # Check if the obstacle intersects with the origin location
         if obstacle.bounds.contains_point(self.__origin[X], self.__origin[Y]):
@@ -193,12 +328,34 @@ class Simulation:
         if obstacle_name in obstacle_dict:
             return f"Obstacle name '{obstacle_name}' is already used."
 
-        # Add the obstacle to the dictionary and its bounds to the locations dictionary
+        # Add the obstacle to the dictionary and the grid index, and its bounds to the locations dictionary
         obstacle_dict[obstacle_name] = obstacle
+        obstacle_index.insert(obstacle_name, obstacle)
         self.__sim_obstacles_locations[obstacle.bounds] = obstacle_name
+        self.__move_tables.clear()  # The allowed moves near the new obstacle changed
 
         return True
 
+    def __intersects_existing_obstacle(self, bounds: BoundingBox) -> bool:
+        """
+        Checks if a bounding box intersects with any existing barrier or portal gate.
+
+        Parameters
+        ----------
+        bounds : BoundingBox
+            the bounding box to be checked
+
+        Returns
+        -------
+        bool
+            True if the bounding box intersects with an existing obstacle, False otherwise
+        """
+        for obstacle_index in (self.__barrier_index, self.__portal_gate_index):
+            for existing_obstacle in obstacle_index.query_box(*bounds.bounds()):
+                if bounds.intersects_with(existing_obstacle.bounds):
+                    return True
+        return False
+
     def remove_obstacle(self, obstacle_name: str) -> bool:
         """
         Removes an obstacle from the simulation.
@@ -221,8 +378,10 @@ class Simulation:
             if barrier.bounds in self.__sim_obstacles_locations:
                 # If they are, remove the barrier's bounds from self.__sim_obstacles_locations
                 del self.__sim_obstacles_locations[barrier.bounds]
-            # Remove the barrier from the simulation
+            # Remove the barrier from the simulation and the grid index
             del self.__barriers[obstacle_name]
+            self.__barrier_index.remove(obstacle_name)
+            self.__move_tables.clear()
             return True
 
         # Check if the obstacle is a portal gate
@@ -233,8 +392,10 @@ class Simulation:
             if portal_gate.bounds in self.__sim_obstacles_locations:
                 # If they are, remove the portal gate's bounds from self.__sim_obstacles_locations
                 del self.__sim_obstacles_locations[portal_gate.bounds]
-            # Remove the portal gate from the simulation
+            # Remove the portal gate from the simulation and the grid index
             del self.__portal_gates[obstacle_name]
+            self.__portal_gate_index.remove(obstacle_name)
+            self.__move_tables.clear()
             return True
 
         # The obstacle was not found
@@ -256,7 +417,7 @@ class Simulation:
         bool
             True if the barrier was added successfully, False otherwise
         """
-        return self.__add_obstacle(barrier_name, barrier, self.__barriers)
+        return self.__add_obstacle(barrier_name, barrier, self.__barriers, self.__barrier_index)
 
     def add_portal_gate(self, portal_gate_name: str, portal_gate: PortalGate) -> Union[bool, str]:
         """
@@ -279,52 +440,11 @@ class Simulation:
                                   portal_gate.destination[0], portal_gate.destination[1])
 
         # Check if the destination of the portal gate intersects with any existing obstacles' locations
-        for existing_bounds in self.__sim_obstacles_locations:
-            if dest_bounds.intersects_with(existing_bounds):
-                return False
+        if self.__intersects_existing_obstacle(dest_bounds):
+            return False
 
         # If the destination is clear, add the portal gate as usual
-        return self.__add_obstacle(portal_gate_name, portal_gate, self.__portal_gates)
-
-    def __time_to_escape_radius_10(self, walker_name: str, num_steps: int) -> bool:
-        """
-        Checks if a walker has escaped a radius of 10 from the origin.
-
-        Parameters
-        ----------
-        walker_name : str
-            the name of the walker
-        num_steps : int
-            the number of steps taken by the walker
-
-        Returns
-        -------
-        bool
-            True if the walker has escaped a radius of 10 from the origin, False otherwise
-        """
-        walker = self.__walkers[walker_name][WALKER]
-        if walker.calculate_distance_from_point(self.__origin) > 10:
-            self.__walkers[walker_name][RADIUS_10] = num_steps
-            return True
-        return False
-
-    def __passed_y_axis(self, walker_name: str) -> None:
-        """
-        Checks if a walker has passed the y-axis.
-
-        Parameters
-        ----------
-        walker_name : str
-            the name of the walker
-        """
-        walker = self.__walkers[walker_name][WALKER]
-        # Checks if walker crossed y-axis
-        if walker.position[0] * self.__last_x_position < 0:
-            self.__passed_y_counter += 1
-
-        self.__walkers[walker_name][PASSED_Y].append(self.__passed_y_counter)
-        # Changes the last x position of walker if it's not zero
-        self.__last_x_position = walker.position[0] if walker.position[0] != 0 else self.__last_x_position
+        return self.__add_obstacle(portal_gate_name, portal_gate, self.__portal_gates, self.__portal_gate_index)
 
     def __check_barrier_collision(self, walker: Walker, new_position: Tuple[float, float, float]) -> bool:
         """
@@ -342,8 +462,10 @@ class Simulation:
         bool
             True if the walker has collided with a barrier, False otherwise
         """
-        for barrier in self.__barriers.values():
-            if barrier.intersects_with_walker(walker.prev_position, new_position):
+        # Only the barriers in the grid cells the step touches can collide with it
+        prev_position = walker.prev_position
+        for barrier in self.__barrier_index.query_segment(prev_position, new_position):
+            if barrier.intersects_with_walker(prev_position, new_position):
                 return True
         return False
 
@@ -361,12 +483,36 @@ class Simulation:
         bool
             True if the walker has collided with a portal gate, False otherwise
         """
-        for portal_gate in self.__portal_gates.values():
+        # Only the portal gates in the grid cells the step touches can collide with it, in the order they were added
+        for portal_gate in self.__portal_gate_index.query_segment(walker.prev_position, walker.position):
             if portal_gate.teleport(walker):
                 return True
         return False
 
-    def simulate(self, num_steps: int, max_attempts: int = 1000) -> None:
+    def simulation_rng(self, simulation_index: int, walker_index: int) -> np.random.Generator:
+        """
+        Returns the random number stream of a walker in a given simulation.
+
+        The stream only depends on the master seed and on the two indices, so any single simulation can be
+        regenerated, or run by another worker, independently of the simulations before it.
+
+        Parameters
+        ----------
+        simulation_index : int
+            the 1-based index of the simulation
+        walker_index : int
+            the 0-based position of the walker in the walkers dictionary
+
+        Returns
+        -------
+        np.random.Generator
+            an independent random number generator for that walker in that simulation
+        """
+        seed_sequence = np.random.SeedSequence(self.__seed_sequence.entropy,
+                                               spawn_key=(simulation_index, walker_index))
+        return np.random.default_rng(seed_sequence)
+
+    def simulate(self, num_steps: int, max_attempts: int = 1000, simulation_index: Optional[int] = None) -> None:
         """
         Runs the simulation for a specified number of steps.
 
@@ -376,71 +522,360 @@ class Simulation:
             the number of steps to be taken in the simulation
         max_attempts : int, optional
             the maximum number of attempts to find a valid move for a walker (default is 1000)
+        simulation_index : int, optional
+            the 1-based index of the simulation, which selects the random number streams of the walkers,
+            if None the walkers keep drawing from their current streams (default is None)
         """
         # Iterate over all walkers in the simulation
-        for key in self.__walkers.keys():
-            # Initialize escape status, y-axis counter and last x position for each walker
-            is_escaped = False
-            self.__passed_y_counter = 0
-            self.__last_x_position = 0
-
-            # Run the simulation for the specified number of steps
-            for step in range(1, num_steps + 1):
-                # Get the current walker
-                walker = self.__walkers[key][WALKER]
-
-                # Initialize valid move flag and attempts counter
-                valid_move = False
-                attempts = 0
-
-                # Try to find a valid move for the walker
-                while not valid_move and attempts < max_attempts:
-                    # Save the current position of the walker
-                    walker.prev_position = walker.position
-
-                    # Move the walker
-                    walker.run()
-
-                    # Check if the walker collided with a barrier
-                    if self.__check_barrier_collision(walker, walker.position):
-                        # If a collision occurred, reset the walker's position and increment the attempts counter
-                        walker.position = walker.prev_position
-                        attempts += 1
-                        continue
-
-                    # Check if the walker collided with a portal gate
-                    if self.__check_portal_gate_collision(walker):
-                        # If a collision occurred, the walker is teleported and the loop is exited
-                        break
-
-                    # If no collisions occurred, the move is valid
-                    valid_move = True
-
-                # If a valid move not found after maximum attempts, stop the simulation for this walker
-                if attempts == max_attempts:
-                    print(
-                        f"Walker {key} could not find a valid move after {max_attempts} attempts."
-                        f" Stopping simulation for this walker.")
+        for walker_index, (key, walker_info) in enumerate(self.__walkers.items()):
+            if simulation_index is not None:
+                walker_info[WALKER].rng = self.simulation_rng(simulation_index, walker_index)
+            self.__simulate_walker(key, num_steps, max_attempts)
+
+    def simulate_batch(self, num_simulations: int, num_steps: int, max_attempts: int = 1000,
+                       first_simulation: int = 1, store: Optional[TrajectoryStore] = None) -> Iterator[int]:
+        """
+        Runs several simulations, vectorized across simulations where possible.
+
+        When no barriers or portal gates are present, every walker with a vectorized engine is simulated a block of
+        simulations at a time. Other walkers, and all walkers when obstacles are present, are stepped one
+        simulation at a time like in simulate(). Before each index is yielded the results of that simulation are
+        loaded into the walkers dictionary, so the caller must collect them before resuming the iteration.
+        Every walker draws from the random number stream of its simulation index, so the results do not depend on
+        how the simulations are split into blocks or between callers. When a trajectory store is given, the results
+        are also written into it as "Simulation <index>", a whole block at a time for the vectorized engines.
+
+        Parameters
+        ----------
+        num_simulations : int
+            the number of simulations to run
+        num_steps : int
+            the number of steps to be taken in each simulation
+        max_attempts : int, optional
+            the maximum number of attempts to find a valid move for a walker (default is 1000)
+        first_simulation : int, optional
+            the 1-based index of the first simulation to run (default is 1)
+        store : TrajectoryStore, optional
+            the store to write the results into, whose walkers are the walkers of the simulation (default is None)
+
+        Yields
+        ------
+        int
+            the 1-based index of the simulation whose results are loaded
+        """
+        use_batch_engines = self.vectorized
+        block_size = max(1, BATCH_ELEMENTS // num_steps)
+        store_indices = {key: store.walker_index(key) for key in self.__walkers} if store is not None else {}
+
+        last_simulation = first_simulation + num_simulations
+        for block_start in range(first_simulation, last_simulation, block_size):
+            block_indices = range(block_start, min(block_start + block_size, last_simulation))
+            if store is not None:
+                first_slot = store.allocate([f"Simulation {simulation_index}" for simulation_index in block_indices])
+
+            # Run the vectorized engines for the whole block and derive the statistics from the trajectories
+            block_results = {}
+            for walker_index, (key, walker_info) in enumerate(self.__walkers.items()):
+                if not use_batch_engines:
+                    break
+                start = time.perf_counter()
+                rngs = [self.simulation_rng(simulation_index, walker_index) for simulation_index in block_indices]
+                locations = walker_info[WALKER].run_batch(rngs, num_steps)
+                if locations is not None:
+                    block_results[key] = (locations,
+                                          TrajectoryMetrics.escape_steps(locations, 10, self.__origin),
+                                          TrajectoryMetrics.passed_y_counts(locations[..., X]),
+                                          TrajectoryMetrics.first_passage_steps(
+                                              locations, self.__first_passage_thresholds, self.__origin))
+                    if self.__instrumentation is not None:
+                        self.__instrumentation.add_walker_time(type(walker_info[WALKER]).__name__,
+                                                               time.perf_counter() - start)
+                        self.__instrumentation.counters['steps'] += locations.shape[0] * locations.shape[1]
+                    if store is not None:
+                        self.__write_block(store, store_indices[key], first_slot, block_results[key])
+
+            for offset, simulation_index in enumerate(block_indices):
+                self.reset()
+                for walker_index, (key, walker_info) in enumerate(self.__walkers.items()):
+                    if key in block_results:
+                        locations, radius_10, passed_y, first_passage = block_results[key]
+                        walker_info[WALKER_LOCATIONS] = locations[offset]
+                        walker_info[RADIUS_10] = int(radius_10[offset])
+                        walker_info[PASSED_Y] = passed_y[offset]
+                        walker_info[FIRST_PASSAGE] = first_passage[offset]
+                    else:
+                        walker_info[WALKER].rng = self.simulation_rng(simulation_index, walker_index)
+                        self.__simulate_walker(key, num_steps, max_attempts)
+                        if store is not None:
+                            self.__write(store, store_indices[key], first_slot + offset, walker_info)
+                yield simulation_index
+
+    def __write_block(self, store: TrajectoryStore, walker_index: int, first_slot: int, results: tuple) -> None:
+        """
+        Writes the results of a vectorized engine into a store, timing it as the "store" phase when instrumented.
+        """
+        start = time.perf_counter()
+        store.write_block(walker_index, first_slot, *results)
+        if self.__instrumentation is not None:
+            self.__instrumentation.add_phase_time('store', time.perf_counter() - start)
+
+    def __write(self, store: TrajectoryStore, walker_index: int, slot: int, walker_info: list) -> None:
+        """
+        Writes the results of a stepped walker into a store, timing it as the "store" phase when instrumented.
+        """
+        start = time.perf_counter()
+        store.write(walker_index, slot, walker_info[WALKER_LOCATIONS], walker_info[RADIUS_10], walker_info[PASSED_Y],
+                    walker_info[FIRST_PASSAGE])
+        if self.__instrumentation is not None:
+            self.__instrumentation.add_phase_time('store', time.perf_counter() - start)
+
+    def __simulate_walker(self, key: str, num_steps: int, max_attempts: int) -> None:
+        """
+        Runs the simulation of a single walker for a specified number of steps.
+
+        Parameters
+        ----------
+        key : str
+            the name of the walker
+        num_steps : int
+            the number of steps to be taken in the simulation
+        max_attempts : int
+            the maximum number of attempts to find a valid move for the walker
+        """
+        start = time.perf_counter()
+        # Get the current walker, and its table of allowed moves if it can be stepped from one
+        walker = self.__walkers[key][WALKER]
+        lattice_moves = None
+        if self.__use_move_tables and (self.__barriers or self.__portal_gates):
+            lattice_moves = walker.lattice_moves
+        move_table = self.__move_tables.setdefault(lattice_moves, {}) if lattice_moves is not None else None
+
+        # Run the simulation for the specified number of steps
+        for _ in range(num_steps):
+            if move_table is not None:
+                # Draw the move directly among the allowed ones, a walker with none is stuck for good
+                if not self.__move_from_table(walker, lattice_moves, move_table):
+                    print(f"Walker {key} has no valid move from {walker.position}."
+                          f" Stopping simulation for this walker.")
+                    if self.__instrumentation is not None:
+                        self.__instrumentation.counters['abandoned_walkers'] += 1
+                    break
+            # If a valid move not found after maximum attempts, stop the simulation for this walker
+            elif not self.__move_with_retries(walker, max_attempts):
+                print(
+                    f"Walker {key} could not find a valid move after {max_attempts} attempts."
+                    f" Stopping simulation for this walker.")
+                if self.__instrumentation is not None:
+                    self.__instrumentation.counters['abandoned_walkers'] += 1
+                break
+
+            # Add the walker's new position to its list of locations
+            self.__walkers[key][WALKER_LOCATIONS].append(walker.position)
+
+        # Derive the y-axis crossings and the first passages, such as the escape from a radius of 10, from the whole
+        # trajectory
+        locations = self.__walkers[key][WALKER_LOCATIONS]
+        if locations:
+            trajectory = np.array(locations, dtype=float)
+            self.__walkers[key][RADIUS_10] = int(TrajectoryMetrics.escape_steps(trajectory, 10, self.__origin))
+            self.__walkers[key][PASSED_Y] = TrajectoryMetrics.passed_y_counts(trajectory[:, X])
+            self.__walkers[key][FIRST_PASSAGE] = TrajectoryMetrics.first_passage_steps(
+                trajectory, self.__first_passage_thresholds, self.__origin)
+
+        if self.__instrumentation is not None:
+            self.__instrumentation.add_walker_time(type(walker).__name__, time.perf_counter() - start)
+            self.__instrumentation.counters['steps'] += len(locations)
+
+    def __move_with_retries(self, walker: Walker, max_attempts: int) -> bool:
+        """
+        Moves a walker by running it until its move does not collide with a barrier.
+
+        Parameters
+        ----------
+        walker : Walker
+            the walker to be moved
+        max_attempts : int
+            the maximum number of attempts to find a valid move for the walker
+
+        Returns
+        -------
+        bool
+            True if the walker moved, False if no valid move was found after the maximum number of attempts
+        """
+        # Initialize valid move flag and attempts counter
+        valid_move = False
+        attempts = 0
+
+        # Try to find a valid move for the walker
+        while not valid_move and attempts < max_attempts:
+            # Save the current position of the walker
+            walker.prev_position = walker.position
+
+            # Move the walker
+            walker.run()
+
+            # Check if the walker collided with a barrier
+            if self.__check_barrier_collision(walker, walker.position):
+                # If a collision occurred, reset the walker's position and increment the attempts counter
+                walker.position = walker.prev_position
+                attempts += 1
+                continue
+
+            # Check if the walker collided with a portal gate
+            if self.__check_portal_gate_collision(walker):
+                # If a collision occurred, the walker is teleported and the loop is exited
+                if self.__instrumentation is not None:
+                    self.__instrumentation.counters['teleports'] += 1
+                break
+
+            # If no collisions occurred, the move is valid
+            valid_move = True
+
+        # Every rejected draw was blocked by a barrier, and the step hit one if any was
+        if attempts and self.__instrumentation is not None:
+            self.__instrumentation.counters['rejected_attempts'] += attempts
+            self.__instrumentation.counters['barrier_hits'] += 1
+        return attempts < max_attempts
+
+    def __move_from_table(self, walker: Walker, lattice_moves: tuple, move_table: Dict) -> bool:
+        """
+        Moves a walker with fixed lattice moves by drawing once among the moves allowed from its position.
+
+        Retrying blocked moves until one is allowed draws a move with probability proportional to its probability
+        among the allowed moves, which is what a single draw from the allowed moves does directly.
+
+        Parameters
+        ----------
+        walker : Walker
+            the walker to be moved
+        lattice_moves : tuple
+            the (displacement, probability) pairs of the moves of the walker
+        move_table : dict
+            the memoized allowed moves of positions near obstacles for these lattice moves
+
+        Returns
+        -------
+        bool
+            True if the walker moved, False if no move is allowed from its position
+        """
+        position = walker.position
+        allowed_moves = move_table.get(position)
+        if allowed_moves is None:
+            allowed_moves = self.__allowed_moves(position, lattice_moves)
+            # Only positions near obstacles are memoized, the moves from the others are all allowed anyway
+            if allowed_moves is not None:
+                move_table[position] = allowed_moves
+            else:
+                allowed_moves = self.__free_moves(position, lattice_moves)
+
+        cumulative_probs, outcomes, teleports = allowed_moves
+        if self.__instrumentation is not None:
+            # The moves of the walker missing from the allowed ones are blocked by a barrier, they are never drawn
+            blocked = sum(1 for _, probability in lattice_moves if probability > 0) - len(outcomes)
+            if blocked:
+                self.__instrumentation.counters['blocked_moves'] += blocked
+                self.__instrumentation.counters['blocked_steps'] += 1
+        if not outcomes:
+            return False
+        draw = walker.rng.random() * cumulative_probs[-1]
+        move = min(bisect.bisect_right(cumulative_probs, draw), len(outcomes) - 1)
+        walker.prev_position = position
+        walker.position = outcomes[move]
+        if self.__instrumentation is not None and teleports[move]:
+            self.__instrumentation.counters['teleports'] += 1
+        return True
+
+    def __allowed_moves(self, position: Tuple[float, float, float],
+                        lattice_moves: tuple) -> Optional[Tuple[List[float], List[tuple], List[bool]]]:
+        """
+        Computes the moves allowed from a position near obstacles, and where each of them ends.
+
+        Parameters
+        ----------
+        position : tuple
+            the position to move from
+        lattice_moves : tuple
+            the (displacement, probability) pairs of the moves of the walker
+
+        Returns
+        -------
+        tuple or None
+            the cumulative probabilities of the allowed moves, their end positions after teleporting through portal
+            gates and whether they teleport, or None if no obstacle is close enough to the position to interfere with
+            any move
+        """
+        # The moves stay within reach of the position along each axis, an obstacle whose bounds do not overlap this
+        # box interferes with none of them. The index only returns candidates, every obstacle when the box spans more
+        # cells than there are non-empty ones, so the bounds are tested too
+        reach = max(max(abs(dx), abs(dy)) for (dx, dy, _), _ in lattice_moves)
+        near_box = BoundingBox(position[X] - reach, position[Y] - reach, position[X] + reach, position[Y] + reach)
+        if not any(obstacle.bounds.intersects_with(near_box)
+                   for index in (self.__barrier_index, self.__portal_gate_index)
+                   for obstacle in index.query_box(*near_box.bounds())):
+            return None
+
+        cumulative_probs: List[float] = []
+        outcomes: List[tuple] = []
+        teleports: List[bool] = []
+        total_prob = 0.0
+        for (dx, dy, dz), probability in lattice_moves:
+            if probability <= 0:
+                continue
+            new_position = (position[X] + dx, position[Y] + dy, position[Z] + dz)
+            # A move colliding with a barrier is never taken
+            if any(barrier.intersects_with_walker(position, new_position)
+                   for barrier in self.__barrier_index.query_segment(position, new_position)):
+                continue
+            # A move entering a portal gate ends at its destination
+            teleport = False
+            for portal_gate in self.__portal_gate_index.query_segment(position, new_position):
+                if portal_gate.intersects_with_walker(position, new_position):
+                    new_position = portal_gate.destination
+                    teleport = True
                     break
+            total_prob += probability
+            cumulative_probs.append(total_prob)
+            outcomes.append(new_position)
+            teleports.append(teleport)
+        return cumulative_probs, outcomes, teleports
 
-                # Add the walker's new position to its list of locations
-                self.__walkers[key][WALKER_LOCATIONS].append(walker.position)
+    @staticmethod
+    def __free_moves(position: Tuple[float, float, float],
+                     lattice_moves: tuple) -> Tuple[List[float], List[tuple], List[bool]]:
+        """
+        Computes the moves from a position away from obstacles, where every move is allowed.
 
-                # Check if the walker has passed the y-axis
-                self.__passed_y_axis(key)
+        Parameters
+        ----------
+        position : tuple
+            the position to move from
+        lattice_moves : tuple
+            the (displacement, probability) pairs of the moves of the walker
 
-                # Check if the walker has escaped a radius of 10 from the origin
-                if not is_escaped:
-                    is_escaped = self.__time_to_escape_radius_10(key, step)
+        Returns
+        -------
+        tuple
+            the cumulative probabilities of the moves of positive probability, their end positions and whether they
+            teleport, which they never do
+        """
+        cumulative_probs: List[float] = []
+        outcomes: List[tuple] = []
+        total_prob = 0.0
+        for (dx, dy, dz), probability in lattice_moves:
+            if probability <= 0:
+                continue
+            total_prob += probability
+            cumulative_probs.append(total_prob)
+            outcomes.append((position[X] + dx, position[Y] + dy, position[Z] + dz))
+        return cumulative_probs, outcomes, [False] * len(outcomes)
 
     def reset(self) -> None:
         """
         Resets the simulation to its initial state.
         """
         for walker_name, walker_info in self.__walkers.items():
-            walker_info[WALKER].position = self.origin
+            walker_info[WALKER].reset()
             walker_info[WALKER_LOCATIONS] = []
             walker_info[RADIUS_10] = 0
             walker_info[PASSED_Y] = []
-        self.__last_x_position = 0
-        self.__passed_y_counter = 0
+            walker_info[FIRST_PASSAGE] = []
@@ -1,6 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, filedialog
-from typing import Optional, Callable, Any, Dict
+from typing import Optional, Callable, Any, Dict, Tuple
+import threading
+import time
 from utils import Utils, MessageUtils, FileUtils
 from PIL import ImageTk, Image, ImageEnhance
 from Walker.biased_walker import BiasedWalker
@@ -12,6 +14,9 @@ from simulation_runner import SimulationRunner
 from obstacles_and_barriers import Barrier2D
 from portal_gate import PortalGate
 
+# Milliseconds between two updates of the progress of a running simulation
+PROGRESS_POLL_INTERVAL = 100
+
 
 class EntryFrame(tk.Frame):
     # Used to allow pairing of ttk.Entry with a tk.Frame
@@ -237,6 +242,9 @@ class SimulationGUI:
         """
         Add an obstacle to the simulation.
         """
+        if self.controller.running:
+            MessageUtils.show_error("Error", "Wait for the running simulation to finish!")
+            return
         obstacle_type = self.obstacle_type.get()
         if not obstacle_type:
             MessageUtils.show_error("Error", "Please select an obstacle type!")
@@ -301,6 +309,9 @@ class SimulationGUI:
         """
         Removes the selected obstacle from the simulation and the GUI.
         """
+        if self.controller.running:
+            MessageUtils.show_error("Error", "Wait for the running simulation to finish!")
+            return
         # Get the selected obstacle from the obstacle table
         selected_items = self.obstacle_table.selection()
         # If no obstacle is selected, show an error message and return
@@ -543,7 +554,19 @@ class SimulationGUI:
         self.run_button = GuiHelper.create_styled_button(self.simulation_frame,
                                                          text="Run Simulation", command=self.run_simulation)
         # Position the button in the grid
-        self.run_button.grid(row=5, column=0, columnspan=2, padx=5, pady=5)
+        self.run_button.grid(row=5, column=0, padx=5, pady=5)
+
+        # Create a button for cancelling a running simulation, which keeps the simulations completed so far
+        self.cancel_button = GuiHelper.create_styled_button(self.simulation_frame, text="Cancel",
+                                                            command=self.cancel_simulation, state=tk.DISABLED)
+        self.cancel_button.grid(row=5, column=1, padx=5, pady=5)
+
+        # Create a progress bar and a label for the progress of a running simulation
+        self.progress_bar = ttk.Progressbar(self.simulation_frame, orient=tk.HORIZONTAL, length=200,
+                                            mode='determinate')
+        self.progress_bar.grid(row=6, column=0, columnspan=2, padx=5, pady=(5, 0))
+        self.progress_label = tk.Label(self.simulation_frame, text="")
+        self.progress_label.grid(row=7, column=0, columnspan=2, padx=5)
 
         # Create a button for opening the help file
         self.help_button = GuiHelper.create_styled_button(self.help_button_frame, text="Help",
@@ -561,6 +584,9 @@ class SimulationGUI:
         """
         Add a walker to the simulation.
         """
+        if self.controller.running:
+            MessageUtils.show_error("Error", "Wait for the running simulation to finish!")
+            return
         # Get the walker type and count from the GUI inputs
         walker_type = self.walker_type.get()
         walker_count_str = self.walker_count.get()
@@ -631,6 +657,9 @@ class SimulationGUI:
         """
         Remove a walker from the simulation.
         """
+        if self.controller.running:
+            MessageUtils.show_error("Error", "Wait for the running simulation to finish!")
+            return
         # Get the selected items from the walker table
         selected_items = self.walker_table.selection()
         if not selected_items:
@@ -672,20 +701,64 @@ class SimulationGUI:
             MessageUtils.show_error("Error", "Number of steps must be a positive integer!")
             return
 
+        if self.controller.running:
+            MessageUtils.show_error("Error", "A simulation is already running!")
+            return
+
         # Check if there is at least one walker
         total_walkers = sum(self.controller.walkers.values())
         if total_walkers == 0:
             MessageUtils.show_error("Error", "There must be at least one walker!")
             return
 
-        # Convert the number of simulations and steps to integers and run the simulation
+        # Convert the number of simulations and steps to integers and run the simulation in the background
         num_simulations = int(num_simulations_str)
         num_steps = int(num_steps_str)
         stats_path = self.stats_path.cget("text")
         if stats_path:  # Check if stats_path is not empty
-            self.controller.run_simulation(num_simulations, num_steps, stats_path)
+            started = self.controller.run_simulation(num_simulations, num_steps, stats_path)
         else:
-            self.controller.run_simulation(num_simulations, num_steps)  # If stats_path is empty
+            started = self.controller.run_simulation(num_simulations, num_steps)  # If stats_path is empty
+        if started:
+            self.run_button.config(state=tk.DISABLED)
+            self.cancel_button.config(state=tk.NORMAL)
+            self.progress_bar.config(maximum=num_simulations, value=0)
+            self.progress_label.config(text=f"0/{num_simulations} simulations")
+            self.root.after(PROGRESS_POLL_INTERVAL, self.poll_simulation)
+
+    def poll_simulation(self):
+        """
+        Update the progress bar and the estimated time left of the running simulation, and finish the simulation
+        once its background thread is done. Called periodically from the Tk event loop while a simulation runs.
+        """
+        completed, total = self.controller.progress
+        self.progress_bar.config(value=completed)
+        status = f"{completed}/{total} simulations"
+        if self.controller.cancelled:
+            status += ", cancelling..."
+        elif completed:
+            elapsed = time.monotonic() - self.controller.start_time
+            minutes, seconds = divmod(round(elapsed * (total - completed) / completed), 60)
+            status += f", {minutes}:{seconds:02d} left"
+        self.progress_label.config(text=status)
+
+        if self.controller.running:
+            self.root.after(PROGRESS_POLL_INTERVAL, self.poll_simulation)
+            return
+
+        self.run_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_label.config(text="")
+        self.progress_bar.config(value=0)
+        self.controller.finish_simulation()
+
+    def cancel_simulation(self):
+        """
+        Cancel the running simulation. The statistics of the simulations completed so far are still saved and
+        plotted.
+        """
+        self.controller.cancel_simulation()
+        self.cancel_button.config(state=tk.DISABLED)
 
     def __clear_obstacle_entry_fields(self):
         """
@@ -743,13 +816,26 @@ class SimulationController:
     It manages the walkers, barriers, and portal gates in the simulation.
     """
 
-    def __init__(self):
+    def __init__(self, profile_path: Optional[str] = None, trajectory_dir: Optional[str] = None):
         """
         Initializes a new instance of the SimulationController class.
+
+        Args:
+            profile_path (Optional[str]): The path to save a cProfile profile of every run to, without the GUI main
+             loop. Defaults to None, which profiles nothing.
+            trajectory_dir (Optional[str]): The directory to keep the trajectories in as memory-mapped files.
+             Defaults to None, which keeps them in memory.
         """
-        self.model = SimulationRunner()  # The simulation runner
+        self.model = SimulationRunner(profile_path=profile_path, trajectory_dir=trajectory_dir)  # The simulation runner
         self.view = None  # The GUI view
         self.walkers = {}  # Dictionary to keep track of the walkers added to the simulation
+        self.worker = None  # The background thread running the simulations
+        self.cancel_event = threading.Event()  # Set to cancel the running simulations
+        self.start_time = 0.0  # The time.monotonic() at which the running simulations started
+        self.completed = 0  # The number of simulations completed by the last run
+        self.error = None  # The exception raised by the last run, if any
+        self.stats_path = 'stats.json'  # The path to save the statistics of the running simulations to
+        self.__progress = (0, 0)  # The completed and total number of the running simulations
         # Create a dictionary that maps the walker types to their respective classes
         self.walker_classes = {
             'BiasedWalker': BiasedWalker,
@@ -870,21 +956,106 @@ class SimulationController:
                     self.model.simulation.remove_walker(key)  # Remove the walker from the simulation
             del self.walkers[walker_type]  # Remove the walker type from the dictionary
 
-    def run_simulation(self, num_simulations: int, num_steps: int, stats_path: Optional[str] = 'stats.json'):
+    @property
+    def running(self) -> bool:
+        """
+        Whether simulations are running in the background.
+        """
+        return self.worker is not None and self.worker.is_alive()
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Whether the running simulations were cancelled.
+        """
+        return self.cancel_event.is_set()
+
+    @property
+    def progress(self) -> Tuple[int, int]:
         """
-        Runs the simulation for the specified number of simulations and steps.
+        The completed and total number of the running simulations.
+        """
+        return self.__progress
+
+    def run_simulation(self, num_simulations: int, num_steps: int, stats_path: Optional[str] = 'stats.json') -> bool:
+        """
+        Starts running the simulation for the specified number of simulations and steps in a background thread, so
+        the GUI stays responsive. The view polls the progress and calls finish_simulation once the thread is done.
 
         Args:
             num_simulations (int): The number of simulations to run.
             num_steps (int): The number of steps per simulation.
             stats_path (str): The path to save the statistics.
+
+        Returns:
+            bool: True if the simulation was started, False otherwise.
         """
         if not self.model.simulation.walkers:
             MessageUtils.show_error("Error", "There must be at least one walker!")
-            return
-        self.model.run_simulation(num_simulations, num_steps, stats_path)
+            return False
+        if self.running:
+            MessageUtils.show_error("Error", "A simulation is already running!")
+            return False
+
+        self.stats_path = stats_path
+        self.cancel_event = threading.Event()
+        self.completed = 0
+        self.error = None
+        self.__progress = (0, num_simulations)
+        self.start_time = time.monotonic()
+        self.worker = threading.Thread(target=self.__simulate, args=(num_simulations, num_steps), daemon=True)
+        self.worker.start()
+        return True
+
+    def __simulate(self, num_simulations: int, num_steps: int):
+        """
+        Runs the simulations in the background thread. Only the runner is touched here, Tk is left to the main thread.
+        """
+        try:
+            self.completed = self.model.simulate(num_simulations, num_steps, progress=self.__update_progress,
+                                                 cancel_event=self.cancel_event)
+        except Exception as e:
+            self.error = e
+
+    def __update_progress(self, completed: int, total: int):
+        """
+        Records the progress of the running simulations, for the view to poll.
+        """
+        self.__progress = (completed, total)
+
+    def cancel_simulation(self):
+        """
+        Cancels the running simulations, the ones completed so far are kept.
+        """
+        self.cancel_event.set()
 
-        MessageUtils.show_message("Simulation", "Simulation completed!")
+    def finish_simulation(self):
+        """
+        Saves and plots the statistics of the simulations completed by the background thread, then resets the
+        simulation and the GUI. Must be called from the main thread once the thread is done.
+        """
+        self.worker = None
+        if self.error is not None:
+            MessageUtils.show_error("Error", f"The simulation failed: {self.error}")
+            self.model.reset()
+        elif self.completed == 0:
+            MessageUtils.show_message("Simulation", "Simulation cancelled before any simulation completed.")
+            self.model.reset()
+        else:
+            total = self.__progress[1]
+            try:
+                self.model.report(self.stats_path)
+            except OSError as e:
+                MessageUtils.show_error("Error", f"Error: Cannot save the statistics json file to {self.stats_path}. "
+                                                 f"{e.strerror}. Please enter a valid path.")
+                self.model.reset()
+            else:
+                if self.completed < total:
+                    MessageUtils.show_message("Simulation", f"Simulation cancelled, the statistics of the "
+                                                            f"{self.completed} of {total} completed simulations "
+                                                            f"were saved.")
+                else:
+                    MessageUtils.show_message("Simulation", "Simulation completed!")
         # Reset the GUI parameters
-        self.walkers= {}
+        self.walkers = {}
         self.view.reset_gui()
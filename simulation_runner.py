@@ -1,7 +1,24 @@
-from simulation import Simulation
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import nullcontext
+from multiprocessing import Manager
+from typing import Callable, ContextManager, Optional, Sequence, Tuple, Union
+import math
+import os
+import threading
+from instrumentation import Instrumentation
+from profiling import RunProfiler
+from simulation import Simulation, BATCH_ELEMENTS
 from my_statistics import Statistics
-from Graph import Graph
+from statistics_accumulator import StatisticsAccumulator
 from statistics_exporter import StatisticsExporter
+from trajectory_store import TrajectoryStore
+
+# Shards submitted per worker process, so a slow shard does not leave the other workers idle at the end of a run
+SHARDS_PER_WORKER = 4
+# Chunks a stepped run in the current process is split into, the granularity at which it can be cancelled
+CHUNKS_PER_RUN = 100
+# Seconds between checks for a cancellation while waiting for a shard of a worker process
+CANCEL_POLL_INTERVAL = 0.1
 
 
 class SimulationRunner:
@@ -16,21 +33,59 @@ class SimulationRunner:
         an instance of the Simulation class which contains the simulation to be run
     statistics : Statistics
         an instance of the Statistics class which contains the statistics of the simulation
+    seed : int, optional
+        the master seed every simulation run derives its random number streams from, None for a fresh seed
+    retain_trajectories : bool
+        whether the trajectories of every simulation are kept, or only the running sums the statistics need
+    trajectory_dir : str, optional
+        the directory the trajectories are kept in as memory-mapped files, None to keep them in memory
+    instrumentation : Instrumentation
+        the time of every phase and walker type and the counters of the current run, None if it is not instrumented
+    profiler : RunProfiler
+        the profiler of the current run, None if it is not profiled
 
     Methods
     -------
-    run():
-        Runs the simulation.
+    run_simulation(num_simulations, num_steps, json_path, workers, plot):
+        Runs the simulations, then saves and plots their statistics.
+    simulate(num_simulations, num_steps, workers, progress, cancel_event):
+        Runs the simulations and collects their results, so it can be called from a background thread.
+    report(json_path, plot):
+        Saves and plots the statistics of the simulations run so far, and resets the runner.
+    reset():
+        Resets the runner for a new scenario.
     """
 
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None, retain_trajectories: bool = True, instrument: bool = False,
+                 profile_path: Optional[str] = None, trajectory_dir: Optional[str] = None):
         """
         Constructs all the necessary attributes for the SimulationRunner object.
+
+        Args:
+            seed (Optional[int]): The master seed of the simulations, a fresh seed is drawn for every run if None.
+            retain_trajectories (bool): Whether the trajectories of every simulation are kept. If False, the memory
+             of a run does not grow with the number of simulations, and only the first simulation can be plotted.
+             Defaults to True.
+            instrument (bool): Whether to record the time of every phase and walker type and count the steps,
+             collisions, teleports and abandoned walkers of every run, saved by report() next to the statistics.
+             Defaults to False.
+            profile_path (Optional[str]): The path to save a cProfile profile of every run to, in the pstats format.
+             Only the simulations, the statistics, their export and the rendering are profiled, the worker processes
+             included, not the GUI or the plot windows. Defaults to None, which profiles nothing.
+            trajectory_dir (Optional[str]): The directory to keep the retained trajectories in as memory-mapped
+             files, which are deleted with the statistics, so the size of a run is bounded by the disk rather than
+             the memory. Defaults to None, which keeps them in memory.
         """
-        self.simulation = Simulation()  # Initialize a new Simulation object
-        self.statistics = Statistics()  # Initialize a new Statistics object
+        self.seed = seed
+        self.retain_trajectories = retain_trajectories
+        self.instrument = instrument
+        self.profile_path = profile_path
+        self.trajectory_dir = trajectory_dir
+        self.reset()
 
-    def run_simulation(self, num_simulations: int, num_steps: int, json_path: str):
+    def run_simulation(self, num_simulations: int, num_steps: int, json_path: str, workers: int = 1,
+                       plot: bool = True, figures_dir: Optional[str] = None,
+                       figure_formats: Sequence[str] = ('png',)) -> str:
         """
         Runs the simulation for a specified number of steps and simulations, calculates statistics,
          saves the statistics to a JSON file, and plots graphs.
@@ -39,45 +94,374 @@ class SimulationRunner:
             num_simulations (int): The number of simulations to run.
             num_steps (int): The number of steps per simulation.
             json_path (str): The path to the JSON file to save the statistics to. Defaults to 'stats.json'.
+            workers (int): The number of worker processes to run the simulations in. Defaults to 1, which runs them
+             in the current process.
+            plot (bool): Whether to plot the graphs, which headless runs turn off. Defaults to True.
+            figures_dir (Optional[str]): The directory to render the graphs to as image files, without opening any
+             window. Defaults to None, which renders no files.
+            figure_formats (Sequence[str]): The formats of the rendered images. Defaults to PNG only.
+
+        Returns:
+            str: The path the statistics were saved to.
+
+        Raises:
+            OSError: If the statistics cannot be saved.
+        """
+        self.simulate(num_simulations, num_steps, workers)
+        return self.report(json_path, plot, figures_dir, figure_formats, workers)
+
+    def simulate(self, num_simulations: int, num_steps: int, workers: int = 1,
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 cancel_event: Optional[threading.Event] = None) -> int:
+        """
+        Runs the simulations and collects their results in the statistics, without saving or plotting them.
+
+        The run only touches the runner, so it can be executed in a background thread while the caller keeps
+        reporting its progress. When it is cancelled the simulations completed so far are kept, and report() saves
+        and plots their statistics.
+
+        Args:
+            num_simulations (int): The number of simulations to run.
+            num_steps (int): The number of steps per simulation.
+            workers (int): The number of worker processes to run the simulations in. Defaults to 1, which runs them
+             in the current process.
+            progress (Optional[Callable[[int, int], None]]): Called with the number of completed simulations and the
+             total number of simulations as the run progresses. Defaults to None.
+            cancel_event (Optional[threading.Event]): Stops the run once set, within a chunk of simulations in the
+             current process or a shard in the worker processes. Defaults to None.
+
+        Returns:
+            int: The number of completed simulations, fewer than num_simulations if the run was cancelled.
         """
         self.statistics.num_of_steps = num_steps
-        barriers_dict = self.simulation.barriers
-        portal_gates_dict = self.simulation.portal_gates
-        # Run the simulation for the specified number of steps and simulations
-        for i in range(1, num_simulations + 1):
-            self.simulation.simulate(num_steps)
-            self.statistics.add_simulation(f"Simulation {i}", self.simulation)  # Add the simulation to the statistics
-            self.simulation.reset()  # Reset the simulation for the next run
+        with self.__profiled(), self.__phase('simulation'):
+            if workers > 1:
+                return self.__run_in_processes(num_simulations, num_steps, workers, progress, cancel_event)
+            return self.__run_in_process(num_simulations, num_steps, progress, cancel_event)
+
+    def __run_in_process(self, num_simulations: int, num_steps: int,
+                         progress: Optional[Callable[[int, int], None]] = None,
+                         cancel_event: Optional[threading.Event] = None) -> int:
+        """
+        Runs the simulations in the current process, in chunks so that the run can be cancelled.
+
+        Args:
+            num_simulations (int): The number of simulations to run.
+            num_steps (int): The number of steps per simulation.
+            progress (Optional[Callable[[int, int], None]]): Called with the number of completed simulations and the
+             total number of simulations after every simulation. Defaults to None.
+            cancel_event (Optional[threading.Event]): Stops the run once set. Defaults to None.
+
+        Returns:
+            int: The number of completed simulations.
+        """
+        self.simulation.instrumentation = self.instrumentation
+        store = self.statistics.reserve(self.simulation, num_simulations)
+        return SimulationRunner.__simulate_chunks(self.simulation, store, 1, num_simulations, num_steps, progress,
+                                                  cancel_event)
+
+    @staticmethod
+    def __simulate_chunks(simulation: Simulation, store: Union[TrajectoryStore, StatisticsAccumulator],
+                          first_simulation: int, num_simulations: int, num_steps: int,
+                          progress: Optional[Callable[[int, int], None]] = None,
+                          cancel_event: Optional[threading.Event] = None) -> int:
+        """
+        Runs a contiguous range of simulations into a store, in chunks so that the run can be cancelled between them.
+
+        Args:
+            simulation (Simulation): The scenario to simulate.
+            store (Union[TrajectoryStore, StatisticsAccumulator]): The store, or the accumulator, to write the
+             simulations into.
+            first_simulation (int): The 1-based index of the first simulation.
+            num_simulations (int): The number of simulations to run.
+            num_steps (int): The number of steps per simulation.
+            progress (Optional[Callable[[int, int], None]]): Called with the index of every completed simulation and
+             the number of simulations. Defaults to None.
+            cancel_event (Optional[threading.Event]): Stops the run at the end of the current chunk once set, the
+             completed chunks are kept in the store. Defaults to None.
+
+        Returns:
+            int: The number of completed simulations, the first ones of the range.
+        """
+        # Run the simulation for the specified number of steps and simulations, the walkers' vectorized engines
+        # are used when no barriers or portal gates are present and the step loop is used otherwise. The results
+        # are written straight into the store. Every simulation draws from the random number streams of its own
+        # index, so splitting the run into chunks does not change the results. A chunk of a vectorized run is a
+        # whole block of the engines, which are fast enough to cancel between blocks
+        chunk_size = math.ceil(num_simulations / CHUNKS_PER_RUN)
+        if simulation.vectorized:
+            chunk_size = max(chunk_size, BATCH_ELEMENTS // num_steps)
+        completed = 0
+        while completed < num_simulations and not (cancel_event is not None and cancel_event.is_set()):
+            chunk_simulations = min(chunk_size, num_simulations - completed)
+            for simulation_index in simulation.simulate_batch(chunk_simulations, num_steps,
+                                                              first_simulation=first_simulation + completed,
+                                                              store=store):
+                simulation.reset()  # Reset the simulation for the next run
+                if progress is not None:
+                    progress(simulation_index, num_simulations)
+            completed += chunk_simulations
+        return completed
+
+    def report(self, json_path: str, plot: bool = True, figures_dir: Optional[str] = None,
+               figure_formats: Sequence[str] = ('png',), workers: int = 1) -> str:
+        """
+        Calculates the statistics of the simulations run so far, saves them to a JSON file, plots graphs and resets
+        the runner.
+
+        Args:
+            json_path (str): The path to the JSON file to save the statistics to.
+            plot (bool): Whether to plot the graphs, in a single dashboard window. Defaults to True.
+            figures_dir (Optional[str]): The directory to render the graphs to as image files, a dashboard, one
+             image per graph and, if the trajectories are retained, the visit densities of the walkers over all
+             simulations, without opening any window. Defaults to None, which renders no files.
+            figure_formats (Sequence[str]): The formats of the rendered images, such as 'png' or 'svg'. Defaults to
+             PNG only.
+            workers (int): The number of worker processes rendering the images. Defaults to 1.
+
+        Returns:
+            str: The path the statistics were saved to.
+
+        Raises:
+            OSError: If the statistics cannot be saved, in which case nothing is plotted and the runner is not reset.
+        """
+        with self.__profiled():
+            saved_path = self.__save_statistics(json_path)
+
+            # Render graphs
+            if plot or figures_dir:
+                # Imported here so that headless runs and worker processes do not load matplotlib, seaborn and pandas
+                from Graph import Graph
+                # Initialize a new Graph object
+                g = Graph(self.statistics, self.simulation.barriers, self.simulation.portal_gates)
+                if figures_dir:
+                    with self.__phase('rendering'):
+                        g.render(figures_dir, figure_formats, density=self.retain_trajectories, workers=workers)
+
+        # Plot graphs, out of the profile as the dashboard waits on its window
+        if plot:
+            with self.__phase('plotting'):
+                g.plot_dashboard()
+
+        # Save the time and counters of the run next to the statistics, the plotting time included, and its profile
+        if self.instrumentation is not None:
+            self.instrumentation.save(self.__report_path(saved_path),
+                                      num_simulations=self.statistics.get_total_simulations,
+                                      num_steps=self.statistics.num_of_steps, workers=workers)
+        if self.profiler is not None:
+            self.profiler.save()
+
+        # Resets simulation runner parameters entirely
+        self.reset()
+        return saved_path
 
+    def __save_statistics(self, json_path: str) -> str:
+        """
+        Calculates the statistics of the simulations run so far and saves them to a JSON file.
+
+        Args:
+            json_path (str): The path to the JSON file to save the statistics to.
+
+        Returns:
+            str: The path the statistics were saved to.
+        """
         # Calculate statistics
-        self.statistics.calculate_average_locations_per_step()
-        average_distance_from_origin = self.statistics.calculate_average_distance_from_origin()
-        distances_from_axis_x = self.statistics.calculate_distances_from_axis(axis='Y')
-        distances_from_axis_y = self.statistics.calculate_distances_from_axis(axis='X')
-        escape_radius_10_stats = self.statistics.calculate_escape_radius_10()
-        passed_y_stats = self.statistics.calculate_average_passed_y()
-        average_lead_count = self.statistics.calculate_average_leads()
+        with self.__phase('statistics'):
+            self.statistics.calculate_average_locations_per_step()
+            average_distance_from_origin = self.statistics.calculate_average_distance_from_origin()
+            distances_from_axis_x = self.statistics.calculate_distances_from_axis(axis='Y')
+            distances_from_axis_y = self.statistics.calculate_distances_from_axis(axis='X')
+            escape_radius_10_stats = self.statistics.calculate_escape_radius_10()
+            passed_y_stats = self.statistics.calculate_average_passed_y()
+            first_passage_stats = self.statistics.calculate_first_passage_times()
+        with self.__phase('lead_counts'):
+            average_lead_count = self.statistics.calculate_average_leads()
 
         # Save statistics to JSON file
-        stats_exporter = StatisticsExporter()  # Initialize a new StatisticsExporter object
-        stats_exporter.add_data('average_distance_from_origin', average_distance_from_origin)
-        stats_exporter.add_data('distances_from_axis_x', distances_from_axis_x)
-        stats_exporter.add_data('distances_from_axis_y', distances_from_axis_y)
-        stats_exporter.add_data('escape_radius_10_stats', escape_radius_10_stats)
-        stats_exporter.add_data('passed_y_stats', passed_y_stats)
-        stats_exporter.add_data('average lead count', average_lead_count)
-        stats_exporter.save_to_json(json_path)  # Save the statistics to a JSON file
-
-        # Plot graphs
-        g = Graph(self.statistics, barriers_dict, portal_gates_dict)  # Initialize a new Graph object
-        g.plot_single_simulation()  # Plot the first simulation
-        g.plot_average_distance_from_origin()
-        g.plot_distances_from_axis(axis='X')
-        g.plot_distances_from_axis(axis='Y')
-        g.plot_escape_radius_10()
-        g.plot_average_passed_y()
-        g.plot_lead_counts()
+        with self.__phase('export'):
+            stats_exporter = StatisticsExporter()  # Initialize a new StatisticsExporter object
+            stats_exporter.add_data('average_distance_from_origin', average_distance_from_origin)
+            stats_exporter.add_data('distances_from_axis_x', distances_from_axis_x)
+            stats_exporter.add_data('distances_from_axis_y', distances_from_axis_y)
+            stats_exporter.add_data('escape_radius_10_stats', escape_radius_10_stats)
+            stats_exporter.add_data('passed_y_stats', passed_y_stats)
+            stats_exporter.add_data('average lead count', average_lead_count)
+            if self.simulation.first_passage_thresholds:
+                stats_exporter.add_data('first_passage_stats', first_passage_stats)
+            saved_path = stats_exporter.save_to_json(json_path)  # Save the statistics to a JSON file
+        return saved_path
 
-        # Resets simulation runner parameters entirely
-        self.simulation = Simulation()
-        self.statistics = Statistics()
+    def reset(self) -> None:
+        """
+        Resets the runner for a new scenario, discarding its walkers, obstacles and statistics.
+        """
+        self.simulation = Simulation(self.seed)  # Initialize a new Simulation object
+        # Initialize a new Statistics object
+        self.statistics = Statistics(self.retain_trajectories, self.trajectory_dir)
+        self.instrumentation = Instrumentation() if self.instrument else None
+        self.profiler = RunProfiler(self.profile_path) if self.profile_path else None
+
+    def __phase(self, name: str) -> ContextManager:
+        """
+        Times a block as a phase of the run when the runner is instrumented.
+
+        Args:
+            name (str): The name of the phase.
+
+        Returns:
+            ContextManager: The context manager timing the block, one doing nothing if the runner is not
+            instrumented.
+        """
+        return self.instrumentation.phase(name) if self.instrumentation is not None else nullcontext()
+
+    def __profiled(self) -> ContextManager:
+        """
+        Profiles a block when the runner is profiled.
+
+        Returns:
+            ContextManager: The context manager profiling the block, one doing nothing if the runner is not profiled.
+        """
+        return self.profiler.profile() if self.profiler is not None else nullcontext()
+
+    @staticmethod
+    def __report_path(json_path: str) -> str:
+        """
+        Returns the path of the instrumentation report of a statistics file, such as stats_report.json for
+        stats.json.
+
+        Args:
+            json_path (str): The path the statistics were saved to.
+
+        Returns:
+            str: The path of the instrumentation report, in the same directory.
+        """
+        return f"{os.path.splitext(json_path)[0]}_report.json"
+
+    def __run_in_processes(self, num_simulations: int, num_steps: int, workers: int,
+                           progress: Optional[Callable[[int, int], None]] = None,
+                           cancel_event: Optional[threading.Event] = None) -> int:
+        """
+        Runs the simulations in a pool of worker processes and merges their statistics.
+
+        The simulations are split into contiguous shards which are shipped to the workers together with a copy of the
+        scenario. Every simulation draws from the random number streams of its own index, so the results match a
+        run in the current process, and the shards are merged in simulation order whatever order they complete in.
+        When the trajectories are not retained, the workers only send back the partial statistics of their shards,
+        and when they are kept in files, the workers write them into the files in place.
+        A cancelled run drops the shards that have not started and stops the running ones at the end of their
+        current chunk. The shards are kept up to the first one left incomplete, so that the kept simulations are the
+        first ones of the run.
+
+        Args:
+            num_simulations (int): The number of simulations to run.
+            num_steps (int): The number of steps per simulation.
+            workers (int): The number of worker processes.
+            progress (Optional[Callable[[int, int], None]]): Called with the number of completed simulations and the
+             total number of simulations after every merged shard. Defaults to None.
+            cancel_event (Optional[threading.Event]): Stops the run once set. Defaults to None.
+
+        Returns:
+            int: The number of completed simulations.
+        """
+        shard_size = math.ceil(num_simulations / (workers * SHARDS_PER_WORKER))
+        shards = [(first_simulation, min(shard_size, num_simulations + 1 - first_simulation))
+                  for first_simulation in range(1, num_simulations + 1, shard_size)]
+
+        store = self.statistics.reserve(self.simulation, num_simulations)
+        # The shards of a store kept in files write their trajectories into it in place, from their first slot on
+        shared_store = store if isinstance(store, TrajectoryStore) and store.directory is not None else None
+        shards_first_slot = len(store)
+        completed = 0
+        merged_shards = 0
+        # A cancellation is passed on to the workers through an event of a manager process, only started when the run
+        # can be cancelled
+        with Manager() if cancel_event is not None else nullcontext() as manager, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            shard_cancel_event = manager.Event() if manager is not None else None
+            futures = [executor.submit(SimulationRunner._run_shard, self.simulation, first_simulation,
+                                       shard_simulations, num_steps, self.retain_trajectories,
+                                       self.instrumentation is not None,
+                                       self.profiler.shard_path(first_simulation) if self.profiler else None,
+                                       shared_store.shard(shards_first_slot + first_simulation - 1)
+                                       if shared_store is not None else None, shard_cancel_event)
+                       for first_simulation, shard_simulations in shards]
+            for future, (first_simulation, shard_simulations) in zip(futures, shards):
+                # Wait for the shard in short slices, so that a cancellation is noticed while it runs
+                while not future.done() and not (cancel_event is not None and cancel_event.is_set()):
+                    wait([future], timeout=CANCEL_POLL_INTERVAL)
+                if cancel_event is not None and cancel_event.is_set() and not shard_cancel_event.is_set():
+                    # Drop the shards not started, and stop the running ones at the end of their current chunk. The pool
+                    # waits for them on exit, before the manager shuts down
+                    shard_cancel_event.set()
+                    for pending_future in futures:
+                        pending_future.cancel()
+                if future.cancelled():
+                    break
+                statistics, instrumentation, shard_completed = future.result()
+                with self.__phase('merge'):
+                    self.statistics.merge(statistics)
+                if instrumentation is not None:
+                    self.instrumentation.merge(instrumentation)
+                if self.profiler is not None:
+                    self.profiler.add_shard(self.profiler.shard_path(first_simulation))
+                completed += shard_completed
+                merged_shards += 1
+                if progress is not None:
+                    progress(completed, num_simulations)
+                if shard_completed < shard_simulations:
+                    break
+
+        # The shards left unmerged by a cancellation have finished with the pool, their profiles are dropped
+        if self.profiler is not None:
+            for first_simulation, _ in shards[merged_shards:]:
+                if os.path.exists(self.profiler.shard_path(first_simulation)):
+                    os.remove(self.profiler.shard_path(first_simulation))
+        return completed
+
+    @staticmethod
+    def _run_shard(simulation: Simulation, first_simulation: int, num_simulations: int, num_steps: int,
+                   retain_trajectories: bool = True, instrument: bool = False, profile_path: Optional[str] = None,
+                   store: Optional[TrajectoryStore] = None, cancel_event: Optional[threading.Event] = None
+                   ) -> Tuple[Union[Statistics, TrajectoryStore, StatisticsAccumulator], Optional[Instrumentation],
+                              int]:
+        """
+        Runs a contiguous range of simulations and collects their statistics, in a worker process.
+
+        Args:
+            simulation (Simulation): A copy of the scenario to simulate.
+            first_simulation (int): The 1-based index of the first simulation of the shard.
+            num_simulations (int): The number of simulations in the shard.
+            num_steps (int): The number of steps per simulation.
+            retain_trajectories (bool): Whether to return the trajectories of the shard, or only its partial
+             statistics. Defaults to True.
+            instrument (bool): Whether to record the time and the counters of the shard. Defaults to False.
+            profile_path (Optional[str]): The path to save the profile of the shard to. Defaults to None, which
+             profiles nothing.
+            store (Optional[TrajectoryStore]): A shard of the store of the run, kept in files, to write the
+             trajectories into in place. Defaults to None, which collects them in the worker.
+            cancel_event (Optional[threading.Event]): An event shared with the parent process, which stops the shard
+             at the end of its current chunk once set. Defaults to None.
+
+        Returns:
+            Tuple[Union[Statistics, TrajectoryStore, StatisticsAccumulator], Optional[Instrumentation], int]: The
+            statistics of the completed simulations of the shard, the shard of the store if one was given, or their
+            partial statistics if the trajectories are not retained, the instrumentation of the shard, None if it is
+            not instrumented, and the number of completed simulations, fewer than num_simulations if it was
+            cancelled.
+        """
+        instrumentation = Instrumentation() if instrument else None
+        simulation.instrumentation = instrumentation
+        statistics = Statistics(retain_trajectories)
+        statistics.num_of_steps = num_steps
+        profiler = RunProfiler(profile_path) if profile_path else None
+        with profiler.profile() if profiler else nullcontext(), \
+                instrumentation.phase('shard_simulation') if instrument else nullcontext():
+            shard_store = store if store is not None else statistics.reserve(simulation, num_simulations)
+            completed = SimulationRunner.__simulate_chunks(simulation, shard_store, first_simulation, num_simulations,
+                                                           num_steps, cancel_event=cancel_event)
+        if profiler is not None:
+            profiler.save()
+        if store is not None:
+            store.flush()
+            return store, instrumentation, completed
+        return statistics if retain_trajectories else statistics.partial(), instrumentation, completed
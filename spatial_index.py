@@ -0,0 +1,184 @@
+from typing import Dict, List, Set, Tuple
+import math
+from obstacles_and_barriers import Obstacle
+
+X = 0  # Index for x-coordinate in a tuple
+Y = 1  # Index for y-coordinate in a tuple
+
+
+class SpatialGrid:
+    """
+    A class used to represent a uniform grid index over obstacles.
+
+    Every cell of the grid lists the obstacles whose bounds overlap it, so a query only tests the obstacles of the
+    few cells the queried area touches instead of every obstacle. Obstacles that would span too many cells are kept
+    in a separate list that every query includes.
+
+    ...
+
+    Attributes
+    ----------
+    __cell_size : float
+        the side length of a grid cell
+    __max_cells_per_obstacle : int
+        the number of cells above which an obstacle is not added to the cells
+    __cells : dict
+        a dictionary mapping the (column, row) of each non-empty cell to the names of the obstacles overlapping it
+    __oversized : set
+        the names of the obstacles that are too large to be added to the cells
+    __obstacles : dict
+        a dictionary of the indexed obstacles, in insertion order
+    __order : dict
+        a dictionary mapping the name of each obstacle to its insertion rank
+
+    Methods
+    -------
+    insert(name, obstacle):
+        Adds an obstacle to the index.
+    remove(name):
+        Removes an obstacle from the index.
+    query_box(min_x, min_y, max_x, max_y):
+        Returns the obstacles that may overlap an axis-aligned box.
+    query_segment(start, end):
+        Returns the obstacles that may intersect the segment of a step.
+    """
+
+    def __init__(self, cell_size: float = 2.0, max_cells_per_obstacle: int = 4096):
+        """
+        Constructs all the necessary attributes for the SpatialGrid object.
+
+        Parameters
+        ----------
+            cell_size : float
+                the side length of a grid cell, a step of the walkers should span few cells (default is 2.0)
+            max_cells_per_obstacle : int
+                the number of cells above which an obstacle is checked by every query instead (default is 4096)
+        """
+        self.__cell_size = cell_size
+        self.__max_cells_per_obstacle = max_cells_per_obstacle
+        self.__cells: Dict[Tuple[int, int], Set[str]] = {}
+        self.__oversized: Set[str] = set()
+        self.__obstacles: Dict[str, Obstacle] = {}
+        self.__order: Dict[str, int] = {}
+        self.__next_order = 0
+
+    def __len__(self) -> int:
+        return len(self.__obstacles)
+
+    def __cell_range(self, min_x: float, min_y: float, max_x: float, max_y: float) -> Tuple[range, range]:
+        """
+        Returns the columns and rows of the cells overlapping an axis-aligned box.
+
+        Cells are closed on both sides, so a box touching a cell boundary maps to the cells on both sides of it,
+        which keeps touching obstacles and steps detected like in BoundingBox.intersects_with.
+        """
+        columns = range(math.floor(min_x / self.__cell_size), math.floor(max_x / self.__cell_size) + 1)
+        rows = range(math.floor(min_y / self.__cell_size), math.floor(max_y / self.__cell_size) + 1)
+        return columns, rows
+
+    def insert(self, name: str, obstacle: Obstacle) -> None:
+        """
+        Adds an obstacle to the index.
+
+        Parameters
+        ----------
+        name : str
+            the name of the obstacle
+        obstacle : Obstacle
+            the obstacle to be added
+        """
+        self.__obstacles[name] = obstacle
+        self.__order[name] = self.__next_order
+        self.__next_order += 1
+
+        columns, rows = self.__cell_range(*obstacle.bounds.bounds())
+        if len(columns) * len(rows) > self.__max_cells_per_obstacle:
+            self.__oversized.add(name)
+            return
+        for column in columns:
+            for row in rows:
+                self.__cells.setdefault((column, row), set()).add(name)
+
+    def remove(self, name: str) -> None:
+        """
+        Removes an obstacle from the index.
+
+        Parameters
+        ----------
+        name : str
+            the name of the obstacle to be removed
+        """
+        obstacle = self.__obstacles.pop(name, None)
+        if obstacle is None:
+            return
+        del self.__order[name]
+
+        if name in self.__oversized:
+            self.__oversized.discard(name)
+            return
+        columns, rows = self.__cell_range(*obstacle.bounds.bounds())
+        for column in columns:
+            for row in rows:
+                cell = self.__cells.get((column, row))
+                if cell is not None:
+                    cell.discard(name)
+                    if not cell:
+                        del self.__cells[(column, row)]
+
+    def query_box(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[Obstacle]:
+        """
+        Returns the obstacles that may overlap an axis-aligned box.
+
+        The candidates still have to be tested exactly, they are returned in the order they were inserted so that
+        the first match is the same as when testing every obstacle.
+
+        Parameters
+        ----------
+        min_x : float
+            the minimum x-coordinate of the box
+        min_y : float
+            the minimum y-coordinate of the box
+        max_x : float
+            the maximum x-coordinate of the box
+        max_y : float
+            the maximum y-coordinate of the box
+
+        Returns
+        -------
+        list
+            the candidate obstacles, in insertion order
+        """
+        if not self.__obstacles:
+            return []
+
+        columns, rows = self.__cell_range(min_x, min_y, max_x, max_y)
+        if len(columns) * len(rows) > len(self.__cells):
+            # The box covers more cells than there are non-empty ones, every obstacle is a candidate anyway
+            return list(self.__obstacles.values())
+
+        names = set(self.__oversized)
+        for column in columns:
+            for row in rows:
+                cell = self.__cells.get((column, row))
+                if cell:
+                    names.update(cell)
+        return [self.__obstacles[name] for name in sorted(names, key=self.__order.__getitem__)]
+
+    def query_segment(self, start: Tuple[float, ...], end: Tuple[float, ...]) -> List[Obstacle]:
+        """
+        Returns the obstacles that may intersect the segment of a step.
+
+        Parameters
+        ----------
+        start : tuple
+            the start point of the segment
+        end : tuple
+            the end point of the segment
+
+        Returns
+        -------
+        list
+            the candidate obstacles, in insertion order
+        """
+        return self.query_box(min(start[X], end[X]), min(start[Y], end[Y]),
+                              max(start[X], end[X]), max(start[Y], end[Y]))
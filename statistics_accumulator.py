@@ -0,0 +1,527 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+
+class StatisticsAccumulator:
+    """
+    A class used to accumulate the statistics of many simulations without retaining their trajectories.
+
+    It is written into like a TrajectoryStore, but only keeps running sums over the simulations: the absolute
+    locations and the y-axis crossing counts after every step, the escape and first-passage steps and the number of
+    simulations without them, and the number of steps each walker led the race. Its memory is O(walkers x steps)
+    however many simulations are added. The locations of the first simulation are kept so it can still be plotted.
+
+    Accumulators of disjoint sets of simulations, such as the shards of a run split across processes or machines,
+    are combined with merge, which is associative: merging the shards in simulation order gives the accumulator of
+    the whole run. The counts and integer sums are exact. The location sums are compensated: the rounding error of
+    every addition is kept in a second array and carried through merge, to_dict and from_dict, so they are accurate to
+    about 2 ** -100 of their magnitude instead of losing a bit every few additions, and the float64 they round to does
+    not depend on how the simulations were split into blocks and shards or on the order they were merged in. to_dict
+    and from_dict convert an accumulator to and from a JSON-serializable dictionary.
+
+    ...
+
+    Attributes
+    ----------
+    __walker_names : list
+        the names of the walkers, in the order of the first axis of the sums
+    __num_steps : int
+        the number of steps of every simulation
+    __num_simulations : int
+        the number of simulations added so far
+    __location_sums : np.ndarray
+        the sum over the simulations of the absolute locations of every walker after every step, rounded to float64
+    __location_errors : np.ndarray
+        the rounding errors of the location sums, which added to them give their compensated value
+    __passed_y_sums : np.ndarray
+        the sum over the simulations of the number of times every walker passed the y-axis up to every step
+    __escape_totals : np.ndarray
+        the sum over the simulations in which every walker escaped a radius of 10 units of its escape step
+    __zero_counts : np.ndarray
+        the number of simulations in which every walker did not escape a radius of 10 units
+    __lead_counts : np.ndarray
+        the number of steps of all simulations at which every walker was the furthest from the origin
+    __first_passage_thresholds : list
+        the thresholds whose first-passage steps are accumulated
+    __first_passage_totals : np.ndarray
+        the sum over the simulations in which every walker passed every threshold of its first-passage step
+    __first_passage_zero_counts : np.ndarray
+        the number of simulations in which every walker did not pass every threshold
+    __first_locations : np.ndarray
+        the locations of every walker after every step of the first simulation
+    __pending_distances : np.ndarray
+        the distances from the origin of the last allocated simulations, until the leads of all walkers are counted
+
+    Methods
+    -------
+    compensated_sum(values):
+        Returns the compensated sum of an array over its first axis and its rounding error.
+    add_compensated(sums, errors, other_sums, other_errors):
+        Adds two compensated sums.
+    allocate(simulation_names):
+        Adds simulations and returns the slot of the first one.
+    write(walker_index, slot, locations, escape_step, passed_y, first_passage_steps):
+        Adds the results of a walker in one simulation.
+    write_block(walker_index, first_slot, locations, escape_steps, passed_y, first_passage_steps):
+        Adds the results of a walker in a block of consecutive simulations.
+    merge(other):
+        Adds the sums of another accumulator, whose simulations follow the ones of this accumulator.
+    to_dict():
+        Returns the sums as a JSON-serializable dictionary.
+    from_dict(data):
+        Creates an accumulator from a dictionary returned by to_dict.
+    """
+
+    def __init__(self, walker_names: Sequence[str], num_steps: int, first_passage_thresholds: Sequence[str] = ()):
+        """
+        Constructs all the necessary attributes for the StatisticsAccumulator object.
+
+        Parameters
+        ----------
+        walker_names : Sequence[str]
+            the names of the walkers
+        num_steps : int
+            the number of steps of every simulation
+        first_passage_thresholds : Sequence[str], optional
+            the thresholds whose first-passage steps are accumulated (default is none)
+        """
+        self.__walker_names = list(walker_names)
+        self.__num_steps = num_steps
+        self.__num_simulations = 0
+        num_walkers = len(self.__walker_names)
+        self.__location_sums = np.zeros((num_walkers, num_steps, 3))
+        self.__location_errors = np.zeros((num_walkers, num_steps, 3))
+        self.__passed_y_sums = np.zeros((num_walkers, num_steps), dtype=np.int64)
+        self.__escape_totals = np.zeros(num_walkers, dtype=np.int64)
+        self.__zero_counts = np.zeros(num_walkers, dtype=np.int64)
+        self.__lead_counts = np.zeros(num_walkers, dtype=np.int64)
+        self.__first_locations = np.zeros((num_walkers, num_steps, 3))
+        self.__first_passage_thresholds = list(first_passage_thresholds)
+        self.__first_passage_totals = np.zeros((num_walkers, len(self.__first_passage_thresholds)), dtype=np.int64)
+        self.__first_passage_zero_counts = np.zeros_like(self.__first_passage_totals)
+        self.__pending_distances: Optional[np.ndarray] = None
+        self.__pending_first_slot = 0
+
+    def __len__(self) -> int:
+        return self.__num_simulations
+
+    @property
+    def walker_names(self) -> List[str]:
+        """
+        Returns the names of the walkers, in the order of the first axis of the sums.
+
+        Returns
+        -------
+        list
+            the names of the walkers
+        """
+        return self.__walker_names
+
+    @property
+    def num_steps(self) -> int:
+        """
+        Returns the number of steps of every simulation.
+
+        Returns
+        -------
+        int
+            the number of steps of every simulation
+        """
+        return self.__num_steps
+
+    @property
+    def location_sums(self) -> np.ndarray:
+        """
+        Returns the sums of the absolute locations after every step.
+
+        Returns
+        -------
+        np.ndarray
+            an array of shape (walkers, steps, 3)
+        """
+        return self.__location_sums
+
+    @property
+    def location_errors(self) -> np.ndarray:
+        """
+        Returns the rounding errors of the sums of the absolute locations, to be added to them.
+
+        Returns
+        -------
+        np.ndarray
+            an array of shape (walkers, steps, 3)
+        """
+        return self.__location_errors
+
+    @property
+    def passed_y_sums(self) -> np.ndarray:
+        """
+        Returns the sums of the running counts of y-axis crossings after every step.
+
+        Returns
+        -------
+        np.ndarray
+            an array of shape (walkers, steps)
+        """
+        return self.__passed_y_sums
+
+    @property
+    def escape_totals(self) -> np.ndarray:
+        """
+        Returns the sums of the escape steps of the simulations in which the walkers escaped.
+
+        Returns
+        -------
+        np.ndarray
+            an array of shape (walkers,)
+        """
+        return self.__escape_totals
+
+    @property
+    def zero_counts(self) -> np.ndarray:
+        """
+        Returns the number of simulations in which the walkers did not escape.
+
+        Returns
+        -------
+        np.ndarray
+            an array of shape (walkers,)
+        """
+        return self.__zero_counts
+
+    @property
+    def lead_counts(self) -> np.ndarray:
+        """
+        Returns the number of steps of all simulations at which the walkers led the race.
+
+        Returns
+        -------
+        np.ndarray
+            an array of shape (walkers,)
+        """
+        self.__count_pending_leads()
+        return self.__lead_counts
+
+    @property
+    def first_locations(self) -> np.ndarray:
+        """
+        Returns the locations of the walkers in the first simulation.
+
+        Returns
+        -------
+        np.ndarray
+            an array of shape (walkers, steps, 3)
+        """
+        return self.__first_locations
+
+    @property
+    def first_passage_thresholds(self) -> List[str]:
+        """
+        Returns the thresholds whose first-passage steps are accumulated.
+
+        Returns
+        -------
+        list
+            the thresholds, such as "r>15" or "x>5"
+        """
+        return self.__first_passage_thresholds
+
+    @property
+    def first_passage_totals(self) -> np.ndarray:
+        """
+        Returns the sums of the first-passage steps of the simulations in which the walkers passed the thresholds.
+
+        Returns
+        -------
+        np.ndarray
+            an array of shape (walkers, thresholds)
+        """
+        return self.__first_passage_totals
+
+    @property
+    def first_passage_zero_counts(self) -> np.ndarray:
+        """
+        Returns the number of simulations in which the walkers did not pass the thresholds.
+
+        Returns
+        -------
+        np.ndarray
+            an array of shape (walkers, thresholds)
+        """
+        return self.__first_passage_zero_counts
+
+    def walker_index(self, walker_name: str) -> int:
+        """
+        Returns the position of a walker on the first axis of the sums.
+
+        Parameters
+        ----------
+        walker_name : str
+            the name of the walker
+
+        Returns
+        -------
+        int
+            the index of the walker
+        """
+        return self.__walker_names.index(walker_name)
+
+    @staticmethod
+    def compensated_sum(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sums an array over its first axis pairwise, keeping the rounding error of every addition.
+
+        Parameters
+        ----------
+        values : np.ndarray
+            the array to be summed
+
+        Returns
+        -------
+        tuple
+            the sum rounded to float64 and its rounding error, both of the shape of an element of the first axis
+        """
+        values = np.asarray(values, dtype=np.float64)
+        errors = np.zeros(values.shape[1:])
+        if not len(values):
+            return errors.copy(), errors
+        while len(values) > 1:
+            paired = len(values) // 2 * 2
+            sums, pair_errors = StatisticsAccumulator.__two_sum(values[0:paired:2], values[1:paired:2])
+            errors += pair_errors.sum(axis=0)
+            values = np.concatenate((sums, values[paired:]))
+        return StatisticsAccumulator.__two_sum(values[0], errors)
+
+    @staticmethod
+    def add_compensated(sums: np.ndarray, errors: np.ndarray, other_sums: np.ndarray,
+                        other_errors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Adds two compensated sums, such as the ones returned by compensated_sum.
+
+        Parameters
+        ----------
+        sums : np.ndarray
+            the first sums, rounded to float64
+        errors : np.ndarray
+            the rounding errors of the first sums
+        other_sums : np.ndarray
+            the second sums, rounded to float64
+        other_errors : np.ndarray
+            the rounding errors of the second sums
+
+        Returns
+        -------
+        tuple
+            the total rounded to float64 and its rounding error
+        """
+        sums, sum_errors = StatisticsAccumulator.__two_sum(sums, other_sums)
+        return StatisticsAccumulator.__two_sum(sums, sum_errors + (errors + other_errors))
+
+    @staticmethod
+    def __two_sum(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the float64 sum of two arrays and its exact rounding error, by Knuth's TwoSum.
+        """
+        total = a + b
+        b_virtual = total - a
+        return total, (a - (total - b_virtual)) + (b - b_virtual)
+
+    def __add_locations(self, walker_index: int, sums: np.ndarray, errors: np.ndarray) -> None:
+        """
+        Adds compensated sums of absolute locations to the ones of a walker.
+        """
+        self.__location_sums[walker_index], self.__location_errors[walker_index] = self.add_compensated(
+            self.__location_sums[walker_index], self.__location_errors[walker_index], sums, errors)
+
+    def __count_pending_leads(self) -> None:
+        """
+        Counts the leads of the last allocated simulations, once the results of every walker were added.
+        """
+        if self.__pending_distances is None:
+            return
+        leaders = np.argmax(self.__pending_distances, axis=0)
+        self.__lead_counts += np.bincount(leaders.ravel(), minlength=len(self.__walker_names))
+        self.__pending_distances = None
+
+    def allocate(self, simulation_names: Sequence[str]) -> int:
+        """
+        Adds simulations, whose results are then written by walker.
+
+        Parameters
+        ----------
+        simulation_names : Sequence[str]
+            the names of the simulations to be added
+
+        Returns
+        -------
+        int
+            the slot of the first added simulation, the others follow it
+        """
+        self.__count_pending_leads()
+        first_slot = self.__num_simulations
+        self.__num_simulations += len(simulation_names)
+        self.__pending_first_slot = first_slot
+        self.__pending_distances = np.zeros((len(self.__walker_names), len(simulation_names), self.__num_steps))
+        return first_slot
+
+    def write(self, walker_index: int, slot: int, locations: Sequence[Sequence[float]], escape_step: int,
+              passed_y: Sequence[int], first_passage_steps: Optional[Sequence[int]] = None) -> None:
+        """
+        Adds the results of a walker in one simulation.
+
+        A walker stopped early because it had no valid move stays at its last location, and keeps its count of
+        y-axis crossings, for the remaining steps.
+
+        Parameters
+        ----------
+        walker_index : int
+            the index of the walker
+        slot : int
+            the slot of the simulation
+        locations : Sequence
+            the locations of the walker after each step it took
+        escape_step : int
+            the step at which the walker escaped a radius of 10 units, 0 if it did not
+        passed_y : Sequence[int]
+            the number of times the walker passed the y-axis up to each step it took
+        first_passage_steps : Sequence[int], optional
+            the step at which the walker first passed each threshold, 0 if it did not (default is none passed)
+        """
+        num_taken = len(locations)
+        padded_locations = np.zeros((self.__num_steps, 3))
+        padded_passed_y = np.zeros(self.__num_steps, dtype=np.int64)
+        passages = np.zeros(len(self.__first_passage_thresholds), dtype=np.int64)
+        if num_taken:
+            padded_locations[:num_taken] = locations
+            padded_locations[num_taken:] = padded_locations[num_taken - 1]
+            padded_passed_y[:num_taken] = passed_y
+            padded_passed_y[num_taken:] = padded_passed_y[num_taken - 1]
+            if first_passage_steps is not None:
+                passages[:] = first_passage_steps
+        self.write_block(walker_index, slot, padded_locations[np.newaxis], np.array([escape_step]),
+                         padded_passed_y[np.newaxis], passages[np.newaxis])
+
+    def write_block(self, walker_index: int, first_slot: int, locations: np.ndarray, escape_steps: np.ndarray,
+                    passed_y: np.ndarray, first_passage_steps: Optional[np.ndarray] = None) -> None:
+        """
+        Adds the results of a walker in a block of consecutive simulations, as produced by the vectorized engines.
+
+        Parameters
+        ----------
+        walker_index : int
+            the index of the walker
+        first_slot : int
+            the slot of the first simulation of the block, which must be among the last allocated simulations
+        locations : np.ndarray
+            the locations of shape (simulations, steps, 3) of the walker
+        escape_steps : np.ndarray
+            the escape steps of shape (simulations,) of the walker
+        passed_y : np.ndarray
+            the running counts of y-axis crossings of shape (simulations, steps) of the walker
+        first_passage_steps : np.ndarray, optional
+            the first-passage steps of shape (simulations, thresholds) of the walker (default is none passed)
+        """
+        self.__add_locations(walker_index, *self.compensated_sum(np.abs(locations)))
+        self.__passed_y_sums[walker_index] += passed_y.sum(axis=0)
+        self.__escape_totals[walker_index] += int(escape_steps.sum(dtype=np.int64))
+        self.__zero_counts[walker_index] += int(np.count_nonzero(escape_steps == 0))
+        if first_passage_steps is None:
+            self.__first_passage_zero_counts[walker_index] += len(locations)
+        else:
+            self.__first_passage_totals[walker_index] += first_passage_steps.sum(axis=0, dtype=np.int64)
+            self.__first_passage_zero_counts[walker_index] += np.count_nonzero(first_passage_steps == 0, axis=0)
+        if first_slot == 0:
+            self.__first_locations[walker_index] = locations[0]
+
+        offset = first_slot - self.__pending_first_slot
+        self.__pending_distances[walker_index, offset:offset + len(locations)] = np.linalg.norm(locations, axis=-1)
+
+    def merge(self, other: 'StatisticsAccumulator') -> None:
+        """
+        Adds the sums of another accumulator, whose simulations follow the ones of this accumulator.
+
+        Parameters
+        ----------
+        other : StatisticsAccumulator
+            the accumulator to be merged, with the same walkers, number of steps and first-passage thresholds
+
+        Raises
+        ------
+        ValueError
+            if the other accumulator has different walkers, number of steps or first-passage thresholds
+        """
+        if not len(other):
+            return
+        if sorted(other.walker_names) != sorted(self.__walker_names) or other.num_steps != self.__num_steps or \
+                other.first_passage_thresholds != self.__first_passage_thresholds:
+            raise ValueError("Only accumulators of the same walkers, number of steps and first-passage thresholds "
+                             "can be merged")
+
+        self.__count_pending_leads()
+        other_lead_counts = other.lead_counts
+        for other_index, walker_name in enumerate(other.walker_names):
+            walker_index = self.walker_index(walker_name)
+            self.__add_locations(walker_index, other.location_sums[other_index], other.location_errors[other_index])
+            self.__passed_y_sums[walker_index] += other.passed_y_sums[other_index]
+            self.__escape_totals[walker_index] += other.escape_totals[other_index]
+            self.__zero_counts[walker_index] += other.zero_counts[other_index]
+            self.__lead_counts[walker_index] += other_lead_counts[other_index]
+            self.__first_passage_totals[walker_index] += other.first_passage_totals[other_index]
+            self.__first_passage_zero_counts[walker_index] += other.first_passage_zero_counts[other_index]
+            if not self.__num_simulations:
+                self.__first_locations[walker_index] = other.first_locations[other_index]
+        self.__num_simulations += len(other)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the sums as a JSON-serializable dictionary.
+
+        Returns
+        -------
+        dict
+            a dictionary of the walker names, the number of steps and simulations and the sums as nested lists
+        """
+        return {
+            'walker_names': list(self.__walker_names),
+            'num_steps': self.__num_steps,
+            'num_simulations': self.__num_simulations,
+            'location_sums': self.__location_sums.tolist(),
+            'location_errors': self.__location_errors.tolist(),
+            'passed_y_sums': self.__passed_y_sums.tolist(),
+            'escape_totals': self.__escape_totals.tolist(),
+            'zero_counts': self.__zero_counts.tolist(),
+            'lead_counts': self.lead_counts.tolist(),
+            'first_locations': self.__first_locations.tolist(),
+            'first_passage_thresholds': list(self.__first_passage_thresholds),
+            'first_passage_totals': self.__first_passage_totals.tolist(),
+            'first_passage_zero_counts': self.__first_passage_zero_counts.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'StatisticsAccumulator':
+        """
+        Creates an accumulator from a dictionary returned by to_dict.
+
+        Parameters
+        ----------
+        data : dict
+            the dictionary of the sums
+
+        Returns
+        -------
+        StatisticsAccumulator
+            an accumulator with the sums of the dictionary
+        """
+        accumulator = cls(data['walker_names'], data['num_steps'], data.get('first_passage_thresholds', ()))
+        accumulator.__num_simulations = data['num_simulations']
+        accumulator.__location_sums[...] = data['location_sums']
+        accumulator.__location_errors[...] = data.get('location_errors', 0.0)
+        accumulator.__passed_y_sums[...] = data['passed_y_sums']
+        accumulator.__escape_totals[...] = data['escape_totals']
+        accumulator.__zero_counts[...] = data['zero_counts']
+        accumulator.__lead_counts[...] = data['lead_counts']
+        accumulator.__first_locations[...] = data['first_locations']
+        if accumulator.__first_passage_thresholds:
+            accumulator.__first_passage_totals[...] = data['first_passage_totals']
+            accumulator.__first_passage_zero_counts[...] = data['first_passage_zero_counts']
+        return accumulator
@@ -2,8 +2,6 @@ import os
 import json
 from typing import Any, Dict
 
-from utils import MessageUtils
-
 
 class StatisticsExporter:
     """
@@ -43,7 +41,7 @@ class StatisticsExporter:
         """
         self.data[key] = value
 
-    def save_to_json(self, filepath: str):
+    def save_to_json(self, filepath: str) -> str:
         """
         Saves the data dictionary to a JSON file.
 
@@ -51,6 +49,16 @@ class StatisticsExporter:
         ----------
         filepath : str
             the path of the directory or 'stats.json'
+
+        Returns
+        -------
+        str
+            the path the statistics were saved to
+
+        Raises
+        ------
+        OSError
+            if the file cannot be written, for the caller to report, in a dialog or on the console
         """
 
         base_filename = 'stats'
@@ -73,11 +81,8 @@ class StatisticsExporter:
                 counter += 1
             filepath = os.path.join(directory, filename)
 
-        # Try to open the file and dump the data into it
-        try:
-            with open(filepath, 'w') as f:
-                json.dump(self.data, f, indent=4)
-        except OSError as e:
-            MessageUtils.show_error('Error',
-                                    f"Error: Cannot save the statistics json file to {filepath}. {e.strerror}. Please enter a valid path.")
+        # Open the file and dump the data into it
+        with open(filepath, 'w') as f:
+            json.dump(self.data, f, indent=4)
+        return filepath
 
@@ -0,0 +1,115 @@
+from typing import Sequence, Tuple
+import re
+import numpy as np
+
+# A first-passage threshold: a quantity (r for the distance from the origin, or a coordinate), a direction and a value
+THRESHOLD_PATTERN = re.compile(r'^\s*([rxyz])\s*([<>])\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*$')
+COORDINATES = {'x': 0, 'y': 1, 'z': 2}
+
+
+class TrajectoryMetrics:
+    """
+    Vectorized helpers that derive the per-walker simulation metrics from whole trajectories.
+
+    All methods accept arrays whose last axes are (steps, 3) or (steps,) so they work the same way on a single
+    trajectory and on a block of trajectories from many simulations.
+    """
+
+    @staticmethod
+    def escape_steps(locations: np.ndarray, radius: float,
+                     origin: Tuple[float, float, float] = (0, 0, 0)) -> np.ndarray:
+        """
+        Finds the first step at which a walker is further than a radius from the origin.
+
+        Args:
+            locations (np.ndarray): The positions after every step, of shape (..., steps, 3).
+            radius (float): The radius to escape.
+            origin (Tuple[float, float, float]): The center of the circle. Defaults to (0, 0, 0).
+
+        Returns:
+            np.ndarray: The 1-based step of the escape for every trajectory, or 0 if the walker never escaped.
+        """
+        squared_distances = np.sum(np.square(locations - np.asarray(origin, dtype=float)), axis=-1)
+        escaped = squared_distances > radius ** 2
+        # argmax returns the first True along the steps, which is only meaningful if there is one
+        return np.where(escaped.any(axis=-1), np.argmax(escaped, axis=-1) + 1, 0)
+
+    @staticmethod
+    def passed_y_counts(x_positions: np.ndarray) -> np.ndarray:
+        """
+        Counts how many times a walker crossed the y-axis up to every step.
+
+        A crossing happens when the sign of x differs from the sign of the last non-zero x, so steps landing exactly
+        on the y-axis neither count as a crossing nor reset the side the walker came from.
+
+        Args:
+            x_positions (np.ndarray): The x coordinate after every step, of shape (..., steps).
+
+        Returns:
+            np.ndarray: The cumulative number of crossings after every step, with the same shape as x_positions.
+        """
+        signs = np.sign(x_positions)
+        step_indices = np.arange(signs.shape[-1])
+        # Index of the last step with a non-zero x, carried forward over steps that land on the axis (-1 if none yet)
+        last_non_zero = np.maximum.accumulate(np.where(signs != 0, step_indices, -1), axis=-1)
+        carried_signs = np.take_along_axis(signs, np.maximum(last_non_zero, 0), axis=-1) * (last_non_zero >= 0)
+
+        # Compare every step with the side the walker was on before it, the walker starts on the axis
+        previous_signs = np.zeros_like(carried_signs)
+        previous_signs[..., 1:] = carried_signs[..., :-1]
+        crossings = signs * previous_signs < 0
+        return np.cumsum(crossings, axis=-1)
+
+    @staticmethod
+    def parse_threshold(threshold: str) -> Tuple[str, str, float]:
+        """
+        Parses a first-passage threshold such as "r>15" (further than 15 from the origin), "x>5" or "y<-3"
+        (the half-planes beyond an axis-aligned line).
+
+        Args:
+            threshold (str): The threshold, a quantity among r, x, y and z, then > or <, then a number.
+
+        Returns:
+            Tuple[str, str, float]: The quantity, the direction and the value of the threshold.
+
+        Raises:
+            ValueError: If the threshold is not of that form.
+        """
+        match = THRESHOLD_PATTERN.match(threshold)
+        if match is None:
+            raise ValueError(f"Invalid first-passage threshold {threshold!r}, expected e.g. 'r>15', 'x>5' or 'y<-3'")
+        quantity, direction, value = match.groups()
+        return quantity, direction, float(value)
+
+    @staticmethod
+    def first_passage_steps(locations: np.ndarray, thresholds: Sequence[str],
+                            origin: Tuple[float, float, float] = (0, 0, 0)) -> np.ndarray:
+        """
+        Finds the first step at which a walker passes each of several thresholds, in one pass over the trajectories.
+
+        The squared distances from the origin are computed once and shared by every radius threshold, which is
+        compared with the square of its radius.
+
+        Args:
+            locations (np.ndarray): The positions after every step, of shape (..., steps, 3).
+            thresholds (Sequence[str]): The thresholds, in the form accepted by parse_threshold.
+            origin (Tuple[float, float, float]): The center of the radius thresholds. Defaults to (0, 0, 0).
+
+        Returns:
+            np.ndarray: The 1-based step of the first passage for every trajectory and threshold, or 0 if the
+            walker never passed it, of shape (..., len(thresholds)).
+        """
+        first_passages = np.zeros(locations.shape[:-2] + (len(thresholds),), dtype=np.int64)
+        squared_distances = None
+        for threshold_index, threshold in enumerate(thresholds):
+            quantity, direction, value = TrajectoryMetrics.parse_threshold(threshold)
+            if quantity == 'r':
+                if squared_distances is None:
+                    squared_distances = np.sum(np.square(locations - np.asarray(origin, dtype=float)), axis=-1)
+                values, value = squared_distances, np.sign(value) * value ** 2
+            else:
+                values = locations[..., COORDINATES[quantity]]
+            passed = values > value if direction == '>' else values < value
+            # argmax returns the first True along the steps, which is only meaningful if there is one
+            first_passages[..., threshold_index] = np.where(passed.any(axis=-1), np.argmax(passed, axis=-1) + 1, 0)
+        return first_passages
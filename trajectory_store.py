@@ -0,0 +1,425 @@
+from typing import Any, Dict, List, Optional, Sequence
+import copy
+import os
+import shutil
+import tempfile
+import weakref
+import numpy as np
+
+
+class TrajectoryStore:
+    """
+    A class used to store the trajectories of the walkers of many simulations in preallocated arrays.
+
+    The locations of every walker in every simulation are kept in one contiguous float array of shape
+    (walkers, simulations, steps, 3), and the escape and y-axis crossing results in compact integer arrays, so a block
+    of simulations is written with a single copy and the statistics are computed over whole arrays. The capacity
+    grows geometrically when more simulations are added than were reserved. The first-passage steps of any further
+    thresholds, such as "r>15" or "x>5", are kept alongside the escape steps.
+
+    Given a directory, the arrays are memory-mapped .npy files in a temporary directory inside it instead, so the
+    size of a run is bounded by the disk rather than the memory and the page cache keeps the recently written
+    simulations in memory. The files are deleted with the store. Such a store is pickled as the paths of its files,
+    so a shard of it can be filled by another process in place.
+
+    ...
+
+    Attributes
+    ----------
+    __walker_names : list
+        the names of the walkers, in the order of the first axis of the arrays
+    __num_steps : int
+        the number of steps of every simulation
+    __simulation_names : list
+        the names of the stored simulations, in the order of the second axis of the arrays
+    __locations : np.ndarray
+        the locations of every walker after every step of every simulation
+    __escape_steps : np.ndarray
+        the step at which every walker escaped a radius of 10 units in every simulation, 0 if it did not
+    __passed_y : np.ndarray
+        the number of times every walker passed the y-axis up to every step of every simulation
+    __first_passage_thresholds : list
+        the thresholds whose first-passage steps are stored
+    __first_passage_steps : np.ndarray
+        the step at which every walker first passed every threshold in every simulation, 0 if it did not
+    __first_slot : int
+        the slot of the first simulation of the store in the arrays, past 0 for a shard of another store
+    __directory : str
+        the temporary directory of the files of the arrays, None if they are kept in memory
+    __generation : int
+        the number of times the files of the arrays were reallocated, which names the current ones
+
+    Methods
+    -------
+    reserve(capacity):
+        Makes room for a total number of simulations.
+    allocate(simulation_names):
+        Adds simulations to the store and returns the slot of the first one.
+    write(walker_index, slot, locations, escape_step, passed_y, first_passage_steps):
+        Writes the results of a walker in one simulation.
+    write_block(walker_index, first_slot, locations, escape_steps, passed_y, first_passage_steps):
+        Writes the results of a walker in a block of consecutive simulations.
+    shard(first_slot):
+        Returns a store writing into the same arrays from a slot on.
+    merge(other):
+        Appends the simulations of another store.
+    flush():
+        Writes the changes of the arrays to their files.
+    """
+
+    def __init__(self, walker_names: Sequence[str], num_steps: int, capacity: int = 0,
+                 first_passage_thresholds: Sequence[str] = (), directory: Optional[str] = None):
+        """
+        Constructs all the necessary attributes for the TrajectoryStore object.
+
+        Parameters
+        ----------
+        walker_names : Sequence[str]
+            the names of the walkers
+        num_steps : int
+            the number of steps of every simulation
+        capacity : int, optional
+            the number of simulations to allocate room for upfront (default is 0)
+        first_passage_thresholds : Sequence[str], optional
+            the thresholds whose first-passage steps are stored (default is none)
+        directory : str, optional
+            the directory to keep the arrays in as memory-mapped files, instead of in memory (default is None)
+        """
+        self.__walker_names = list(walker_names)
+        self.__num_steps = num_steps
+        self.__simulation_names: List[str] = []
+        self.__first_slot = 0
+        self.__directory = tempfile.mkdtemp(prefix='trajectories_', dir=directory) if directory is not None else None
+        self.__generation = 0
+        if self.__directory is not None:
+            # The files go with the store, or at the latest when the program exits
+            weakref.finalize(self, shutil.rmtree, self.__directory, True)
+        num_walkers = len(self.__walker_names)
+        self.__first_passage_thresholds = list(first_passage_thresholds)
+        self.__locations = self.__new_array('locations', (num_walkers, capacity, num_steps, 3), np.float64)
+        self.__escape_steps = self.__new_array('escape_steps', (num_walkers, capacity), np.int32)
+        self.__passed_y = self.__new_array('passed_y', (num_walkers, capacity, num_steps), np.int32)
+        self.__first_passage_steps = self.__new_array(
+            'first_passage_steps', (num_walkers, capacity, len(self.__first_passage_thresholds)), np.int32)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """
+        Returns the state to pickle, where the arrays kept in files are replaced by the paths of the files.
+        """
+        state = self.__dict__.copy()
+        files = {name: state.pop(name).filename for name, array in self.__dict__.items()
+                 if isinstance(array, np.memmap)}
+        return {**state, 'files': files}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """
+        Restores a pickled state, opening the files of the arrays again. The files stay owned by the original store.
+        """
+        files = state.pop('files')
+        self.__dict__.update(state)
+        for name, path in files.items():
+            setattr(self, name, np.lib.format.open_memmap(path, mode='r+'))
+
+    def __len__(self) -> int:
+        return len(self.__simulation_names)
+
+    @property
+    def directory(self) -> Optional[str]:
+        """
+        Returns the temporary directory of the files of the arrays.
+
+        Returns
+        -------
+        str or None
+            the directory of the files, None if the arrays are kept in memory
+        """
+        return self.__directory
+
+    @property
+    def walker_names(self) -> List[str]:
+        """
+        Returns the names of the walkers, in the order of the first axis of the arrays.
+
+        Returns
+        -------
+        list
+            the names of the walkers
+        """
+        return self.__walker_names
+
+    @property
+    def num_steps(self) -> int:
+        """
+        Returns the number of steps of every simulation.
+
+        Returns
+        -------
+        int
+            the number of steps of every simulation
+        """
+        return self.__num_steps
+
+    @property
+    def simulation_names(self) -> List[str]:
+        """
+        Returns the names of the stored simulations, in the order of the second axis of the arrays.
+
+        Returns
+        -------
+        list
+            the names of the stored simulations
+        """
+        return self.__simulation_names
+
+    @property
+    def locations(self) -> np.ndarray:
+        """
+        Returns the locations of the stored simulations.
+
+        Returns
+        -------
+        np.ndarray
+            a view of shape (walkers, simulations, steps, 3) of the locations after every step
+        """
+        return self.__locations[:, self.__first_slot:self.__first_slot + len(self)]
+
+    @property
+    def escape_steps(self) -> np.ndarray:
+        """
+        Returns the steps at which the walkers escaped a radius of 10 units in the stored simulations.
+
+        Returns
+        -------
+        np.ndarray
+            a view of shape (walkers, simulations) of the escape steps, 0 where a walker did not escape
+        """
+        return self.__escape_steps[:, self.__first_slot:self.__first_slot + len(self)]
+
+    @property
+    def passed_y(self) -> np.ndarray:
+        """
+        Returns the running counts of y-axis crossings of the stored simulations.
+
+        Returns
+        -------
+        np.ndarray
+            a view of shape (walkers, simulations, steps) of the number of crossings up to every step
+        """
+        return self.__passed_y[:, self.__first_slot:self.__first_slot + len(self)]
+
+    @property
+    def first_passage_thresholds(self) -> List[str]:
+        """
+        Returns the thresholds whose first-passage steps are stored.
+
+        Returns
+        -------
+        list
+            the thresholds, such as "r>15" or "x>5"
+        """
+        return self.__first_passage_thresholds
+
+    @property
+    def first_passage_steps(self) -> np.ndarray:
+        """
+        Returns the steps at which the walkers first passed the thresholds in the stored simulations.
+
+        Returns
+        -------
+        np.ndarray
+            a view of shape (walkers, simulations, thresholds) of the first-passage steps, 0 where a walker did not
+            pass a threshold
+        """
+        return self.__first_passage_steps[:, self.__first_slot:self.__first_slot + len(self)]
+
+    def walker_index(self, walker_name: str) -> int:
+        """
+        Returns the position of a walker on the first axis of the arrays.
+
+        Parameters
+        ----------
+        walker_name : str
+            the name of the walker
+
+        Returns
+        -------
+        int
+            the index of the walker
+        """
+        return self.__walker_names.index(walker_name)
+
+    def reserve(self, capacity: int) -> None:
+        """
+        Makes room for a total number of simulations, so that adding them does not reallocate the arrays.
+
+        Parameters
+        ----------
+        capacity : int
+            the total number of simulations to make room for
+        """
+        capacity += self.__first_slot
+        if capacity <= self.__locations.shape[1]:
+            return
+        if self.__first_slot:
+            raise ValueError("A shard of a store cannot grow past the capacity of the store")
+        self.__generation += 1
+        self.__locations = self.__grow('locations', self.__locations, capacity)
+        self.__escape_steps = self.__grow('escape_steps', self.__escape_steps, capacity)
+        self.__passed_y = self.__grow('passed_y', self.__passed_y, capacity)
+        self.__first_passage_steps = self.__grow('first_passage_steps', self.__first_passage_steps, capacity)
+
+    def __new_array(self, name: str, shape: tuple, dtype: type) -> np.ndarray:
+        """
+        Returns a zeroed array, memory-mapped to a file of the current generation if the store has a directory.
+        """
+        if self.__directory is None:
+            return np.zeros(shape, dtype=dtype)
+        path = os.path.join(self.__directory, f"{name}_{self.__generation}.npy")
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+    def __grow(self, name: str, array: np.ndarray, capacity: int) -> np.ndarray:
+        """
+        Returns a copy of an array with room for a number of simulations on its second axis, deleting the file of
+        the array if it had one.
+        """
+        grown = self.__new_array(name, (array.shape[0], capacity) + array.shape[2:], array.dtype)
+        grown[:, :len(self)] = array[:, :len(self)]
+        if isinstance(array, np.memmap):
+            os.remove(array.filename)
+        return grown
+
+    def allocate(self, simulation_names: Sequence[str]) -> int:
+        """
+        Adds simulations to the store, growing it geometrically if it is full.
+
+        Parameters
+        ----------
+        simulation_names : Sequence[str]
+            the names of the simulations to be added
+
+        Returns
+        -------
+        int
+            the slot of the first added simulation, the others follow it
+        """
+        first_slot = self.__first_slot + len(self)
+        required = len(self) + len(simulation_names)
+        if self.__first_slot + required > self.__locations.shape[1]:
+            self.reserve(max(required, 2 * self.__locations.shape[1]))
+        self.__simulation_names.extend(simulation_names)
+        return first_slot
+
+    def write(self, walker_index: int, slot: int, locations: Sequence[Sequence[float]], escape_step: int,
+              passed_y: Sequence[int], first_passage_steps: Optional[Sequence[int]] = None) -> None:
+        """
+        Writes the results of a walker in one simulation.
+
+        A walker stopped early because it had no valid move stays at its last location, and keeps its count of
+        y-axis crossings, for the remaining steps.
+
+        Parameters
+        ----------
+        walker_index : int
+            the index of the walker
+        slot : int
+            the slot of the simulation
+        locations : Sequence
+            the locations of the walker after each step it took
+        escape_step : int
+            the step at which the walker escaped a radius of 10 units, 0 if it did not
+        passed_y : Sequence[int]
+            the number of times the walker passed the y-axis up to each step it took
+        first_passage_steps : Sequence[int], optional
+            the step at which the walker first passed each threshold, 0 if it did not (default is none passed)
+        """
+        num_taken = len(locations)
+        slot_locations = self.__locations[walker_index, slot]
+        slot_passed_y = self.__passed_y[walker_index, slot]
+        if num_taken:
+            slot_locations[:num_taken] = locations
+            slot_locations[num_taken:] = slot_locations[num_taken - 1]
+            slot_passed_y[:num_taken] = passed_y
+            slot_passed_y[num_taken:] = slot_passed_y[num_taken - 1]
+        else:
+            slot_locations[:] = 0
+            slot_passed_y[:] = 0
+        self.__escape_steps[walker_index, slot] = escape_step
+        if num_taken and first_passage_steps is not None:
+            self.__first_passage_steps[walker_index, slot] = first_passage_steps
+        else:
+            self.__first_passage_steps[walker_index, slot] = 0
+
+    def write_block(self, walker_index: int, first_slot: int, locations: np.ndarray, escape_steps: np.ndarray,
+                    passed_y: np.ndarray, first_passage_steps: Optional[np.ndarray] = None) -> None:
+        """
+        Writes the results of a walker in a block of consecutive simulations, as produced by the vectorized engines.
+
+        Parameters
+        ----------
+        walker_index : int
+            the index of the walker
+        first_slot : int
+            the slot of the first simulation of the block
+        locations : np.ndarray
+            the locations of shape (simulations, steps, 3) of the walker
+        escape_steps : np.ndarray
+            the escape steps of shape (simulations,) of the walker
+        passed_y : np.ndarray
+            the running counts of y-axis crossings of shape (simulations, steps) of the walker
+        first_passage_steps : np.ndarray, optional
+            the first-passage steps of shape (simulations, thresholds) of the walker (default is none passed)
+        """
+        block = slice(first_slot, first_slot + len(locations))
+        self.__locations[walker_index, block] = locations
+        self.__escape_steps[walker_index, block] = escape_steps
+        self.__passed_y[walker_index, block] = passed_y
+        self.__first_passage_steps[walker_index, block] = first_passage_steps if first_passage_steps is not None else 0
+
+    def shard(self, first_slot: int) -> 'TrajectoryStore':
+        """
+        Returns an empty store writing into the arrays of this one from a slot on, so that a shard of simulations run
+        in another process is written in place and merges without a copy. The store must have a directory, and
+        enough capacity for the shard.
+
+        Parameters
+        ----------
+        first_slot : int
+            the slot of the first simulation of the shard, at or past the end of this store
+
+        Returns
+        -------
+        TrajectoryStore
+            the store of the shard, whose simulations are added with merge() once it is filled
+        """
+        shard = copy.copy(self)
+        shard.__simulation_names = []
+        shard.__first_slot = first_slot
+        return shard
+
+    def flush(self) -> None:
+        """
+        Writes the changes of the arrays kept in files to the files.
+        """
+        for array in (self.__locations, self.__escape_steps, self.__passed_y, self.__first_passage_steps):
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def merge(self, other: 'TrajectoryStore') -> None:
+        """
+        Appends the simulations of another store, such as one filled in another process. The simulations of a shard
+        of this store that follow its simulations are already in place and are only added.
+
+        Parameters
+        ----------
+        other : TrajectoryStore
+            the store to be merged, with the same walkers, number of steps and first-passage thresholds
+        """
+        if (self.__directory is not None and other.directory == self.__directory
+                and other.__generation == self.__generation and other.__first_slot == self.__first_slot + len(self)):
+            self.allocate(other.simulation_names)
+            return
+        first_slot = self.allocate(other.simulation_names)
+        for walker_index, walker_name in enumerate(other.walker_names):
+            self.write_block(self.walker_index(walker_name), first_slot, other.locations[walker_index],
+                             other.escape_steps[walker_index], other.passed_y[walker_index],
+                             other.first_passage_steps[walker_index])
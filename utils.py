@@ -1,4 +1,3 @@
-from tkinter import messagebox
 import subprocess
 
 
@@ -36,6 +35,7 @@ class MessageUtils:
             title (str): The title of the message box.
             message (str): The message to display.
         """
+        from tkinter import messagebox  # Imported here so that headless runs do not need tkinter
         messagebox.showinfo(title, message)
 
     @staticmethod
@@ -47,6 +47,7 @@ class MessageUtils:
             title (str): The title of the message box.
             message (str): The message to display.
         """
+        from tkinter import messagebox
         messagebox.showerror(title, message)
 
 